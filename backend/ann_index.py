@@ -0,0 +1,845 @@
+"""
+ANN Index Module for LawGPT
+Per-user persistent IVF (inverted file) index over message embeddings, used for
+semantic search across all of a user's chat sessions.
+"""
+
+import json
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from metrics import get_logger
+
+logger = get_logger("lawgpt.ann_index")
+
+# Only a snippet is kept per message; the full text stays in MongoDB
+SNIPPET_CHARS = 500
+
+# How inverted lists store vectors: float32, int8 with a per-vector scale, or sign bits
+QUANTIZATIONS = ("none", "int8", "binary")
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return _POPCOUNT[x]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors; returns unit-norm centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters from random points
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _hamming(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Hamming distance from each row of packed sign bits to the query's"""
+    diff = codes ^ query_bits
+    if _popcount is np.bitwise_count and diff.shape[1] % 8 == 0:
+        diff = diff.view(np.uint64)
+    return _popcount(diff).sum(axis=1, dtype=np.int32)
+
+
+def _grown(values: np.ndarray, size: int, capacity: int) -> np.ndarray:
+    grown = np.empty((capacity,) + values.shape[1:], dtype=values.dtype)
+    grown[:size] = values[:size]
+    return grown
+
+
+class _GrowableList:
+    """One inverted list: contiguous vectors (or their codes) and row ids with amortized growth"""
+
+    __slots__ = ("vectors", "scales", "ids", "size")
+
+    def __init__(self, width: int, capacity: int = 16, dtype=np.float32, scaled: bool = False):
+        self.vectors = np.empty((capacity, width), dtype=dtype)
+        self.scales = np.empty(capacity, dtype=np.float32) if scaled else None
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def extend(self, vectors: np.ndarray, ids: np.ndarray, scales: Optional[np.ndarray] = None):
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids))
+            self.vectors = _grown(self.vectors, self.size, capacity)
+            if self.scales is not None:
+                self.scales = _grown(self.scales, self.size, capacity)
+            self.ids = _grown(self.ids, self.size, capacity)
+        self.vectors[self.size:needed] = vectors
+        if self.scales is not None:
+            self.scales[self.size:needed] = scales
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+
+class _VectorFile:
+    """
+    Full-precision vectors of a quantized index, by row id: a flat float32
+    file read through a memory map, so only the pages of rows actually
+    rescored are resident.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._map: Optional[np.memmap] = None
+
+    def write(self, vectors: np.ndarray, start: int):
+        """Write rows from row `start` on, dropping any after them (left behind by an index never flushed)"""
+        self._map = None
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "r+b" if os.path.exists(self.path) else "wb") as vector_file:
+            vector_file.seek(start * self.dim * 4)
+            vector_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            vector_file.truncate()
+
+    def array(self, count: int) -> np.ndarray:
+        """The first `count` rows, memory-mapped"""
+        if self._map is None or len(self._map) < count:
+            rows = os.path.getsize(self.path) // (self.dim * 4)
+            self._map = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._map[:count]
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        return np.asarray(self.array(int(ids.max()) + 1)[ids])
+
+    def close(self):
+        """Drop the memory map, e.g. after the file was replaced"""
+        self._map = None
+
+    def erase(self, ids: Iterable[int]):
+        """Overwrite rows with zeros in place"""
+        zeros = bytes(self.dim * 4)
+        with open(self.path, "r+b") as vector_file:
+            for row in ids:
+                vector_file.seek(int(row) * self.dim * 4)
+                vector_file.write(zeros)
+
+
+class _PendingVectors:
+    """
+    Append-only side file of the unit vectors added since the index was last
+    saved in full: an int64 header with the row id of the first vector, then
+    float32 rows. Loading replays them into the saved index.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+
+    def reset(self, start: int):
+        """Start an empty side file whose first row will be `start`"""
+        with open(self.path, "wb") as pending_file:
+            pending_file.write(np.int64(start).tobytes())
+
+    def append(self, vectors: np.ndarray):
+        with open(self.path, "ab") as pending_file:
+            pending_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def read(self):
+        """(first row id, vectors), or (None, no vectors) without a side file; a torn trailing row is dropped"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < 8:
+            return None, np.empty((0, self.dim), dtype=np.float32)
+        with open(self.path, "rb") as pending_file:
+            start = int(np.frombuffer(pending_file.read(8), dtype=np.int64)[0])
+            data = pending_file.read()
+        rows = len(data) // (self.dim * 4)
+        return start, np.frombuffer(data[:rows * self.dim * 4], dtype=np.float32).reshape(rows, self.dim)
+
+    def erase(self, ids: Iterable[int]):
+        """Overwrite rows (by row id) with zeros in place; rows from before the file's first row are skipped"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < 8:
+            return
+        zeros = bytes(self.dim * 4)
+        with open(self.path, "r+b") as pending_file:
+            start = int(np.frombuffer(pending_file.read(8), dtype=np.int64)[0])
+            for row in ids:
+                if row >= start:
+                    pending_file.seek(8 + (int(row) - start) * self.dim * 4)
+                    pending_file.write(zeros)
+
+
+class IVFIndex:
+    """
+    Inverted-file index with exact inner-product scoring inside probed lists.
+
+    Below `min_train_size` vectors the index is a flat (brute-force) list.
+    Once it grows past that, k-means builds ~sqrt(N) centroids and every
+    vector is stored contiguously in its nearest centroid's list, so a query
+    only scores the `nprobe` closest lists. The index retrains when it has
+    grown `retrain_factor` times since the last training.
+
+    With `quantization` "int8" (1 byte per dimension plus a scale) or
+    "binary" (1 bit per dimension), the lists hold codes instead of float32
+    vectors and the float32 vectors go to a memory-mapped file at
+    `vectors_path`. A query shortlists `k * rescore_factor` candidates on the
+    codes (int8 dot products, or Hamming distance between sign bits) and
+    ranks the shortlist by exact cosine similarity.
+    """
+
+    def __init__(self, dim: int, nprobe: int = 16, min_train_size: int = 4096, retrain_factor: float = 8.0,
+                 quantization: str = "none", vectors_path: Optional[str] = None, rescore_factor: int = 30):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}; expected one of {', '.join(QUANTIZATIONS)}")
+        if quantization != "none" and not vectors_path:
+            raise ValueError(f"{quantization} quantization needs a vectors_path for rescoring")
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.vector_file = _VectorFile(vectors_path, dim) if quantization != "none" else None
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self.lists: List[_GrowableList] = [self._new_list()]
+        self.count = 0
+
+    def _new_list(self, capacity: int = 16) -> _GrowableList:
+        if self.quantization == "binary":
+            return _GrowableList((self.dim + 7) // 8, capacity, dtype=np.uint8)
+        if self.quantization == "int8":
+            return _GrowableList(self.dim, capacity, dtype=np.int8, scaled=True)
+        return _GrowableList(self.dim, capacity)
+
+    def _encode(self, vectors: np.ndarray):
+        """List contents for unit vectors: (vectors or codes, per-vector scales or None)"""
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), None
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors, None
+
+    def _list_scores(self, lst: _GrowableList, query: np.ndarray, query_bits: Optional[np.ndarray]) -> np.ndarray:
+        """Similarity of the query to each vector of a list (approximate when quantized)"""
+        if self.quantization == "binary":
+            return -_hamming(lst.vectors[:lst.size], query_bits)
+        if self.quantization == "int8":
+            return (lst.vectors[:lst.size].astype(np.float32) @ query) * lst.scales[:lst.size]
+        return lst.vectors[:lst.size] @ query
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 8192):
+            block = vectors[start:start + 8192]
+            assignments[start:start + 8192] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def _all_vectors(self):
+        vectors = np.concatenate([lst.vectors[:lst.size] for lst in self.lists])
+        ids = np.concatenate([lst.ids[:lst.size] for lst in self.lists])
+        order = np.argsort(ids)
+        return vectors[order], ids[order]
+
+    def _live_ids(self) -> np.ndarray:
+        """Row ids held by the lists (removed rows leave gaps), sorted"""
+        return np.sort(np.concatenate([lst.ids[:lst.size] for lst in self.lists]))
+
+    def _chunks(self, ids: Optional[np.ndarray] = None, size: int = 65536):
+        """Full-precision vectors of the rows in the lists (or of `ids`), in row id order, as (vectors, ids) chunks"""
+        if self.vector_file is None:
+            vectors, ids = self._all_vectors()
+        else:
+            ids = self._live_ids() if ids is None else ids
+            vectors = self.vector_file.array(self.count) if len(ids) == self.count else None
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            if vectors is not None:
+                yield np.asarray(vectors[start:start + size]), chunk
+            else:
+                yield self.vector_file.rows(chunk), chunk
+
+    def train(self):
+        if self.vector_file is None:
+            vectors, ids = self._all_vectors()
+            chunks = [(vectors, ids)]
+        else:
+            vectors, ids = None, self._live_ids()
+            chunks = self._chunks(ids)
+        nlist = max(1, int(np.sqrt(len(ids))))
+        sample_size = min(len(ids), 40 * nlist)
+        picked = np.sort(np.random.default_rng(0).choice(len(ids), size=sample_size, replace=False))
+        sample = vectors[picked] if vectors is not None else self.vector_file.rows(ids[picked])
+        self.centroids = _kmeans(sample, nlist)
+        self.trained_size = self.count
+        self.lists = [self._new_list() for _ in range(nlist)]
+        for chunk_vectors, chunk_ids in chunks:
+            self._distribute(chunk_vectors, chunk_ids)
+        logger.info("🧭 Trained IVF index: %d vectors, %d lists", len(ids), nlist)
+
+    def _distribute(self, vectors: np.ndarray, ids: np.ndarray):
+        assignments = self._assign(vectors)
+        codes, scales = self._encode(vectors)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.lists) + 1))
+        for list_id in range(len(self.lists)):
+            lo, hi = bounds[list_id], bounds[list_id + 1]
+            if hi > lo:
+                rows = order[lo:hi]
+                self.lists[list_id].extend(codes[rows], ids[rows], scales[rows] if scales is not None else None)
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Add unit vectors; returns their row ids"""
+        vectors = _normalize(vectors)
+        ids = np.arange(self.count, self.count + len(vectors), dtype=np.int64)
+        if self.vector_file is not None:
+            self.vector_file.write(vectors, self.count)
+        self._distribute(vectors, ids)
+        self.count += len(vectors)
+
+        if self.centroids is None and self.count >= self.min_train_size:
+            self.train()
+        elif self.centroids is not None and self.count >= self.retrain_factor * self.trained_size:
+            self.train()
+        return ids
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None):
+        """
+        Returns:
+            (scores, ids) arrays sorted by descending cosine similarity
+        """
+        if self.count == 0:
+            return np.array([], dtype=np.float32), np.array([], dtype=np.int64)
+        query = _normalize(query)[0]
+        if self.centroids is None:
+            probed = [0]
+        else:
+            nprobe = min(nprobe or self.nprobe, len(self.lists))
+            centroid_scores = self.centroids @ query
+            probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        query_bits = np.packbits(query > 0) if self.quantization == "binary" else None
+        scores, ids = [], []
+        for list_id in probed:
+            lst = self.lists[list_id]
+            if lst.size:
+                scores.append(self._list_scores(lst, query, query_bits))
+                ids.append(lst.ids[:lst.size])
+        if not scores:
+            return np.array([], dtype=np.float32), np.array([], dtype=np.int64)
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+        k = min(k, len(scores))
+        if self.vector_file is not None:
+            # Shortlist on the codes, then rank the shortlist on the full-precision vectors
+            shortlist = min(len(scores), k * self.rescore_factor)
+            ids = ids[np.argpartition(-scores, shortlist - 1)[:shortlist]]
+            scores = self.vector_file.rows(ids) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], ids[top]
+
+    def _filter(self, keep):
+        """Keep only the list entries for which keep(ids) is True"""
+        for lst in self.lists:
+            mask = keep(lst.ids[:lst.size])
+            if not mask.all():
+                kept = int(mask.sum())
+                lst.vectors[:kept] = lst.vectors[:lst.size][mask]
+                if lst.scales is not None:
+                    lst.scales[:kept] = lst.scales[:lst.size][mask]
+                lst.ids[:kept] = lst.ids[:lst.size][mask]
+                lst.size = kept
+
+    def remove(self, ids: Iterable[int]):
+        """
+        Take rows out of the lists, so search never scores them, and zero
+        their full-precision vectors. The other rows keep their row ids
+        until `compact`.
+        """
+        ids = np.fromiter(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        self._filter(lambda list_ids: ~np.isin(list_ids, ids))
+        if self.vector_file is not None:
+            self.vector_file.erase(ids[ids < self.count])
+
+    def compact(self, keep: np.ndarray, vectors_path: Optional[str] = None):
+        """
+        Drop the rows where the boolean mask `keep` is False and renumber the
+        rest from 0 in order. A quantized index copies the kept full-precision
+        vectors to `vectors_path`, which the caller moves over its vector file.
+        """
+        new_ids = np.cumsum(keep) - 1
+        self._filter(lambda list_ids: keep[list_ids])
+        for lst in self.lists:
+            lst.ids[:lst.size] = new_ids[lst.ids[:lst.size]]
+        if self.vector_file is not None:
+            kept_rows = _VectorFile(vectors_path, self.dim)
+            kept_rows.write(np.empty((0, self.dim), dtype=np.float32), 0)
+            row = 0
+            for vectors, _ in self._chunks(np.flatnonzero(keep)):
+                kept_rows.write(vectors, row)
+                row += len(vectors)
+        self.count = int(keep.sum())
+
+    def truncate(self, count: int):
+        """Drop rows from row id `count` on"""
+        self._filter(lambda list_ids: list_ids < count)
+        self.count = min(self.count, count)
+
+    def requantized(self, quantization: str, vectors_path: Optional[str] = None) -> "IVFIndex":
+        """The same index (centroids and list assignment) stored under another quantization"""
+        index = IVFIndex(self.dim, self.nprobe, self.min_train_size, self.retrain_factor,
+                         quantization=quantization, vectors_path=vectors_path, rescore_factor=self.rescore_factor)
+        index.centroids = self.centroids
+        index.trained_size = self.trained_size
+        index.lists = [index._new_list() for _ in self.lists]
+        reuse_file = self.vector_file is not None and index.vector_file is not None \
+            and os.path.abspath(self.vector_file.path) == os.path.abspath(index.vector_file.path)
+        for vectors, ids in self._chunks():
+            if index.vector_file is not None and not reuse_file:
+                # One write per run of consecutive row ids (removed rows leave gaps)
+                breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+                for run_vectors, run_ids in zip(np.split(vectors, breaks), np.split(ids, breaks)):
+                    index.vector_file.write(run_vectors, int(run_ids[0]))
+            index._distribute(vectors, ids)
+        index.count = self.count
+        return index
+
+    def save(self, path: str):
+        """Save the lists and centroids; a quantized index's vectors are already in its vector file"""
+        vectors = np.concatenate([lst.vectors[:lst.size] for lst in self.lists])
+        ids = np.concatenate([lst.ids[:lst.size] for lst in self.lists])
+        offsets = np.cumsum([0] + [lst.size for lst in self.lists])
+        extra = {}
+        if self.quantization == "int8":
+            extra["scales"] = np.concatenate([lst.scales[:lst.size] for lst in self.lists])
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=vectors, ids=ids, offsets=offsets,
+            centroids=self.centroids if self.centroids is not None else np.empty((0, self.dim), dtype=np.float32),
+            state=np.array([self.count, self.trained_size, self.nprobe], dtype=np.int64),
+            quantization=np.array(self.quantization),
+            **extra
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "IVFIndex":
+        """Load a saved index in the quantization it was saved with (pass vectors_path for quantized ones)"""
+        with np.load(path) as data:
+            vectors, ids, offsets = data["vectors"], data["ids"], data["offsets"]
+            scales = data["scales"] if "scales" in data.files else None
+            quantization = str(data["quantization"][()]) if "quantization" in data.files else "none"
+            count, trained_size, nprobe = (int(x) for x in data["state"])
+            index = cls(data["centroids"].shape[1], nprobe=kwargs.pop("nprobe", nprobe),
+                        quantization=quantization, **kwargs)
+            index.count = count
+            index.trained_size = trained_size
+            if len(data["centroids"]):
+                index.centroids = data["centroids"]
+            index.lists = []
+            for lo, hi in zip(offsets[:-1], offsets[1:]):
+                lst = index._new_list(capacity=max(16, int(hi - lo)))
+                lst.extend(vectors[lo:hi], ids[lo:hi], scales[lo:hi] if scales is not None else None)
+                index.lists.append(lst)
+        return index
+
+
+class UserHistoryIndex:
+    """
+    A user's IVF index plus the metadata of each indexed message. Metadata
+    stays in messages.jsonl; memory holds only each row's byte offset there
+    and the set of indexed message ids.
+
+    Vectors added since the last full save are appended to a side file as
+    they arrive, so a flush is cheap; the index is saved in full (and the
+    side file emptied) once the side file holds `compact_ratio` of the saved
+    rows, or after a retrain. Forgotten messages (deleted sessions, edited
+    turns) have their metadata line blanked in place, their vectors zeroed
+    and their rows taken out of the index's lists; compaction then drops
+    them for good and renumbers the remaining rows.
+    """
+
+    def __init__(self, directory: str, dim: int, nprobe: int, quantization: str = "none",
+                 rescore_factor: int = 30, compact_ratio: float = 0.25):
+        self.directory = directory
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.index_path = os.path.join(directory, "index.npz")
+        self.meta_path = os.path.join(directory, "messages.jsonl")
+        self.state_path = os.path.join(directory, "state.json")
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.pending = _PendingVectors(os.path.join(directory, "pending.f32"), dim)
+        self.compaction_path = os.path.join(directory, "compaction.json")
+        self.offsets = array("q")
+        self.message_ids = set()
+        self.forgotten = set()
+        self.bootstrapped = False
+        self.dirty = False
+        self.compact_pending = False
+        self.last_flush = 0.0
+
+        self._finish_compaction()
+        if os.path.exists(self.meta_path):
+            if os.path.exists(self.index_path):
+                self.index = IVFIndex.load(self.index_path, nprobe=nprobe, vectors_path=self.vectors_path,
+                                           rescore_factor=rescore_factor)
+            else:
+                # Never saved in full: everything is in the side file
+                self.index = IVFIndex(dim, nprobe=nprobe, quantization=quantization,
+                                      vectors_path=self.vectors_path, rescore_factor=rescore_factor)
+            self.saved_count = self.index.count
+            self.saved_trained_size = self.index.trained_size
+            if self.index.quantization != quantization:
+                logger.info("🧭 Converting history index %s from %s to %s quantization",
+                            directory, self.index.quantization, quantization)
+                self.index = self.index.requantized(quantization, self.vectors_path)
+                self.dirty = self.compact_pending = True
+            if os.path.exists(self.state_path):
+                with open(self.state_path) as state_file:
+                    self.bootstrapped = json.load(state_file).get("bootstrapped", False)
+            self._load_metadata()
+            if self.compact_pending:
+                self.flush(force=True)
+                if quantization == "none" and os.path.exists(self.vectors_path):
+                    os.remove(self.vectors_path)
+        else:
+            self.index = IVFIndex(dim, nprobe=nprobe, quantization=quantization,
+                                  vectors_path=self.vectors_path, rescore_factor=rescore_factor)
+            self.saved_count = self.saved_trained_size = 0
+            if os.path.exists(self.pending.path):
+                self.pending.reset(0)
+
+    def _load_metadata(self):
+        """
+        Read row offsets, replay the side file, and reconcile the three after
+        a crash: rows are kept only where both a vector and a metadata line
+        made it to disk.
+        """
+        offset, message_ids = 0, []
+        with open(self.meta_path, "rb") as meta_file:
+            for line in meta_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry.get("forgotten"):
+                        self.forgotten.add(len(self.offsets))
+                    self.offsets.append(offset)
+                    message_ids.append(entry.get("messageId"))
+                offset += len(line)
+
+        start, pending = self.pending.read()
+        if start is not None and start <= self.index.count < len(self.offsets):
+            replay = pending[self.index.count - start:len(self.offsets) - start]
+            if len(replay):
+                self.index.add(replay)
+
+        count = self.index.count
+        if len(self.offsets) < count:
+            # The index has rows whose metadata never reached disk
+            self.index.truncate(len(self.offsets))
+            self.dirty = self.compact_pending = True
+        elif len(self.offsets) > count:
+            # Metadata is appended before the index is flushed; drop rows the index lacks
+            os.truncate(self.meta_path, self.offsets[count])
+            del self.offsets[count:]
+        count = self.index.count
+        if not self.compact_pending:
+            if start is not None and start <= count:
+                # Vectors are appended before their metadata; drop any without it
+                os.truncate(self.pending.path, 8 + (count - start) * self.dim * 4)
+            else:
+                self.pending.reset(count)
+        self.message_ids = {message_id for message_id in message_ids[:count] if message_id}
+        self.forgotten = {row for row in self.forgotten if row < count}
+        if self.forgotten:
+            self.index.remove(self.forgotten)
+
+    def add(self, entries: List[Dict], embeddings: np.ndarray) -> int:
+        """Add messages not yet indexed; entries carry messageId/sessionId/sender/message/timestamp"""
+        keep = [i for i, e in enumerate(entries) if e.get("messageId") not in self.message_ids]
+        if not keep:
+            return 0
+        entries = [dict(entries[i], message=entries[i]["message"][:SNIPPET_CHARS]) for i in keep]
+        vectors = _normalize(np.asarray(embeddings)[keep])
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.pending.path):
+            self.pending.reset(self.index.count)
+        self.pending.append(vectors)
+        self.index.add(vectors)
+        with open(self.meta_path, "ab") as meta_file:
+            for entry in entries:
+                self.offsets.append(meta_file.tell())
+                meta_file.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.message_ids.update(e["messageId"] for e in entries if e.get("messageId"))
+        self.dirty = True
+        return len(entries)
+
+    def _needs_compaction(self) -> bool:
+        return (self.compact_pending or not os.path.exists(self.index_path)
+                or self.index.trained_size != self.saved_trained_size
+                or self.index.count - self.saved_count > self.compact_ratio * self.saved_count
+                or len(self.forgotten) > self.compact_ratio * self.index.count)
+
+    def _compaction_files(self) -> List[str]:
+        files = [self.index_path, self.meta_path, self.pending.path]
+        if self.index.vector_file is not None:
+            files.append(self.vectors_path)
+        return files
+
+    def _drop_forgotten(self):
+        """
+        Rewrite the index, messages.jsonl, the side file and (quantized) the
+        vector file without the forgotten rows, renumbered. Each new file is
+        written next to the old one as <name>.compact; once all are complete
+        compaction.json lists them and they are moved into place, so a crash
+        part way is finished (or, before compaction.json, discarded) on load.
+        """
+        keep = np.ones(self.index.count, dtype=bool)
+        keep[np.fromiter(self.forgotten, dtype=np.int64)] = False
+        self.index.compact(keep, self.vectors_path + ".compact")
+        offsets = array("q")
+        with open(self.meta_path, "rb") as meta_file, open(self.meta_path + ".compact", "wb") as kept_file:
+            for row in np.flatnonzero(keep):
+                meta_file.seek(self.offsets[row])
+                offsets.append(kept_file.tell())
+                kept_file.write(meta_file.readline())
+        self.index.save(self.index_path + ".compact")
+        _PendingVectors(self.pending.path + ".compact", self.dim).reset(self.index.count)
+        with open(self.compaction_path + ".tmp", "w") as marker_file:
+            json.dump({"files": [os.path.basename(path) for path in self._compaction_files()]}, marker_file)
+        os.replace(self.compaction_path + ".tmp", self.compaction_path)
+        self._finish_compaction()
+        if self.index.vector_file is not None:
+            self.index.vector_file.close()
+        logger.info("🧹 Dropped %d forgotten rows from history index %s", len(self.forgotten), self.directory)
+        self.offsets = offsets
+        self.forgotten = set()
+
+    def _finish_compaction(self):
+        """Move a completed compaction's files into place; discard an incomplete one's"""
+        if not os.path.isdir(self.directory):
+            return
+        if os.path.exists(self.compaction_path):
+            with open(self.compaction_path) as marker_file:
+                for name in json.load(marker_file)["files"]:
+                    path = os.path.join(self.directory, name)
+                    if os.path.exists(path + ".compact"):
+                        os.replace(path + ".compact", path)
+            os.remove(self.compaction_path)
+        for name in os.listdir(self.directory):
+            if name.endswith(".compact"):
+                os.remove(os.path.join(self.directory, name))
+
+    def flush(self, force: bool = False, min_interval: float = 0.0):
+        """Persist state; the index itself is rewritten only when compaction is due"""
+        if not self.dirty or (not force and time.monotonic() - self.last_flush < min_interval):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self._needs_compaction():
+            if self.forgotten:
+                self._drop_forgotten()
+            else:
+                self.index.save(self.index_path)
+                self.pending.reset(self.index.count)
+            self.saved_count = self.index.count
+            self.saved_trained_size = self.index.trained_size
+            self.compact_pending = False
+        with open(self.state_path, "w") as state_file:
+            json.dump({"bootstrapped": self.bootstrapped, "count": self.index.count}, state_file)
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+    def _rows(self):
+        """(row id, metadata) of every message not forgotten"""
+        with open(self.meta_path, "rb") as meta_file:
+            for row, offset in enumerate(self.offsets):
+                if row not in self.forgotten:
+                    meta_file.seek(offset)
+                    yield row, json.loads(meta_file.readline())
+
+    def forget(self, rows: Iterable[int]) -> int:
+        """
+        Remove messages from search: blank their metadata lines in place (the
+        offsets of later rows stay valid), zero their vectors and take them out
+        of the index. Copies in a saved index are dropped by the next flush.
+
+        Returns:
+            Number of rows forgotten
+        """
+        rows = sorted(set(rows) - self.forgotten)
+        if not rows:
+            return 0
+        with open(self.meta_path, "r+b") as meta_file:
+            for row in rows:
+                meta_file.seek(self.offsets[row])
+                line = meta_file.readline()
+                self.message_ids.discard(json.loads(line).get("messageId"))
+                meta_file.seek(self.offsets[row])
+                meta_file.write(b'{"forgotten": true}'.ljust(len(line) - 1) + b"\n")
+        self.pending.erase(rows)
+        self.index.remove(rows)
+        self.forgotten.update(rows)
+        if rows[0] < self.saved_count:
+            self.compact_pending = True
+        self.dirty = True
+        return len(rows)
+
+    def forget_session(self, session_id: str) -> int:
+        return self.forget(row for row, entry in list(self._rows()) if entry.get("sessionId") == str(session_id))
+
+    def forget_removed(self, session_id: str, messages: Iterable[Dict]) -> int:
+        """Forget a session's messages that are gone from `messages` or whose text has changed"""
+        texts = {str(msg.get("_id")): (msg.get("message") or "")[:SNIPPET_CHARS] for msg in messages}
+        return self.forget(
+            row for row, entry in list(self._rows())
+            if entry.get("sessionId") == str(session_id) and texts.get(entry.get("messageId")) != entry.get("message")
+        )
+
+    def search(self, query_embedding: np.ndarray, k: int, nprobe: Optional[int] = None) -> List[Dict]:
+        scores, ids = self.index.search(query_embedding, k=k, nprobe=nprobe)
+        results = []
+        if not len(ids):
+            return results
+        with open(self.meta_path, "rb") as meta_file:
+            for score, row in zip(scores, ids):
+                meta_file.seek(self.offsets[int(row)])
+                entry = json.loads(meta_file.readline())
+                entry["score"] = float(score)
+                results.append(entry)
+        return results
+
+
+class HistoryIndexManager:
+    """
+    Loads, caches and persists per-user history indexes under `base_dir`.
+
+    At most `max_loaded` user indexes stay in memory (LRU); evicted ones are
+    flushed to disk and reloaded on demand. Indexes saved under another
+    `quantization` are converted when loaded.
+    """
+
+    def __init__(self, base_dir: str, dim: int = 384, nprobe: int = 16,
+                 max_loaded: int = 32, flush_interval: float = 5.0,
+                 quantization: str = "none", rescore_factor: int = 30):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}; expected one of {', '.join(QUANTIZATIONS)}")
+        self.base_dir = base_dir
+        self.dim = dim
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.max_loaded = max_loaded
+        self.flush_interval = flush_interval
+        self._loaded: "OrderedDict[str, UserHistoryIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_dir(self, user_id: str) -> str:
+        safe = "".join(c for c in str(user_id) if c.isalnum() or c in "-_")
+        return os.path.join(self.base_dir, safe or "anonymous")
+
+    def get(self, user_id: str) -> UserHistoryIndex:
+        with self._lock:
+            index = self._loaded.get(user_id)
+            if index is not None:
+                self._loaded.move_to_end(user_id)
+                return index
+            index = UserHistoryIndex(self._user_dir(user_id), self.dim, self.nprobe,
+                                     self.quantization, self.rescore_factor)
+            self._loaded[user_id] = index
+            while len(self._loaded) > self.max_loaded:
+                _, evicted = self._loaded.popitem(last=False)
+                with evicted.lock:
+                    evicted.flush(force=True)
+            return index
+
+    def add_messages(self, user_id: str, entries: List[Dict], embeddings: np.ndarray) -> int:
+        index = self.get(user_id)
+        with index.lock:
+            added = index.add(entries, embeddings)
+            index.flush(min_interval=self.flush_interval)
+        return added
+
+    def unindexed(self, user_id: str, entries: List[Dict]) -> List[Dict]:
+        """Entries whose messageId is not in the user's index yet"""
+        index = self.get(user_id)
+        with index.lock:
+            return [e for e in entries if not e.get("messageId") or e["messageId"] not in index.message_ids]
+
+    def is_bootstrapped(self, user_id: str) -> bool:
+        return self.get(user_id).bootstrapped
+
+    def mark_bootstrapped(self, user_id: str):
+        index = self.get(user_id)
+        with index.lock:
+            index.bootstrapped = True
+            index.dirty = True
+            index.flush(force=True)
+
+    def search(self, user_id: str, query_embedding: np.ndarray, k: int = 10,
+               nprobe: Optional[int] = None) -> List[Dict]:
+        index = self.get(user_id)
+        with index.lock:
+            return index.search(query_embedding, k, nprobe)
+
+    def forget_session(self, user_id: str, session_id: str) -> int:
+        """Remove a deleted session's messages from the user's index"""
+        index = self.get(user_id)
+        with index.lock:
+            forgotten = index.forget_session(session_id)
+            index.flush(min_interval=self.flush_interval)
+        return forgotten
+
+    def forget_removed(self, user_id: str, session_id: str, messages: Iterable[Dict]) -> int:
+        """After an edit: remove the session's messages that are gone or were rewritten"""
+        index = self.get(user_id)
+        with index.lock:
+            forgotten = index.forget_removed(session_id, messages)
+            index.flush(min_interval=self.flush_interval)
+        return forgotten
+
+    def flush_all(self):
+        with self._lock:
+            indexes = list(self._loaded.values())
+        for index in indexes:
+            with index.lock:
+                index.flush(force=True)
+
+
+def message_entries(session_id: str, messages: Iterable[Dict]) -> List[Dict]:
+    """Index entries for the user/bot messages of a session that carry text"""
+    return [
+        {
+            "messageId": str(msg.get("_id")) if msg.get("_id") else None,
+            "sessionId": str(session_id),
+            "sender": msg.get("sender"),
+            "message": msg["message"],
+            "timestamp": msg.get("timestamp"),
+        }
+        for msg in messages
+        if msg.get("message") and msg.get("sender") in ["user", "bot"]
+    ]
@@ -1,48 +1,180 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, has_app_context
 from flask_cors import CORS
 from transformers import AutoTokenizer
 import requests
 import os
 from dotenv import load_dotenv
 import jwt
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import wraps
 from huggingface_hub import login
 # Import semantic search engine and file processor
-from semantic_search import SemanticSearchEngine, fetch_session_messages
+from semantic_search import SemanticSearchEngine, fetch_session_messages, fetch_user_sessions
+from ranking import (
+    RankingPipeline, SemanticScorer, TimestampDecayScorer, SenderScorer, AttachmentBoostScorer
+)
+from ann_index import HistoryIndexManager, message_entries
+from embedding_store import EmbeddingStore
+from job_queue import PersistentJobQueue, QueueFull
+from session_index import MAX_DOCUMENT_CHARS
 from file_processing_service import file_processor
+from model_router import ModelRouter, ModelRouterError
+from fair_scheduler import FairScheduler
+from auth_cache import VerifiedTokenCache, ServiceAssertionSigner, node_auth_headers
+from conversation_writer import ConversationWriter
+from prefetch_cache import SessionMessageCache
+from profiling import RequestProfiler
+from metrics import (
+    registry, timed, traced, get_logger,
+    HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, MODEL_REQUESTS, MODEL_IN_FLIGHT
+)
 
 load_dotenv()
 
+logger = get_logger("lawgpt.app")
+
 app = Flask(__name__)
 CORS(app)
 
 # ---------------- Config ----------------
 JWT_SECRET = os.getenv("JWT_SECRET", "your_jwt_secret_key")
 NODE_SERVER_URL = os.getenv("NODE_SERVER_URL", "http://localhost:5000")
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_MAX_TTL = float(os.getenv("AUTH_CACHE_MAX_TTL", "3600"))
+# Shared with the Node.js server; when set, calls to Node carry a signed service
+# assertion instead of the user's token (Node then skips token re-verification)
+INTERNAL_SERVICE_SECRET = os.getenv("INTERNAL_SERVICE_SECRET", "")
+# Append-only saves to Node: turns per request, wait for more turns before a write, users written in parallel
+NODE_SAVE_MAX_BATCH = int(os.getenv("NODE_SAVE_MAX_BATCH", "32"))
+NODE_SAVE_LINGER_MS = float(os.getenv("NODE_SAVE_LINGER_MS", "0"))
+NODE_SAVE_WORKERS = int(os.getenv("NODE_SAVE_WORKERS", "8"))
 ENABLE_SEMANTIC_SEARCH = os.getenv("ENABLE_SEMANTIC_SEARCH", "true").lower() == "true"
 TOP_N_RELEVANT_MESSAGES = int(os.getenv("TOP_N_RELEVANT_MESSAGES", "5"))
 RECENCY_WEIGHT = float(os.getenv("RECENCY_WEIGHT", "0.3"))
+RECENCY_HALF_LIFE_HOURS = float(os.getenv("RECENCY_HALF_LIFE_HOURS", "72"))
+USER_MESSAGE_BOOST = float(os.getenv("USER_MESSAGE_BOOST", "0.0"))
+ATTACHMENT_BOOST = float(os.getenv("ATTACHMENT_BOOST", "0.05"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = no diversity penalty
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.95"))  # cosine; 1.0 disables
+RETRIEVAL_FUSION = os.getenv("RETRIEVAL_FUSION", "rrf").lower()  # "rrf" (BM25 + embeddings) or "none"
+SESSION_INDEX_CACHE_SIZE = int(os.getenv("SESSION_INDEX_CACHE_SIZE", "128"))
+INDEX_DOCUMENT_CHUNKS = os.getenv("INDEX_DOCUMENT_CHUNKS", "true").lower() == "true"
+# Per-request cap on session history held (chars of message + document text; oldest dropped first),
+# and the history size above which a session is ranked in blocks instead of through a cached index
+SESSION_HISTORY_MAX_CHARS = int(os.getenv("SESSION_HISTORY_MAX_CHARS", "8000000"))
+WINDOWED_RETRIEVAL_MIN_CHARS = int(os.getenv("WINDOWED_RETRIEVAL_MIN_CHARS", "2000000"))
+RETRIEVAL_BLOCK_SIZE = int(os.getenv("RETRIEVAL_BLOCK_SIZE", "256"))
+# Prefetched session history (see /api/chat/prefetch): lifetime, and caps on sessions and total text held
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "256"))
+SESSION_CACHE_MAX_CHARS = int(os.getenv("SESSION_CACHE_MAX_CHARS", "50000000"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "64"))
+ENABLE_HISTORY_SEARCH = os.getenv("ENABLE_HISTORY_SEARCH", "true").lower() == "true"
+HISTORY_INDEX_DIR = os.getenv("HISTORY_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_index"))
+HISTORY_SEARCH_NPROBE = int(os.getenv("HISTORY_SEARCH_NPROBE", "16"))
+# History index vector storage: "none" (float32), "int8" or "binary" codes in memory with float32
+# vectors memory-mapped from disk; candidates shortlisted on codes per result before exact rescoring.
+# Binary recall@10 on 1M vectors: 0.655 at 10, 0.934 at 30, 1.000 at 100 (0.987 at 10 on 200k)
+HISTORY_INDEX_QUANTIZATION = os.getenv("HISTORY_INDEX_QUANTIZATION", "none").lower()
+HISTORY_RESCORE_FACTOR = int(os.getenv("HISTORY_RESCORE_FACTOR", "30"))
+ENABLE_PRECOMPUTE = os.getenv("ENABLE_PRECOMPUTE", "true").lower() == "true"
+PRECOMPUTE_DIR = os.getenv("PRECOMPUTE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "precompute"))
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "1"))
+PRECOMPUTE_MAX_PENDING = int(os.getenv("PRECOMPUTE_MAX_PENDING", "1000"))
+EMBEDDING_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "90"))
+# Opt-in request profiling: stack samples + trace for requests sent with the X-Profile header (equal to
+# PROFILE_HEADER_TOKEN when set) and, with PROFILE_SLOW_PERCENT > 0, for the slowest N% of each endpoint's
+# requests (PROFILE_SAMPLE_RATE of requests are sampled to find them)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_HEADER_TOKEN = os.getenv("PROFILE_HEADER_TOKEN", "")
+PROFILE_SLOW_PERCENT = float(os.getenv("PROFILE_SLOW_PERCENT", "0"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
 
 # Load tokenizer for LAWGPT-3.5
 try:
     HF_TOKEN = os.getenv("HF_TOKEN")
     login(HF_TOKEN)
     tokenizer = AutoTokenizer.from_pretrained("google/gemma-3-1b-it")
-    print("✅ Tokenizer loaded successfully")
+    logger.info("✅ Tokenizer loaded successfully")
 except Exception as e:
-    print(f"⚠️ Warning: Tokenizer not loaded: {e}")
+    logger.warning("⚠️ Tokenizer not loaded: %s", e)
     tokenizer = None
 
 # Initialize Semantic Search Engine
 semantic_engine = None
 if ENABLE_SEMANTIC_SEARCH:
     try:
-        semantic_engine = SemanticSearchEngine(model_name="all-MiniLM-L6-v2")
-        print("✅ Semantic Search Engine initialized")
+        semantic_engine = SemanticSearchEngine(
+            model_name="all-MiniLM-L6-v2",
+            session_cache_size=SESSION_INDEX_CACHE_SIZE,
+            index_documents=INDEX_DOCUMENT_CHUNKS,
+            windowed_min_chars=min(WINDOWED_RETRIEVAL_MIN_CHARS, SESSION_HISTORY_MAX_CHARS),
+            block_size=RETRIEVAL_BLOCK_SIZE
+        )
+        logger.info("✅ Semantic Search Engine initialized")
     except Exception as e:
-        print(f"⚠️ Warning: Semantic Search Engine not initialized: {e}")
+        logger.warning("⚠️ Semantic Search Engine not initialized: %s", e)
         semantic_engine = None
 
+# Persistent embedding cache shared by the request path and the precompute worker
+if semantic_engine and ENABLE_PRECOMPUTE:
+    try:
+        semantic_engine.embedding_store = EmbeddingStore(
+            os.path.join(PRECOMPUTE_DIR, "embeddings.sqlite3"),
+            model_name="all-MiniLM-L6-v2",
+            dim=semantic_engine.dim
+        )
+        semantic_engine.embedding_store.prune(EMBEDDING_CACHE_MAX_AGE_DAYS)
+    except Exception as e:
+        logger.warning("⚠️ Embedding store not initialized: %s", e)
+
+# Ranking of retrieved messages: semantic + timestamp decay (+ optional boosts), MMR de-duplication
+ranking_pipeline = RankingPipeline(
+    [
+        SemanticScorer(1 - RECENCY_WEIGHT),
+        TimestampDecayScorer(RECENCY_WEIGHT, half_life_hours=RECENCY_HALF_LIFE_HOURS),
+        SenderScorer(USER_MESSAGE_BOOST, user=1.0, bot=0.0),
+        AttachmentBoostScorer(ATTACHMENT_BOOST),
+    ],
+    mmr_lambda=MMR_LAMBDA if MMR_LAMBDA < 1.0 else None,
+    dedupe_threshold=DEDUPE_THRESHOLD if DEDUPE_THRESHOLD < 1.0 else None
+)
+
+# Per-user cross-session history index (persistent, local)
+history_index = None
+if semantic_engine and ENABLE_HISTORY_SEARCH:
+    history_index = HistoryIndexManager(
+        HISTORY_INDEX_DIR,
+        dim=semantic_engine.model.get_sentence_embedding_dimension(),
+        nprobe=HISTORY_SEARCH_NPROBE,
+        quantization=HISTORY_INDEX_QUANTIZATION,
+        rescore_factor=HISTORY_RESCORE_FACTOR
+    )
+
+# Off-request-path work (history bootstrap; precompute when the persistent queue is disabled)
+background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background")
+_bootstrapping_users = set()
+_bootstrapping_lock = threading.Lock()
+
+# Session history fetched ahead of the chat turn that needs it
+session_messages = SessionMessageCache(
+    ttl=SESSION_CACHE_TTL,
+    max_sessions=SESSION_CACHE_MAX_SESSIONS,
+    max_chars=SESSION_CACHE_MAX_CHARS,
+    max_session_chars=SESSION_HISTORY_MAX_CHARS
+)
+prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_prefetching = set()
+_prefetching_lock = threading.Lock()
+
 # Model endpoints
 MODEL_ENDPOINTS = {
     'LAWGPT-4': "https://consequential-wettable-danika.ngrok-free.dev/generate",
@@ -51,8 +183,149 @@ MODEL_ENDPOINTS = {
     'Contract-AI': "https://consequential-wettable-danika.ngrok-free.dev/generate",
     'LitAssist': "https://consequential-wettable-danika.ngrok-free.dev/generate"
 }
+# Per-model overrides; a list value defines several replicas, e.g.
+# MODEL_ENDPOINTS='{"LAWGPT-4": ["http://gpu-a:8000/generate", "http://gpu-b:8000/generate"]}'
+MODEL_ENDPOINTS.update(json.loads(os.getenv("MODEL_ENDPOINTS", "{}")))
+
+# Router limits: concurrency is per replica URL (shared by models on the same host)
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "4"))
+MODEL_MAX_QUEUE = int(os.getenv("MODEL_MAX_QUEUE", "16"))
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", "30"))
+# Circuit breaker: opens after consecutive failures or consecutive SLO breaches
+MODEL_EJECT_FAILURES = int(os.getenv("MODEL_EJECT_FAILURES", "3"))
+MODEL_EJECT_SECONDS = float(os.getenv("MODEL_EJECT_SECONDS", "30"))
+MODEL_LATENCY_SLO = float(os.getenv("MODEL_LATENCY_SLO", "60"))
+MODEL_SLO_BREACHES = int(os.getenv("MODEL_SLO_BREACHES", "5"))
+MODEL_CONNECT_TIMEOUT = float(os.getenv("MODEL_CONNECT_TIMEOUT", "5"))
+MODEL_READ_TIMEOUT = float(os.getenv("MODEL_READ_TIMEOUT", "300"))
+# Hedge prompts up to this many characters to a second replica after its p95 (0 disables)
+HEDGE_MAX_PROMPT_CHARS = int(os.getenv("HEDGE_MAX_PROMPT_CHARS", "0"))
+# Fair-share scheduling of model calls across users
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "30"))  # 0 disables
+USER_RATE_BURST = float(os.getenv("USER_RATE_BURST", "10"))
+# e.g. MODEL_RATE_LIMITS='{"LAWGPT-4": [2, 20]}' (requests per second, burst)
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+# e.g. USER_WEIGHTS='{"<user id>": 2}' for a larger fair share
+USER_WEIGHTS = json.loads(os.getenv("USER_WEIGHTS", "{}"))
+INTERACTIVE_MAX_PROMPT_CHARS = int(os.getenv("INTERACTIVE_MAX_PROMPT_CHARS", "1000"))
+SCHEDULER_MAX_QUEUED_PER_USER = int(os.getenv("SCHEDULER_MAX_QUEUED_PER_USER", "8"))
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "60"))
+# Batch chat: items and files per request, parallel extraction threads and model calls in flight per batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10"))
+BATCH_EXTRACTION_WORKERS = int(os.getenv("BATCH_EXTRACTION_WORKERS", "4"))
+BATCH_MODEL_CONCURRENCY = int(os.getenv("BATCH_MODEL_CONCURRENCY", "4"))
+
+model_router = ModelRouter(
+    MODEL_ENDPOINTS,
+    default_model='LAWGPT-4',
+    max_concurrency=MODEL_MAX_CONCURRENCY,
+    max_queue=MODEL_MAX_QUEUE,
+    queue_timeout=MODEL_QUEUE_TIMEOUT,
+    failure_threshold=MODEL_EJECT_FAILURES,
+    open_seconds=MODEL_EJECT_SECONDS,
+    latency_slo=MODEL_LATENCY_SLO,
+    slo_breach_threshold=MODEL_SLO_BREACHES,
+    failure_exceptions=(requests.exceptions.RequestException,)
+)
+
+fair_scheduler = FairScheduler(
+    model_router.capacity_groups(),
+    resolve=model_router.resolve,
+    capacity_key=model_router.capacity_group,
+    user_rate=USER_RATE_PER_MINUTE / 60,
+    user_burst=USER_RATE_BURST,
+    model_limits={model.upper(): tuple(limit) for model, limit in MODEL_RATE_LIMITS.items()},
+    user_weights={str(user): float(weight) for user, weight in USER_WEIGHTS.items()},
+    short_prompt_chars=INTERACTIVE_MAX_PROMPT_CHARS,
+    max_queued_per_user=SCHEDULER_MAX_QUEUED_PER_USER,
+    max_wait=SCHEDULER_MAX_WAIT
+)
+
+
+def model_router_error_response(error):
+    """429/503 with Retry-After when the router refuses a request"""
+    response = jsonify({"error": str(error), "retryAfter": error.retry_after})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, error.status_code
+
+# ---------------- Request Metrics ----------------
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = g.get("metrics_endpoint", "unmatched")
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    HTTP_LATENCY.observe(time.perf_counter() - g.get("request_start", time.perf_counter()),
+                         endpoint=endpoint, method=request.method)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if "metrics_endpoint" in g:
+        HTTP_IN_FLIGHT.dec(endpoint=g.metrics_endpoint)
+
+# ---------------- Request Profiling ----------------
+request_profiler = RequestProfiler(
+    PROFILE_DIR,
+    header_token=PROFILE_HEADER_TOKEN,
+    slow_percent=PROFILE_SLOW_PERCENT,
+    sample_rate=PROFILE_SAMPLE_RATE,
+    interval=PROFILE_INTERVAL_MS / 1000.0,
+    max_files=PROFILE_MAX_FILES
+) if PROFILING_ENABLED else None
+
+
+@app.before_request
+def start_request_profile():
+    if request_profiler is None:
+        return
+    g.profile = request_profiler.begin(
+        g.metrics_endpoint, request.method,
+        request.headers.get("X-Profile"), request.headers.get("X-Request-Id")
+    )
+
+
+@app.after_request
+def tag_profiled_response(response):
+    profile = g.get("profile")
+    if profile is not None:
+        response.headers["X-Trace-Id"] = profile.trace.trace_id
+        g.profile_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_profile(exc):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        request_profiler.end(profile, g.get("profile_status", 500))
 
 # ---------------- JWT Auth ----------------
+token_cache = VerifiedTokenCache(JWT_SECRET, max_entries=AUTH_CACHE_SIZE, max_ttl=AUTH_CACHE_MAX_TTL)
+service_signer = ServiceAssertionSigner(INTERNAL_SERVICE_SECRET) if INTERNAL_SERVICE_SECRET else None
+
+
+def node_headers(user_id, token):
+    """Auth headers for a call to the Node.js server on behalf of a user"""
+    return node_auth_headers(user_id, token, service_signer)
+
+
+conversation_writer = ConversationWriter(
+    NODE_SERVER_URL,
+    node_headers,
+    max_batch=NODE_SAVE_MAX_BATCH,
+    linger=NODE_SAVE_LINGER_MS / 1000.0,
+    workers=NODE_SAVE_WORKERS
+)
+
+
 def authenticate_token(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -61,7 +334,7 @@ def authenticate_token(f):
             return jsonify({"error": "Access token required"}), 401
         try:
             token = auth_header.split(" ")[1] if " " in auth_header else auth_header
-            decoded = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+            decoded = token_cache.decode(token)
             request.user = decoded
             request.token = token
         except jwt.ExpiredSignatureError:
@@ -91,57 +364,350 @@ def encode_message_for_lawgpt(message):
         },
         {"role": "user", "content": message}
     ]
-    prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    input_ids = tokenizer.encode(prompt)
+    with timed("tokenization"):
+        prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        input_ids = tokenizer.encode(prompt)
     return input_ids
 
 # ---------------- Semantic Context Builder ----------------
-def build_semantic_context(message, session_id, user_id, token):
+def load_session_messages(user_id, token, session_id):
+    """Session history from the prefetch cache, else from Node (and then cached)"""
+    messages = session_messages.get(user_id, session_id)
+    if messages is None:
+        with timed("session_fetch"):
+            messages = fetch_session_messages(
+                session_id=session_id,
+                user_id=user_id,
+                token=token,
+                node_server_url=NODE_SERVER_URL,
+                headers=node_headers(user_id, token),
+                max_chars=SESSION_HISTORY_MAX_CHARS
+            )
+        if messages:
+            session_messages.put(user_id, session_id, messages)
+    return messages
+
+
+@traced("build_semantic_context")
+def build_semantic_context(message, session_id, user_id, token, past_messages=None, query_embedding=None):
+    """
+    Prepend the most relevant past messages of the session to the message.
+    Batch callers pass past_messages (fetched once) and a precomputed query_embedding.
+    """
     if not semantic_engine or not ENABLE_SEMANTIC_SEARCH:
-        print("📄 Semantic search disabled, using original message")
+        logger.debug("📄 Semantic search disabled, using original message")
         return message
     
     if not session_id or session_id in ["null", "undefined"]:
-        print("📄 No session ID, using original message")
+        logger.debug("📄 No session ID, using original message")
         return message
     
     try:
-        past_messages = fetch_session_messages(
-            session_id=session_id,
-            user_id=user_id,
-            token=token,
-            node_server_url=NODE_SERVER_URL
-        )
+        if past_messages is None:
+            past_messages = load_session_messages(user_id, token, session_id)
         
         if not past_messages or len(past_messages) < 2:
-            print("📄 Not enough past messages for context")
+            logger.debug("📄 Not enough past messages for context")
             return message
         
         relevant_messages = semantic_engine.get_relevant_messages(
             current_message=message,
             past_messages=past_messages,
             top_n=TOP_N_RELEVANT_MESSAGES,
-            recency_weight=RECENCY_WEIGHT
+            recency_weight=RECENCY_WEIGHT,
+            session_id=session_id,
+            fusion=RETRIEVAL_FUSION if RETRIEVAL_FUSION != "none" else None,
+            pipeline=ranking_pipeline,
+            query_embedding=query_embedding
         )
         
         if not relevant_messages:
-            print("📄 No relevant messages found")
+            logger.debug("📄 No relevant messages found")
             return message
         
-        print(f"🎯 Found {len(relevant_messages)} relevant messages")
-        for i, msg in enumerate(relevant_messages[:3]):
-            print(f"   {i+1}. {msg['sender']}: {msg['message'][:50]}... (score: {msg['similarity_score']:.3f})")
+        logger.debug("🎯 Found %d relevant messages (top score: %.3f)",
+                     len(relevant_messages), relevant_messages[0]['similarity_score'])
         
-        context_message = semantic_engine.build_context_prompt(
-            current_message=message,
-            relevant_messages=relevant_messages,
-            max_context_length=2000
-        )
+        with timed("prompt_build"):
+            context_message = semantic_engine.build_context_prompt(
+                current_message=message,
+                relevant_messages=relevant_messages,
+                max_context_length=2000
+            )
         return context_message
         
     except Exception as e:
-        print(f"⚠️ Error building semantic context: {e}")
+        logger.warning("⚠️ Error building semantic context: %s", e)
         return message
+# ---------------- Cross-Session History Search ----------------
+def index_session_messages(user_id, session_id, messages):
+    """Embed a session's not-yet-indexed messages into the user's history index"""
+    entries = history_index.unindexed(user_id, message_entries(session_id, messages))
+    if not entries:
+        return 0
+    with timed("history_index"):
+        embeddings = semantic_engine.encode_for_index([e['message'] for e in entries])
+        return history_index.add_messages(user_id, entries, embeddings)
+
+
+def bootstrap_history_index(user_id, token):
+    """Backfill the history index from every session the user already has"""
+    try:
+        sessions = fetch_user_sessions(token, NODE_SERVER_URL, timeout=60, headers=node_headers(user_id, token))
+        total = 0
+        for session in sessions:
+            total += index_session_messages(user_id, session.get('_id'), session.get('messages', []))
+        history_index.mark_bootstrapped(user_id)
+        logger.info("🧭 History index bootstrapped for user %s (%d messages)", user_id, total)
+    except Exception as e:
+        logger.warning("⚠️ History index bootstrap failed for user %s: %s", user_id, e)
+    finally:
+        with _bootstrapping_lock:
+            _bootstrapping_users.discard(user_id)
+
+
+def forget_edited_history(user_id, token, session_id):
+    """After an edit: drop index rows for the turns it removed or rewrote, then index the rewrite"""
+    try:
+        messages = fetch_session_messages(session_id, user_id, token, NODE_SERVER_URL,
+                                          headers=node_headers(user_id, token))
+        if not messages:
+            return
+        forgotten = history_index.forget_removed(user_id, session_id, messages)
+        if forgotten:
+            logger.info("🧭 Forgot %d edited messages of session %s", forgotten, session_id)
+        index_session_messages(user_id, session_id, messages)
+    except Exception as e:
+        logger.warning("⚠️ History index update after edit failed for session %s: %s", session_id, e)
+
+
+def ensure_history_bootstrapped(user_id, token):
+    """Start a backfill for users without one; returns True while it is running"""
+    if history_index.is_bootstrapped(user_id):
+        return False
+    with _bootstrapping_lock:
+        if user_id not in _bootstrapping_users:
+            _bootstrapping_users.add(user_id)
+            background_executor.submit(bootstrap_history_index, user_id, token)
+    return True
+
+
+# ---------------- Background Precompute ----------------
+def compact_session_messages(messages):
+    """Fields the precompute jobs need, with document text cut to what gets chunked"""
+    compact = []
+    for msg in messages:
+        entry = {key: msg.get(key) for key in ('_id', 'sender', 'message', 'timestamp')}
+        file_metadata = msg.get('fileMetadata')
+        if file_metadata:
+            entry['fileMetadata'] = {
+                'fileName': file_metadata.get('fileName'),
+                'extractedText': (file_metadata.get('extractedText') or '')[:MAX_DOCUMENT_CHARS],
+            }
+        compact.append(entry)
+    return compact
+
+
+def run_session_job(payload):
+    """Embed a session's just-saved messages and document chunks; safe to run twice"""
+    session_id, messages = payload['session_id'], payload['messages']
+    with timed("precompute"):
+        if semantic_engine:
+            semantic_engine.append_to_session(session_id, messages)
+        if history_index and payload.get('user_id'):
+            index_session_messages(payload['user_id'], session_id, messages)
+
+
+def run_document_job(payload):
+    """Embed the chunks of an uploaded document into the embedding store"""
+    with timed("precompute"):
+        semantic_engine.precompute_document(payload['text'])
+
+
+precompute_queue = None
+if semantic_engine and ENABLE_PRECOMPUTE:
+    try:
+        precompute_queue = PersistentJobQueue(
+            os.path.join(PRECOMPUTE_DIR, "queue.sqlite3"),
+            handlers={"session": run_session_job, "document": run_document_job},
+            name="precompute",
+            workers=PRECOMPUTE_WORKERS,
+            max_pending=PRECOMPUTE_MAX_PENDING
+        )
+    except Exception as e:
+        logger.warning("⚠️ Precompute queue not initialized: %s", e)
+
+
+def enqueue_precompute(kind, key, payload):
+    """Queue precompute work; dropped (never blocks the request) when the queue is full"""
+    if precompute_queue is None:
+        handler = run_session_job if kind == "session" else run_document_job
+        if semantic_engine and (kind == "session" or semantic_engine.embedding_store is not None):
+            background_executor.submit(handler, payload)
+        return
+    try:
+        precompute_queue.enqueue(kind, key, payload)
+    except QueueFull as e:
+        logger.warning("⚠️ Precompute skipped (%s): %s", key, e)
+    except Exception as e:
+        logger.warning("⚠️ Precompute enqueue failed (%s): %s", key, e)
+
+
+def schedule_session_precompute(user_id, session_id, messages):
+    """After a save: embed the session's new messages for the next chat turn and history search"""
+    if not semantic_engine or not session_id or not messages:
+        return
+    enqueue_precompute("session", f"session:{session_id}:{messages[-1]['_id']}", {
+        "user_id": user_id,
+        "session_id": str(session_id),
+        "messages": compact_session_messages(messages),
+    })
+
+
+def save_turns(user_id, token, session_id, model, turns):
+    """
+    Append user/bot turns to a session through the coalescing writer, then queue
+    embedding of the new messages.
+    
+    Args:
+        turns: Dicts with userMessage, botMessage and optional fileMetadata, isEdit
+        
+    Returns:
+        Per-turn {sessionId, title, created, messageIds, timestamp}
+        
+    Raises:
+        SaveError: If Node did not save a turn
+    """
+    if not session_id or session_id in ["null", "undefined"]:
+        session_id = None
+    payloads = [dict(turn, userId=user_id, sessionId=session_id, model=model) for turn in turns]
+    saved = []
+    if session_id is None:
+        # The first turn creates the session; the rest are appended to it
+        saved = conversation_writer.save(user_id, token, payloads[:1])
+        session_id = saved[0]["sessionId"]
+        payloads = [dict(payload, sessionId=session_id) for payload in payloads[1:]]
+    if payloads:
+        saved += conversation_writer.save(user_id, token, payloads)
+
+    new_messages = []
+    for turn, result in zip(turns, saved):
+        senders = ["bot"] if turn.get("isEdit") else ["user", "bot"]
+        texts = {"user": turn.get("userMessage"), "bot": turn["botMessage"]}
+        for sender, message_id in zip(senders, result["messageIds"]):
+            message = {"_id": message_id, "sender": sender, "message": texts[sender],
+                       "timestamp": result.get("timestamp")}
+            if sender == "user" and turn.get("fileMetadata"):
+                message["fileMetadata"] = turn["fileMetadata"]
+            new_messages.append(message)
+    if any(turn.get("isEdit") for turn in turns):
+        # The edit already rewrote the session in Node; refetch on the next turn
+        session_messages.invalidate(user_id, session_id)
+        if history_index:
+            background_executor.submit(forget_edited_history, user_id, token, session_id)
+    else:
+        session_messages.extend(user_id, session_id, compact_session_messages(new_messages))
+    schedule_session_precompute(user_id, session_id, new_messages)
+    return saved
+
+
+def saved_turn_response(saved):
+    """Fields of a chat response describing the saved turn (ids only, not the session)"""
+    message_ids = saved["messageIds"]
+    return {
+        "sessionId": saved["sessionId"],
+        "title": saved["title"],
+        "messageIds": {
+            "user": message_ids[0] if len(message_ids) > 1 else None,
+            "bot": message_ids[-1],
+        },
+        "timestamp": saved.get("timestamp"),
+    }
+
+
+def schedule_document_precompute(extracted_text):
+    """After an upload: embed the document's chunks before the chat request that uses it"""
+    if not semantic_engine or not extracted_text:
+        return
+    text = extracted_text[:MAX_DOCUMENT_CHARS]
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    enqueue_precompute("document", f"document:{digest}", {"text": text})
+
+
+@app.route("/api/search/history", methods=["POST"])
+@authenticate_token
+def search_history():
+    """
+    Semantic search across all of the user's chat sessions.
+    Accepts: JSON with 'query' and optional 'k' (default 10, max 100)
+    """
+    try:
+        if not history_index:
+            return jsonify({"error": "History search is disabled"}), 503
+
+        user_id = request.user.get("id")
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        query = data.get("query")
+        query = query.strip() if isinstance(query, str) else ""
+        if not query or not user_id:
+            return jsonify({"error": "Missing query or userId"}), 400
+
+        k = data.get("k", 10)
+        if isinstance(k, bool) or not isinstance(k, int):
+            return jsonify({"error": "k must be an integer"}), 400
+        k = max(1, min(k, 100))
+
+        indexing = ensure_history_bootstrapped(user_id, request.token)
+
+        start = time.perf_counter()
+        with timed("embedding"):
+            query_embedding = semantic_engine.encode_messages([query])[0]
+        with timed("history_search"):
+            results = history_index.search(user_id, query_embedding, k=k)
+
+        return jsonify({
+            "results": [
+                {
+                    "sessionId": r['sessionId'],
+                    "messageId": r['messageId'],
+                    "sender": r['sender'],
+                    "message": r['message'],
+                    "timestamp": r['timestamp'],
+                    "score": r['score']
+                }
+                for r in results
+            ],
+            "indexing": indexing,
+            "tookMs": round((time.perf_counter() - start) * 1000, 2)
+        }), 200
+
+    except Exception as e:
+        logger.exception("❌ search_history error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/search/history/sessions/<session_id>", methods=["DELETE"])
+@authenticate_token
+def forget_history_session(session_id):
+    """Remove a deleted session's messages from the user's history index"""
+    try:
+        if not history_index:
+            return jsonify({"error": "History search is disabled"}), 503
+
+        user_id = request.user.get("id")
+        if not user_id:
+            return jsonify({"error": "Missing userId"}), 400
+
+        session_messages.invalidate(user_id, session_id)
+        forgotten = history_index.forget_session(user_id, session_id)
+        logger.info("🧭 Forgot %d messages of deleted session %s", forgotten, session_id)
+        return jsonify({"forgotten": forgotten}), 200
+
+    except Exception as e:
+        logger.exception("❌ forget_history_session error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
 # NEW ENDPOINT: Upload file only, return extracted text + metadata
 @app.route("/api/files/upload-only", methods=["POST"])
 @authenticate_token
@@ -161,7 +727,7 @@ def upload_file_only():
         if not file.filename:
             return jsonify({"error": "Invalid file"}), 400
         
-        print(f"📤 Processing file upload: {file.filename}")
+        logger.debug("📤 Processing file upload: %s", file.filename)
         
         # Process file using file processor
         result = file_processor.process_file(file, file.filename)
@@ -179,8 +745,8 @@ def upload_file_only():
             'extractedText': extracted_text  # Include extracted text
         }
         
-        print(f"✅ File processed successfully: {result['filename']}")
-        print(f"   Extracted {len(extracted_text)} characters")
+        logger.info("✅ File processed: %s (%d chars extracted)", result['filename'], len(extracted_text))
+        schedule_document_precompute(extracted_text)
         
         return jsonify({
             "success": True,
@@ -192,9 +758,7 @@ def upload_file_only():
         }), 200
 
     except Exception as e:
-        print(f"❌ upload_file_only error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ upload_file_only error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -202,6 +766,7 @@ def upload_file_only():
 
 @app.route("/api/chat/with-file", methods=["POST"])
 @authenticate_token
+@traced("handle_message_with_file")
 def handle_message_with_file():
     """
     Handle message with pre-uploaded file metadata.
@@ -225,21 +790,18 @@ def handle_message_with_file():
         if not file_metadata or 'extractedText' not in file_metadata:
             return jsonify({"error": "Missing file metadata or extracted text"}), 400
 
-        print(f"💬 Processing message with file for user {user_id}, session {session_id}")
-        print(f"   File: {file_metadata.get('fileName')}")
-        print(f"   Message: {message}...")
+        logger.info("💬 Processing message with file for user %s, session %s, file %s",
+                    user_id, session_id, file_metadata.get('fileName'))
         
         # Combine message and extracted text
         extracted_text = file_metadata['extractedText']
+        logger.debug("📄 Extracted text length: %d", len(extracted_text))
         
-        # ✅ DEBUG: Check extracted text
-        print(f"📄 DEBUG - Extracted text length: {len(extracted_text)}")
-        print(f"📄 DEBUG - Extracted text preview: {extracted_text[:100]}...")
-        
-        if message:
-            combined_message = f"{message}\n\n📄 **Attached Document Content:**\n\n{extracted_text}"
-        else:
-            combined_message = f"Please analyze this document:\n\n{extracted_text}"
+        with timed("prompt_build"):
+            if message:
+                combined_message = f"{message}\n\n📄 **Attached Document Content:**\n\n{extracted_text}"
+            else:
+                combined_message = f"Please analyze this document:\n\n{extracted_text}"
         
         
         # Build semantic context if enabled
@@ -253,15 +815,12 @@ def handle_message_with_file():
             )
             
             if enhanced_message != combined_message:
-                print(f"   ✨ Enhanced with context ({len(enhanced_message)} chars)")
+                logger.debug("   ✨ Enhanced with context (%d chars)", len(enhanced_message))
 
         # Generate bot response
-        bot_reply = generate_bot_response(enhanced_message, model)
+        bot_reply = generate_bot_response(enhanced_message, model, user_id=user_id, interactive=False)
 
         # Save to Node.js MongoDB
-        auth_header = request.headers.get("Authorization")
-        if auth_header and not auth_header.startswith("Bearer "):
-            auth_header = f"Bearer {auth_header}"
         
         # Prepare user message to save
         user_message_to_save = message
@@ -274,82 +833,45 @@ def handle_message_with_file():
             'extractedText': extracted_text  # ✅ MUST include this for edits to work!
         }
         
-        print(f"💾 Saving to MongoDB with file metadata:")
-        print(f"   - fileName: {storage_file_metadata['fileName']}")
-        print(f"   - fileType: {storage_file_metadata['fileType']}")
-        print(f"   - extractedText length: {len(storage_file_metadata['extractedText'])}")
+        logger.debug("💾 Saving to MongoDB with file metadata: %s (%s, extractedText %d chars)",
+                     storage_file_metadata['fileName'], storage_file_metadata['fileType'],
+                     len(storage_file_metadata['extractedText']))
         
         try:
-            print(f"📡 Sending to Node.js server at {NODE_SERVER_URL}/api/conversation/save")
-            node_response = requests.post(
-                f"{NODE_SERVER_URL}/api/conversation/save",
-                json={
-                    "userId": user_id,
-                    "sessionId": session_id,
-                    "userMessage": user_message_to_save,
-                    "botMessage": bot_reply,
-                    "model": model,
-                    "fileMetadata": storage_file_metadata,  # ✅ Now includes extractedText
-                    "isEdit": is_edit
-                },
-                headers={
-                    "Authorization": auth_header,
-                    "Content-Type": "application/json"
-                },
-                timeout=10
-            )
-
-            if not node_response.ok:
-                error_text = node_response.text
-                print(f"❌ Node.js server error: {node_response.status_code} - {error_text}")
-                raise Exception(f"Failed to save to MongoDB: {node_response.status_code}")
-
-            saved_data = node_response.json()
-            print(f"✅ Successfully saved to MongoDB for session {saved_data.get('session', {}).get('_id', 'unknown')}")
-            
-            # ✅ DEBUG: Verify what was saved
-            saved_session = saved_data.get('session', {})
-            if saved_session.get('messages'):
-                # Check the user message (second to last, since last is bot response)
-                last_user_msg = None
-                for msg in reversed(saved_session['messages']):
-                    if msg.get('sender') == 'user':
-                        last_user_msg = msg
-                        break
-                
-                if last_user_msg and last_user_msg.get('fileMetadata'):
-                    has_extracted = bool(last_user_msg['fileMetadata'].get('extractedText'))
-                    print(f"✅ Verified saved message has extractedText: {has_extracted}")
-                    if has_extracted:
-                        print(f"   Length: {len(last_user_msg['fileMetadata']['extractedText'])} chars")
-                    else:
-                        print(f"⚠️ WARNING: extractedText is missing in saved message!")
-
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Request error to Node.js server: {e}")
-            raise Exception(f"Failed to connect to Node.js server: {str(e)}")
+            saved = save_turns(user_id, token, session_id, model, [{
+                "userMessage": user_message_to_save,
+                "botMessage": bot_reply,
+                "fileMetadata": storage_file_metadata,  # ✅ Includes extractedText
+                "isEdit": is_edit
+            }])[0]
+            logger.info("✅ Saved to MongoDB for session %s", saved["sessionId"])
         except Exception as e:
-            print(f"❌ Error saving to MongoDB: {e}")
+            logger.error("❌ Error saving to MongoDB: %s", e)
             raise Exception(f"Failed to save conversation: {str(e)}")
 
+        file_metadata_summary = {k: v for k, v in storage_file_metadata.items() if k != 'extractedText'}
         return jsonify({
-            "session": saved_data.get("session"),
+            **saved_turn_response(saved),
             "botReply": bot_reply,
-            "fileMetadata": storage_file_metadata,  # Return full metadata with extractedText
-            "contextUsed": enhanced_message != combined_message
+            "fileMetadata": file_metadata_summary,  # Client already holds the extractedText it sent
+            "contextUsed": enhanced_message != combined_message,
+            "queue": g.get("model_queue")
         }), 200
 
+    except ModelRouterError as e:
+        return model_router_error_response(e)
     except Exception as e:
-        print(f"❌ handle_message_with_file error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ handle_message_with_file error: %s", e)
         return jsonify({"error": str(e)}), 500
 # ---------------- AI Generation ----------------
-def generate_bot_response(message, model='LAWGPT-4'):
+@traced("generate_bot_response")
+def generate_bot_response(message, model='LAWGPT-4', user_id=None, interactive=True, wait_for_rate=False):
+    """
+    Call the model for a reply, after waiting for the user's fair-share slot.
+    Queue position and wait are left in g.model_queue for the response.
+    """
     try:
         model = model.upper()
-        api_url = MODEL_ENDPOINTS.get(model, MODEL_ENDPOINTS['LAWGPT-4'])
-        print(f"🔗 Sending to {api_url} for model {model}")
 
         if model == 'LAWGPT-3.5':
             input_ids = encode_message_for_lawgpt(message)
@@ -357,8 +879,24 @@ def generate_bot_response(message, model='LAWGPT-4'):
         else:
             body = {"query": message}
 
-        response = requests.post(api_url, json=body, headers={"Content-Type": "application/json"}, timeout=300)
-        print(f"📡 Response: {response.status_code}")
+        def send(lease):
+            logger.debug("🔗 Sending to %s for model %s", lease.url, model)
+            with timed("model_call"), MODEL_IN_FLIGHT.track_inprogress(model=model):
+                response = requests.post(
+                    lease.url, json=body, headers={"Content-Type": "application/json"},
+                    timeout=(MODEL_CONNECT_TIMEOUT, MODEL_READ_TIMEOUT)
+                )
+            if response.status_code >= 500:
+                lease.mark_failed()
+            return response
+
+        hedge = 0 < len(message) <= HEDGE_MAX_PROMPT_CHARS
+        with fair_scheduler.slot(user_id, model, len(message), interactive=interactive,
+                                 wait_for_rate=wait_for_rate) as ticket:
+            if has_app_context():
+                g.model_queue = ticket.feedback()
+            response = model_router.execute(model, send, hedge=hedge)
+        logger.debug("📡 Response: %s", response.status_code)
         if not response.ok:
             raise Exception(f"Server error: {response.status_code} - {response.text}")
 
@@ -371,22 +909,30 @@ def generate_bot_response(message, model='LAWGPT-4'):
         else:
             final_output = generated_text.strip()
 
-        print("final_output:", final_output[:100] + "..." if len(final_output) > 100 else final_output)
+        MODEL_REQUESTS.inc(model=model, outcome="success" if final_output else "empty")
+        logger.debug("final_output: %d chars", len(final_output))
         return final_output or "⚠️ No response generated from model."
 
+    except ModelRouterError:
+        MODEL_REQUESTS.inc(model=model, outcome="rejected")
+        raise
     except requests.exceptions.Timeout:
-        print(f"❌ generateBotResponse timeout error")
+        MODEL_REQUESTS.inc(model=model, outcome="timeout")
+        logger.error("❌ generateBotResponse timeout error")
         return f"⚠️ The model is taking too long to respond. This can happen when the model server is busy. Please try again in a moment."
     except requests.exceptions.RequestException as e:
-        print(f"❌ generateBotResponse request error: {e}")
+        MODEL_REQUESTS.inc(model=model, outcome="connection_error")
+        logger.error("❌ generateBotResponse request error: %s", e)
         return f"⚠️ Could not connect to the model server. Please check if the model is running and try again."
     except Exception as e:
-        print(f"❌ generateBotResponse error: {e}")
+        MODEL_REQUESTS.inc(model=model, outcome="error")
+        logger.error("❌ generateBotResponse error: %s", e)
         return f"⚠️ Sorry, I could not process your request: {str(e)}"
 
 # ---------------- File Upload + Chat Handler ----------------
 @app.route("/api/chat/upload", methods=["POST"])
 @authenticate_token
+@traced("handle_file_upload")
 def handle_file_upload():
     """
     Handle file upload with chat message
@@ -402,10 +948,7 @@ def handle_file_upload():
         model = request.form.get("model", "LAWGPT-4")
         use_context = request.form.get("useContext", "true").lower() == "true"
         
-        print(f"📤 File upload request from user {user_id}")
-        print(f"   Message: {message[:50] if message else 'None'}...")
-        print(f"   Session: {session_id}")
-        print(f"   Model: {model}")
+        logger.info("📤 File upload request from user %s, session %s, model %s", user_id, session_id, model)
         
         # Extract file if present
         file = request.files.get("file")
@@ -416,7 +959,7 @@ def handle_file_upload():
         if not file.filename:
             return jsonify({"error": "Invalid file"}), 400
         
-        print(f"📎 Processing file: {file.filename}")
+        logger.debug("📎 Processing file: %s", file.filename)
         
         # Process file using file processor
         result = file_processor.process_file(file, file.filename)
@@ -433,14 +976,15 @@ def handle_file_upload():
             'fileSize': result['file_size']
         }
         
-        print(f"✅ File processed: {result['filename']} ({result['file_size']} bytes)")
-        print(f"   Extracted {len(extracted_text)} characters")
+        logger.info("✅ File processed: %s (%d bytes, %d chars extracted)",
+                    result['filename'], result['file_size'], len(extracted_text))
         
         # Combine message and extracted text
-        if message:
-            combined_message = f"{message}\n\n📄 **Attached Document Content:**\n\n{extracted_text}"
-        else:
-            combined_message = f"Please analyze this document:\n\n{extracted_text}"
+        with timed("prompt_build"):
+            if message:
+                combined_message = f"{message}\n\n📄 **Attached Document Content:**\n\n{extracted_text}"
+            else:
+                combined_message = f"Please analyze this document:\n\n{extracted_text}"
         
         # Build semantic context if enabled
         enhanced_message = combined_message
@@ -453,69 +997,273 @@ def handle_file_upload():
             )
             
             if enhanced_message != combined_message:
-                print(f"   ✨ Enhanced with context ({len(enhanced_message)} chars)")
+                logger.debug("   ✨ Enhanced with context (%d chars)", len(enhanced_message))
         
         # Generate bot response
-        bot_reply = generate_bot_response(enhanced_message, model)
+        bot_reply = generate_bot_response(enhanced_message, model, user_id=user_id, interactive=False)
         
         # Save to Node.js MongoDB
-        auth_header = request.headers.get("Authorization")
-        if auth_header and not auth_header.startswith("Bearer "):
-            auth_header = f"Bearer {auth_header}"
         
         # Prepare user message to save (include file indicator)
         user_message_to_save = message or f"[Uploaded file: {file_metadata['fileName']}]"
         
         try:
-            print(f"📡 Sending to Node.js server at {NODE_SERVER_URL}/api/conversation/save")
-            node_response = requests.post(
-                f"{NODE_SERVER_URL}/api/conversation/save",
-                json={
-                    "userId": user_id,
-                    "sessionId": session_id,
-                    "userMessage": user_message_to_save,
-                    "botMessage": bot_reply,
-                    "model": model,
-                    "fileMetadata": file_metadata  # Include file metadata
-                },
-                headers={
-                    "Authorization": auth_header,
-                    "Content-Type": "application/json"
-                },
-                timeout=10
-            )
-
-            if not node_response.ok:
-                error_text = node_response.text
-                print(f"❌ Node.js server error: {node_response.status_code} - {error_text}")
-                raise Exception(f"Failed to save to MongoDB: {node_response.status_code}")
-
-            saved_data = node_response.json()
-            print(f"✅ Successfully saved to MongoDB for session {saved_data.get('session', {}).get('_id', 'unknown')}")
-
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Request error to Node.js server: {e}")
-            raise Exception(f"Failed to connect to Node.js server: {str(e)}")
+            saved = save_turns(user_id, token, session_id, model, [{
+                "userMessage": user_message_to_save,
+                "botMessage": bot_reply,
+                "fileMetadata": file_metadata  # Include file metadata
+            }])[0]
+            logger.info("✅ Saved to MongoDB for session %s", saved["sessionId"])
         except Exception as e:
-            print(f"❌ Error saving to MongoDB: {e}")
+            logger.error("❌ Error saving to MongoDB: %s", e)
             raise Exception(f"Failed to save conversation: {str(e)}")
 
         return jsonify({
-            "session": saved_data.get("session"),
+            **saved_turn_response(saved),
             "botReply": bot_reply,
             "fileMetadata": file_metadata,
-            "contextUsed": enhanced_message != combined_message
+            "contextUsed": enhanced_message != combined_message,
+            "queue": g.get("model_queue")
         }), 200
 
+    except ModelRouterError as e:
+        return model_router_error_response(e)
     except Exception as e:
-        print(f"❌ handle_file_upload error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ handle_file_upload error: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# ---------------- Batch Chat Handler ----------------
+def save_batch(user_id, token, session_id, model, completed):
+    """Save every answered batch item (coalesced by the writer); returns the 'done' line fields"""
+    completed = sorted(completed, key=lambda item: item["index"])
+    saved = save_turns(user_id, token, session_id, model, [
+        {
+            "userMessage": item["userMessage"],
+            "botMessage": item["botReply"],
+            "fileMetadata": item.get("fileMetadata"),
+        }
+        for item in completed
+    ])
+    return {
+        "sessionId": saved[0]["sessionId"],
+        "title": saved[0]["title"],
+        "items": [
+            {"index": item["index"], **saved_turn_response(result)["messageIds"]}
+            for item, result in zip(completed, saved)
+        ],
+    }
+
+
+@app.route("/api/chat/batch", methods=["POST"])
+@authenticate_token
+def handle_batch():
+    """
+    Run one prompt over many documents (and/or several standalone messages).
+    Accepts: multipart/form-data with 'files' (repeated), 'message' (prompt applied
+    to each file), 'messages' (JSON list of standalone prompts), 'sessionId', 'model',
+    'useContext'.
+    Streams NDJSON: one {"type": "item", ...} line per item as it completes, then
+    {"type": "done", "sessionId": ..., "items": [message ids]} after the items are saved.
+    """
+    try:
+        user_id = request.user.get("id")
+        token = request.token
+        prompt = request.form.get("message", "").strip()
+        session_id = request.form.get("sessionId")
+        model = request.form.get("model", "LAWGPT-4")
+        use_context = request.form.get("useContext", "true").lower() == "true"
+        try:
+            standalone = json.loads(request.form.get("messages", "[]"))
+        except ValueError:
+            return jsonify({"error": "messages must be a JSON list of strings"}), 400
+        if not isinstance(standalone, list) or not all(isinstance(m, str) for m in standalone):
+            return jsonify({"error": "messages must be a JSON list of strings"}), 400
+        standalone = [m.strip() for m in standalone if m.strip()]
+
+        files = [f for f in request.files.getlist("files") if f.filename]
+        if len(files) > BATCH_MAX_FILES:
+            return jsonify({"error": f"Too many files in batch (max {BATCH_MAX_FILES})"}), 413
+        # Read uploads now; the request stream is gone once the response starts streaming.
+        # Reading one byte past the limit is enough to reject a file without buffering all of it
+        uploads = []
+        for f in files:
+            data = f.read(file_processor.MAX_FILE_SIZE + 1)
+            if len(data) > file_processor.MAX_FILE_SIZE:
+                return jsonify({
+                    "error": f"{f.filename} is too large (max {file_processor.MAX_FILE_SIZE // (1024 * 1024)}MB)"
+                }), 413
+            uploads.append((f.filename, f.content_type, data))
+        total = len(uploads) + len(standalone)
+        if not total:
+            return jsonify({"error": "No files or messages provided"}), 400
+        if total > BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Too many items in batch (max {BATCH_MAX_ITEMS})"}), 400
+        if not session_id or session_id in ["null", "undefined"]:
+            session_id = None
+
+        logger.info("📦 Batch request from user %s: %d files, %d messages, model %s",
+                    user_id, len(uploads), len(standalone), model)
+    except Exception as e:
+        logger.exception("❌ handle_batch error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+    def line(payload):
+        return json.dumps(payload) + "\n"
+
+    def stream():
+        items, completed = [], []
+
+        # 1. Parallel extraction
+        with ThreadPoolExecutor(max_workers=BATCH_EXTRACTION_WORKERS, thread_name_prefix="batch-extract") as pool:
+            extractions = list(pool.map(
+                lambda upload: file_processor.process_bytes(upload[2], upload[0], upload[1]), uploads
+            ))
+        for index, ((filename, _, _), result) in enumerate(zip(uploads, extractions)):
+            if not result['success']:
+                yield line({"type": "item", "index": index, "fileName": filename, "status": "error",
+                            "error": f"File processing failed: {result['error']}"})
+                continue
+            text = result['extracted_text']
+            items.append({
+                "index": index,
+                "fileName": result['filename'],
+                "userMessage": prompt or f"[Uploaded file: {result['filename']}]",
+                "prompt": (f"{prompt}\n\n📄 **Attached Document Content:**\n\n{text}" if prompt
+                           else f"Please analyze this document:\n\n{text}"),
+                "fileMetadata": {
+                    'fileName': result['filename'],
+                    'fileType': result['file_type'],
+                    'fileSize': result['file_size'],
+                    'extractedText': text,
+                },
+            })
+        for offset, message in enumerate(standalone):
+            items.append({"index": len(uploads) + offset, "userMessage": message, "prompt": message})
+
+        # 2. Context: one session fetch and one embedding call for every item's query
+        if use_context and session_id and semantic_engine and ENABLE_SEMANTIC_SEARCH and items:
+            past_messages = load_session_messages(user_id, token, session_id)
+            if past_messages and len(past_messages) >= 2:
+                with timed("embedding"):
+                    queries = semantic_engine.encode_normalized([item["prompt"] for item in items])
+                for item, query_embedding in zip(items, queries):
+                    item["enhanced"] = build_semantic_context(item["prompt"], session_id, user_id, token,
+                                                              past_messages=past_messages,
+                                                              query_embedding=query_embedding)
+
+        # 3. Model calls with bounded concurrency, results streamed as they finish
+        def answer(item):
+            with app.app_context():
+                reply = generate_bot_response(item.get("enhanced", item["prompt"]), model, user_id=user_id,
+                                              interactive=False, wait_for_rate=True)
+                return reply, g.get("model_queue")
+
+        pool = ThreadPoolExecutor(max_workers=BATCH_MODEL_CONCURRENCY, thread_name_prefix="batch-model")
+        futures = {pool.submit(answer, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                result = {"type": "item", "index": item["index"], "fileName": item.get("fileName")}
+                try:
+                    reply, queue = future.result()
+                    item["botReply"] = reply
+                    completed.append(item)
+                    result.update(status="ok", botReply=reply, queue=queue,
+                                  contextUsed="enhanced" in item and item["enhanced"] != item["prompt"])
+                except ModelRouterError as e:
+                    result.update(status="error", error=str(e), retryAfter=e.retry_after)
+                except Exception as e:
+                    result.update(status="error", error=str(e))
+                yield line(result)
+        except GeneratorExit:
+            # Client went away: drop the calls not yet started (without waiting for the
+            # ones in flight) and keep the answers that were already paid for
+            pool.shutdown(wait=False, cancel_futures=True)
+            for future, item in futures.items():
+                if "botReply" not in item and future.done() and not future.cancelled() and future.exception() is None:
+                    item["botReply"] = future.result()[0]
+                    completed.append(item)
+            if completed:
+                try:
+                    save_batch(user_id, token, session_id, model, completed)
+                except Exception as e:
+                    logger.error("❌ Batch save after disconnect failed: %s", e)
+            raise
+        finally:
+            pool.shutdown(wait=False)
+
+        # 4. One bulk save
+        done = {"type": "done", "total": total, "succeeded": len(completed), "sessionId": session_id}
+        if completed:
+            try:
+                done.update(save_batch(user_id, token, session_id, model, completed))
+            except Exception as e:
+                logger.error("❌ Batch save failed: %s", e)
+                done["error"] = f"Failed to save conversation: {str(e)}"
+        logger.info("✅ Batch finished for user %s: %d/%d items", user_id, len(completed), total)
+        yield line(done)
+
+    return Response(stream(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+# ---------------- Context Prefetch ----------------
+def run_prefetch(user_id, token, session_id):
+    """Fetch a session's history into the cache (unless fresh) and bring its index up to date"""
+    try:
+        with timed("prefetch"):
+            messages = session_messages.peek(user_id, session_id, min_remaining=SESSION_CACHE_TTL / 2)
+            if messages is None:
+                messages = fetch_session_messages(
+                    session_id=session_id,
+                    user_id=user_id,
+                    token=token,
+                    node_server_url=NODE_SERVER_URL,
+                    headers=node_headers(user_id, token),
+                    max_chars=SESSION_HISTORY_MAX_CHARS
+                )
+                if messages:
+                    session_messages.put(user_id, session_id, messages)
+            if messages:
+                added = semantic_engine.warm_session(session_id, messages)
+                logger.debug("🔮 Prefetched session %s: %d messages, %d rows embedded",
+                             session_id, len(messages), added)
+    except Exception as e:
+        logger.warning("⚠️ Prefetch of session %s failed: %s", session_id, e)
+    finally:
+        with _prefetching_lock:
+            _prefetching.discard((user_id, session_id))
+
+
+@app.route("/api/chat/prefetch", methods=["POST"])
+@authenticate_token
+def prefetch_context():
+    """
+    Warm a session's context while the user is typing (or has just opened it),
+    so the next chat turn only encodes the query and scores it.
+    Accepts: {"sessionId": ...}. Returns at once; the work runs in the background.
+    """
+    user_id = request.user.get("id")
+    session_id = (request.get_json(silent=True) or {}).get("sessionId")
+    if not session_id or session_id in ["null", "undefined"]:
+        return jsonify({"error": "Missing sessionId"}), 400
+    if not semantic_engine or not ENABLE_SEMANTIC_SEARCH:
+        return jsonify({"status": "disabled"}), 200
+
+    key = (user_id, session_id)
+    with _prefetching_lock:
+        if key in _prefetching:
+            return jsonify({"status": "pending"}), 202
+        if len(_prefetching) >= PREFETCH_MAX_PENDING:
+            return jsonify({"status": "skipped"}), 200
+        _prefetching.add(key)
+    prefetch_executor.submit(run_prefetch, user_id, request.token, session_id)
+    return jsonify({"status": "scheduled"}), 202
+
+
 # ---------------- Regular Chat Handler ----------------
 @app.route("/api/chat", methods=["POST"])
 @authenticate_token
+@traced("handle_message")
 def handle_message():
     try:
         user_id = request.user.get("id")
@@ -530,7 +1278,7 @@ def handle_message():
         if not message or not user_id:
             return jsonify({"error": "Missing message or userId"}), 400
 
-        print(f"💬 Processing message for user {user_id}, session {session_id}, isEdit={is_edit}")
+        logger.info("💬 Processing message for user %s, session %s, isEdit=%s", user_id, session_id, is_edit)
 
         enhanced_message = message
         if use_context and ENABLE_SEMANTIC_SEARCH and not is_edit:
@@ -542,50 +1290,45 @@ def handle_message():
             )
             
             if enhanced_message != message:
-                print(f"   ✨ Enhanced with context ({len(enhanced_message)} chars)")
+                logger.debug("   ✨ Enhanced with context (%d chars)", len(enhanced_message))
 
-        bot_reply = generate_bot_response(enhanced_message, model)
-
-        auth_header = request.headers.get("Authorization")
-        if auth_header and not auth_header.startswith("Bearer "):
-            auth_header = f"Bearer {auth_header}"
+        bot_reply = generate_bot_response(enhanced_message, model, user_id=user_id)
 
         try:
-            node_response = requests.post(
-                f"{NODE_SERVER_URL}/api/conversation/save",
-                json={
-                    "userId": user_id,
-                    "sessionId": session_id,
-                    "userMessage": message,
-                    "botMessage": bot_reply,
-                    "model": model,
-                    "isEdit": is_edit
-                },
-                headers={
-                    "Authorization": auth_header,
-                    "Content-Type": "application/json"
-                },
-                timeout=10
-            )
-
-            if not node_response.ok:
-                raise Exception(f"Failed to save to MongoDB: {node_response.status_code}")
-
-            saved_data = node_response.json()
-
+            saved = save_turns(user_id, token, session_id, model, [{
+                "userMessage": message,
+                "botMessage": bot_reply,
+                "isEdit": is_edit
+            }])[0]
         except Exception as e:
             raise Exception(f"Failed to save conversation: {str(e)}")
 
         return jsonify({
-            "session": saved_data.get("session"),
+            **saved_turn_response(saved),
             "botReply": bot_reply,
-            "contextUsed": enhanced_message != message
+            "contextUsed": enhanced_message != message,
+            "queue": g.get("model_queue")
         }), 200
 
+    except ModelRouterError as e:
+        return model_router_error_response(e)
     except Exception as e:
-        print(f"❌ handle_message error: {e}")
+        logger.error("❌ handle_message error: %s", e)
         return jsonify({"error": str(e)}), 500
 
+# ---------------- Queue Status ----------------
+@app.route("/api/queue", methods=["GET"])
+@authenticate_token
+def queue_status():
+    """Live queue positions of the caller's model calls still waiting for a slot"""
+    return jsonify({"waiting": fair_scheduler.queue_status(request.user.get("id"))}), 200
+
+
+# ---------------- Metrics ----------------
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 # ---------------- Health Check ----------------
 @app.route("/health", methods=["GET"])
 def health():
@@ -593,13 +1336,17 @@ def health():
         "status": "healthy", 
         "service": "Flask Chat Server",
         "semantic_search": "enabled" if semantic_engine else "disabled",
-        "file_upload": "enabled"
+        "file_upload": "enabled",
+        "model_router": model_router.snapshot(),
+        "scheduler": fair_scheduler.snapshot(),
+        "precompute_queue": precompute_queue.stats() if precompute_queue else "disabled",
+        "session_cache": session_messages.stats()
     }), 200
 
 # ---------------- Main ----------------
 if __name__ == "__main__":
     port = int(os.getenv("FLASK_PORT", 5001))
-    print(f"🚀 Flask Chat Server starting on port {port}...")
-    print(f"🔍 Semantic Search: {'Enabled' if ENABLE_SEMANTIC_SEARCH and semantic_engine else 'Disabled'}")
-    print(f"📎 File Upload: Enabled (PDF, DOCX, TXT)")
+    logger.info("🚀 Flask Chat Server starting on port %d...", port)
+    logger.info("🔍 Semantic Search: %s", 'Enabled' if ENABLE_SEMANTIC_SEARCH and semantic_engine else 'Disabled')
+    logger.info("📎 File Upload: Enabled (PDF, DOCX, TXT)")
     app.run(host="0.0.0.0", port=port, debug=True, threaded=True)
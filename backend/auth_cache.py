@@ -0,0 +1,145 @@
+"""
+Auth Cache Module for LawGPT
+Bounded cache of verified JWT claims (expiring with the token's `exp`) and
+signing of short-lived service assertions for calls to the Node.js server.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import jwt
+
+from metrics import registry
+
+AUTH_CACHE = registry.counter(
+    "lawgpt_auth_cache_total",
+    "Token verifications served from the verified-claims cache (hit) or by jwt.decode (miss)",
+    ["result"]
+)
+
+SERVICE_ASSERTION_HEADER = "X-Service-Assertion"
+SERVICE_ISSUER = "lawgpt-flask"
+SERVICE_AUDIENCE = "lawgpt-node"
+
+
+class VerifiedTokenCache:
+    """
+    LRU of {sha256(token): (claims, expires_at)}.
+
+    Only tokens that passed jwt.decode are stored. An entry expires at the
+    token's `exp` (capped at `max_ttl` seconds from caching, which also
+    applies to tokens without `exp`), so a cached token never outlives
+    its own validity. The raw token is not kept.
+
+    Args:
+        secret: HS256 signing secret
+        max_entries: Bound on cached tokens
+        max_ttl: Longest time an entry is trusted without re-verification
+    """
+
+    def __init__(self, secret: str, max_entries: int = 10000, max_ttl: float = 3600.0):
+        self.secret = secret
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def decode(self, token: str) -> Dict:
+        """
+        Verified claims of a token, from the cache or by jwt.decode.
+
+        Raises:
+            jwt.ExpiredSignatureError, jwt.InvalidTokenError: As jwt.decode
+        """
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    AUTH_CACHE.inc(result="hit")
+                    return claims
+                del self._entries[key]
+
+        AUTH_CACHE.inc(result="miss")
+        claims = jwt.decode(token, self.secret, algorithms=["HS256"])
+
+        expires_at = now + self.max_ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        not_before = claims.get("nbf")
+        if expires_at > now and (not_before is None or float(not_before) <= now):
+            with self._lock:
+                self._entries[key] = (claims, expires_at)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return claims
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ServiceAssertionSigner:
+    """
+    Signs short-lived HS256 assertions ("this request acts for user X") with
+    a secret shared only between the Flask and Node servers. Node verifies
+    the assertion instead of re-verifying the user's token and re-loading
+    the user. Assertions are reused per user until `reuse_margin` seconds
+    before they expire.
+
+    Args:
+        secret: Shared internal secret (INTERNAL_SERVICE_SECRET)
+        ttl: Assertion lifetime in seconds
+        reuse_margin: Re-sign when fewer seconds than this remain
+    """
+
+    def __init__(self, secret: str, ttl: float = 120.0, reuse_margin: float = 30.0):
+        self.secret = secret
+        self.ttl = ttl
+        self.reuse_margin = reuse_margin
+        self._assertions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def assertion(self, user_id: str) -> str:
+        user_id = str(user_id)
+        now = time.time()
+        with self._lock:
+            cached = self._assertions.get(user_id)
+            if cached and cached[1] - now > self.reuse_margin:
+                return cached[0]
+        issued = int(now)
+        expires = issued + int(self.ttl)
+        token = jwt.encode(
+            {"sub": user_id, "iss": SERVICE_ISSUER, "aud": SERVICE_AUDIENCE, "iat": issued, "exp": expires},
+            self.secret,
+            algorithm="HS256"
+        )
+        with self._lock:
+            if len(self._assertions) > 10000:
+                self._assertions = {u: a for u, a in self._assertions.items() if a[1] > now}
+            self._assertions[user_id] = (token, expires)
+        return token
+
+
+def node_auth_headers(user_id: Optional[str], token: Optional[str],
+                      signer: Optional[ServiceAssertionSigner] = None) -> Dict[str, str]:
+    """
+    Headers authenticating a call to the Node.js server: a service assertion
+    when a signer is configured, otherwise the user's own bearer token.
+    """
+    headers = {"Content-Type": "application/json"}
+    if signer is not None and user_id:
+        headers[SERVICE_ASSERTION_HEADER] = signer.assertion(user_id)
+    elif token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
@@ -0,0 +1,66 @@
+"""
+Benchmark: per-request auth overhead
+Compares jwt.decode on every request (the old authenticate_token) against
+the verified-claims cache, and signing a service assertion for the Node hop
+against reusing the per-user cached one.
+
+Usage (from backend/):
+    python -m benchmarks.bench_auth --requests 100000 --users 1000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth_cache import VerifiedTokenCache, ServiceAssertionSigner
+
+SECRET = "bench_secret_key_bench_secret_key"
+
+
+def per_call_us(fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+
+    now = int(time.time())
+    tokens = [
+        jwt.encode({"id": f"user{i}", "email": f"user{i}@example.com", "iat": now, "exp": now + 3600},
+                   SECRET, algorithm="HS256")
+        for i in range(args.users)
+    ]
+    rng = random.Random(0)
+    stream = [(tokens[rng.randrange(args.users)],) for _ in range(args.requests)]
+
+    cache = VerifiedTokenCache(SECRET, max_entries=args.users * 2)
+    signer = ServiceAssertionSigner(SECRET + "_internal")
+    users = [(f"user{rng.randrange(args.users)}",) for _ in range(args.requests)]
+
+    results = [
+        ("jwt.decode per request", per_call_us(lambda t: jwt.decode(t, SECRET, algorithms=["HS256"]), stream)),
+        ("verified-claims cache", per_call_us(cache.decode, stream)),
+        ("sign assertion per call", per_call_us(
+            lambda u: jwt.encode({"sub": u, "exp": now + 120}, SECRET, algorithm="HS256"), users)),
+        ("cached assertion", per_call_us(signer.assertion, users)),
+    ]
+    print(f"🔐 Auth overhead: {args.requests:,} requests over {args.users:,} users")
+    print(f"{'path':<28}{'us/request':>12}")
+    for name, us in results:
+        print(f"{name:<28}{us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
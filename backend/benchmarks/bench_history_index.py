@@ -0,0 +1,117 @@
+"""
+Benchmark: cross-session history index (IVF) vs brute force
+Reports build time, query latency (p50/p95) and recall@k against exact
+cosine search on synthetic clustered 384-dim embeddings (MiniLM-sized),
+for float32 lists and for int8 / binary codes with float rescoring, plus the
+memory each index keeps resident (the rescoring vectors are memory-mapped).
+
+Usage (from backend/):
+    python -m benchmarks.bench_history_index --n 1000000 --queries 200 --quantization none binary
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex, _normalize
+
+
+def synthetic_embeddings(n, dim, topics, seed=0):
+    """Messages cluster around conversation topics, like real chat history"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dim)).astype(np.float32)
+    data = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        stop = min(n, start + 100_000)
+        labels = rng.integers(0, topics, size=stop - start)
+        data[start:stop] = centers[labels] + 0.6 * rng.normal(size=(stop - start, dim)).astype(np.float32)
+    return _normalize(data), centers
+
+
+def percentile_ms(samples, pct):
+    return float(np.percentile(np.array(samples) * 1000, pct))
+
+
+def resident_bytes(index):
+    """Bytes of the inverted lists (vectors or codes, scales, ids) held in memory"""
+    return sum(
+        lst.vectors.nbytes + lst.ids.nbytes + (lst.scales.nbytes if lst.scales is not None else 0)
+        for lst in index.lists
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200_000, help="Indexed messages")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=50_000, help="Incremental add batch size")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--quantization", nargs="+", default=["none", "int8", "binary"],
+                        choices=["none", "int8", "binary"])
+    parser.add_argument("--rescore-factor", type=int, default=30, help="Shortlist size as a multiple of k")
+    args = parser.parse_args()
+
+    print(f"📊 History index benchmark: {args.n:,} x {args.dim} float32, k={args.k}")
+    data, centers = synthetic_embeddings(args.n, args.dim, args.topics)
+    rng = np.random.default_rng(1)
+    queries = _normalize(data[rng.integers(0, args.n, size=args.queries)]
+                         + 0.02 * rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+
+    workdir = tempfile.TemporaryDirectory()
+    indexes = {}
+    for quantization in args.quantization:
+        index = IVFIndex(args.dim, quantization=quantization, rescore_factor=args.rescore_factor,
+                         vectors_path=os.path.join(workdir.name, f"{quantization}.f32"))
+        start = time.perf_counter()
+        for offset in range(0, args.n, args.batch):
+            index.add(data[offset:offset + args.batch])
+        build = time.perf_counter() - start
+        indexes[quantization] = index
+        print(f"   {quantization}: build (incremental, batches of {args.batch:,}) {build:.1f}s, "
+              f"{len(index.lists):,} lists")
+
+    print(f"{'quantization':<14}{'resident MB':>13}{'bytes/vector':>14}{'mmap file MB':>14}{'saving':>9}")
+    # Savings are against the float32 index as measured (list growth slack included), else its nominal size
+    baseline = resident_bytes(indexes["none"]) if "none" in indexes else args.n * (args.dim * 4 + 8)
+    for quantization, index in indexes.items():
+        resident = resident_bytes(index)
+        mapped = os.path.getsize(index.vector_file.path) if index.vector_file is not None else 0
+        print(f"{quantization:<14}{resident / 2**20:>13.1f}{resident / args.n:>14.1f}"
+              f"{mapped / 2**20:>14.1f}{baseline / resident:>8.1f}x")
+
+    # Exact baseline
+    truth, brute_times = [], []
+    for q in queries:
+        t = time.perf_counter()
+        scores = data @ q
+        top = np.argpartition(-scores, args.k - 1)[:args.k]
+        brute_times.append(time.perf_counter() - t)
+        truth.append(set(top.tolist()))
+
+    print(f"{'method':<24}{'p50 ms':>10}{'p95 ms':>10}{'recall@' + str(args.k):>12}")
+    print(f"{'brute force':<24}{percentile_ms(brute_times, 50):>10.2f}{percentile_ms(brute_times, 95):>10.2f}{1.0:>12.3f}")
+    for quantization, index in indexes.items():
+        for nprobe in args.nprobe:
+            times, hits = [], 0
+            for q, expected in zip(queries, truth):
+                t = time.perf_counter()
+                _, ids = index.search(q, k=args.k, nprobe=nprobe)
+                times.append(time.perf_counter() - t)
+                hits += len(expected & set(ids.tolist()))
+            recall = hits / (args.k * len(queries))
+            print(f"{quantization + ' nprobe=' + str(nprobe):<24}{percentile_ms(times, 50):>10.2f}"
+                  f"{percentile_ms(times, 95):>10.2f}{recall:>12.3f}")
+    workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
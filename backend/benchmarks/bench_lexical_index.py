@@ -0,0 +1,65 @@
+"""
+Benchmark: BM25 inverted index query latency vs history size
+Query cost follows the posting lists of the query terms (pruned by MaxScore and
+capped per term), not the number of indexed messages, so latency should stay
+bounded as the history grows.
+
+Usage (from backend/):
+    python -m benchmarks.bench_lexical_index --sizes 1000 10000 100000 1000000 --k 10
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import BM25Index
+
+WORDS = ("contract party breach damages notice court appeal claim liability tenant landlord "
+         "employer employee statute remedy evidence witness hearing filing motion order").split()
+
+
+def synthetic_message(rng):
+    words = rng.choices(WORDS, k=rng.randint(8, 40))
+    if rng.random() < 0.05:
+        words.append(f"section {rng.randint(1, 500)}({rng.choice('abcdef')})")
+    if rng.random() < 0.02:
+        words.append(f"{rng.randint(100, 600)} U.S. {rng.randint(1, 999)}")
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [f"what does section {rng.randint(1, 500)}({rng.choice('abcdef')}) say" for _ in range(args.queries)]
+
+    print(f"{'messages':>10}{'add us/msg':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for size in args.sizes:
+        index = BM25Index()
+        messages = [synthetic_message(rng) for _ in range(size)]
+        start = time.perf_counter()
+        for message in messages:
+            index.add(message)
+        add_us = (time.perf_counter() - start) / size * 1e6
+
+        times = []
+        for query in queries:
+            t = time.perf_counter()
+            index.search(query, k=args.k)
+            times.append(time.perf_counter() - t)
+        times_ms = np.array(times) * 1000
+        print(f"{size:>10,}{add_us:>12.1f}{np.percentile(times_ms, 50):>10.3f}{np.percentile(times_ms, 95):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: saving a chat turn to the Node.js server
+Compares the old full-session round-trip (POST /api/conversation/save, which
+echoes the whole session and is relayed to the client) with the append-only
+contract through the coalescing ConversationWriter, against the fake Node
+server. Reports save latency, bytes received from Node, chat response bytes
+and Node requests made.
+
+Usage (from backend/):
+    python -m benchmarks.bench_node_save --turns 200 --concurrency 8 --messages-per-session 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_servers import FakeConfig, filler_text, start_fake_server
+from conversation_writer import ConversationWriter
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def run(turns, concurrency, save_turn):
+    """Save `turns` turns from `concurrency` threads; returns (latencies, node bytes, response bytes)"""
+    def one(i):
+        start = time.perf_counter()
+        node_bytes, response_bytes = save_turn(i)
+        return time.perf_counter() - start, node_bytes, response_bytes
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(turns)))
+    return [r[0] for r in results], sum(r[1] for r in results), sum(r[2] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent turns (one user, e.g. a batch)")
+    parser.add_argument("--node-latency-ms", type=float, default=20.0)
+    parser.add_argument("--messages-per-session", type=int, default=200)
+    parser.add_argument("--message-bytes", type=int, default=300)
+    parser.add_argument("--reply-bytes", type=int, default=1500)
+    args = parser.parse_args()
+
+    config = FakeConfig(node_latency_ms=args.node_latency_ms, sessions=2,
+                        messages_per_session=args.messages_per_session, message_bytes=args.message_bytes)
+    server, url = start_fake_server(config)
+    reply = filler_text(args.reply_bytes, seed=1)
+    headers = {"Content-Type": "application/json"}
+
+    def full_session_save(i):
+        response = requests.post(f"{url}/api/conversation/save", headers=headers, timeout=30, json={
+            "userId": "bench-user", "sessionId": "session-0", "userMessage": f"question {i}",
+            "botMessage": reply, "model": "LAWGPT-4",
+        })
+        session = response.json()["session"]
+        chat_response = json.dumps({"session": session, "botReply": reply, "contextUsed": False})
+        return len(response.content), len(chat_response)
+
+    writer = ConversationWriter(url, lambda user_id, token: headers)
+    node_requests = {"count": 0}
+    original_write = writer._write
+
+    def counting_write(user_id, batch):
+        node_requests["count"] += 1
+        return original_write(user_id, batch)
+
+    writer._write = counting_write
+
+    def append_save(i):
+        saved = writer.save("bench-user", None, [{
+            "userId": "bench-user", "sessionId": "session-1", "userMessage": f"question {i}",
+            "botMessage": reply, "model": "LAWGPT-4",
+        }])[0]
+        chat_response = json.dumps({
+            "sessionId": saved["sessionId"], "title": saved["title"],
+            "messageIds": {"user": saved["messageIds"][0], "bot": saved["messageIds"][-1]},
+            "timestamp": saved["timestamp"], "botReply": reply, "contextUsed": False,
+        })
+        return len(json.dumps(saved)), len(chat_response)
+
+    print(f"💾 Node save: {args.turns} turns, concurrency {args.concurrency}, "
+          f"sessions start at {args.messages_per_session} messages, Node latency {args.node_latency_ms:.0f}ms")
+    print(f"{'path':<22}{'p50 ms':>9}{'p95 ms':>9}{'KB from Node/turn':>19}{'KB response/turn':>18}{'Node reqs':>11}")
+    for name, save_turn in (("full-session save", full_session_save), ("append + coalescing", append_save)):
+        node_requests["count"] = 0
+        latencies, node_bytes, response_bytes = run(args.turns, args.concurrency, save_turn)
+        requests_made = args.turns if save_turn is full_session_save else node_requests["count"]
+        print(f"{name:<22}{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+              f"{node_bytes / args.turns / 1024:>19.1f}{response_bytes / args.turns / 1024:>18.1f}{requests_made:>11}")
+
+    writer.stop()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: overhead of request tracing and stack sampling
+Per-call cost of @traced / timed() with no active trace (profiling off or the
+request not picked) against an undecorated call, then the latency of a
+synthetic chat request (JSON parse, embedding-sized numpy work, a simulated
+model call) unprofiled vs profiled at the given sample interval. The last
+profile is written to a temporary directory and its heaviest stacks and
+spans are printed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_profiling --requests 200 --interval-ms 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import timed, traced
+from profiling import RequestProfiler
+
+
+def plain(x):
+    return x + 1
+
+
+@traced("bench")
+def decorated(x):
+    return x + 1
+
+
+def per_call_ns(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def timed_call(x):
+    with timed("bench"):
+        return x + 1
+
+
+@traced("fetch_session_messages")
+def fetch(payload):
+    with timed("session_fetch"):
+        return json.loads(payload)
+
+
+@traced("build_semantic_context")
+def build_context(messages, matrix):
+    messages = fetch(messages)
+    with timed("embedding"):
+        scores = matrix @ matrix[0]
+    with timed("similarity"):
+        top = np.argsort(-scores)[:5]
+    return [messages[int(i) % len(messages)] for i in top]
+
+
+@traced("generate_bot_response")
+def generate(model_ms):
+    with timed("model_call"):
+        time.sleep(model_ms / 1000.0)
+    return "reply"
+
+
+@traced("handle_message")
+def handle_message(payload, matrix, model_ms):
+    build_context(payload, matrix)
+    return generate(model_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=1_000_000, help="Calls for the per-call overhead")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages in the parsed session payload")
+    parser.add_argument("--model-ms", type=float, default=20.0, help="Simulated model call latency")
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    logging.getLogger("lawgpt.profiling").setLevel(logging.WARNING)
+
+    print(f"🔬 Profiling overhead: {args.calls:,} calls, {args.requests} requests, "
+          f"sampling every {args.interval_ms:g} ms")
+    print(f"{'call (no active trace)':<34}{'ns/call':>10}")
+    for name, fn in (("plain function", plain), ("@traced", decorated), ("with timed()", timed_call)):
+        print(f"{name:<34}{per_call_ns(fn, args.calls):>10.0f}")
+
+    payload = json.dumps([{"sender": "user", "message": "clause " * 40, "_id": str(i)} for i in range(args.messages)])
+    matrix = np.random.default_rng(0).standard_normal((args.messages, 384)).astype(np.float32)
+    directory = tempfile.TemporaryDirectory()
+    profiler = RequestProfiler(directory.name, interval=args.interval_ms / 1000.0)
+
+    def unprofiled():
+        handle_message(payload, matrix, args.model_ms)
+
+    def profiled():
+        request = profiler.begin("/api/chat", "POST", "1")
+        handle_message(payload, matrix, args.model_ms)
+        return profiler.end(request, 200)
+
+    print(f"{'request':<34}{'p50 ms':>10}{'p95 ms':>10}")
+    path = None
+    for name, run in (("unprofiled", unprofiled), ("profiled (trace + sampler)", profiled)):
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            path = run() or path
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<34}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}")
+
+    print(f"   last profile: {os.path.basename(path)}")
+    with open(path, encoding="utf-8") as profile_file:
+        stacks = [line.rsplit(" ", 1) for line in profile_file.read().splitlines()]
+    for stack, samples in stacks[:3]:
+        print(f"   {samples:>5} samples  ...{';'.join(stack.split(';')[-3:])}")
+    with open(path[:-len(".collapsed")] + ".trace.json", encoding="utf-8") as trace_file:
+        for span in json.load(trace_file)["spans"]:
+            print(f"   {span['startMs']:>8.2f} ms  {span['durationMs']:>8.2f} ms  {span['path']}")
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
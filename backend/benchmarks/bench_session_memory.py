@@ -0,0 +1,112 @@
+"""
+Benchmark: memory of fetching and ranking a very long session
+Peak Python/numpy allocation (tracemalloc) and latency of
+  - fetch_session_messages: whole-payload json vs streaming ijson parse
+  - get_relevant_messages: cached session index vs windowed (block + top-k heap)
+against the fake Node server, plus overlap of the two rankings' results.
+The engine skips loading the embedding model (deterministic pseudo-embeddings),
+so the numbers cover the retrieval path only.
+
+Usage (from backend/):
+    python -m benchmarks.bench_session_memory --sessions 10 --messages-per-session 20000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import semantic_search
+from benchmarks.fake_servers import FakeConfig, start_fake_server
+from ranking import RankingPipeline
+from semantic_search import SemanticSearchEngine, fetch_session_messages
+from session_index import SessionIndexCache
+
+
+class PseudoEmbeddingEngine(SemanticSearchEngine):
+    """SemanticSearchEngine with a hash-seeded encoder instead of the model"""
+
+    def __init__(self, dim=384, windowed_min_chars=None, block_size=256):
+        self.dim = dim
+        self.index_documents = True
+        self.session_indexes = SessionIndexCache(dim, 4)
+        self.windowed_min_chars = windowed_min_chars
+        self.block_size = block_size
+        self.embedding_store = None
+
+    def encode_messages(self, messages):
+        return np.stack([
+            np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.dim, dtype=np.float32)
+            for text in messages
+        ]) if messages else np.array([])
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--messages-per-session", type=int, default=20_000)
+    parser.add_argument("--message-bytes", type=int, default=300)
+    parser.add_argument("--max-chars", type=int, default=None, help="History cap passed to the fetch")
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    config = FakeConfig(node_latency_ms=0, sessions=args.sessions,
+                        messages_per_session=args.messages_per_session, message_bytes=args.message_bytes)
+    server, url = start_fake_server(config)
+    payload_mb = len(config.sessions_payload()) / 2**20
+    print(f"🪟 Session memory: {args.sessions} sessions x {args.messages_per_session:,} messages "
+          f"({payload_mb:.0f} MB payload), fetching session-0")
+    print(f"{'stage':<34}{'peak MB':>10}{'seconds':>10}")
+
+    def fetch():
+        return fetch_session_messages("session-0", "bench-user", "token", url, timeout=120,
+                                      max_chars=args.max_chars)
+
+    streaming = semantic_search.ijson
+    semantic_search.ijson = None
+    _, elapsed, peak = measure(fetch)
+    print(f"{'fetch: parse whole payload':<34}{peak / 2**20:>10.1f}{elapsed:>10.2f}")
+    if streaming is not None:
+        semantic_search.ijson = streaming
+        messages, elapsed, peak = measure(fetch)
+        print(f"{'fetch: streaming (ijson)':<34}{peak / 2**20:>10.1f}{elapsed:>10.2f}")
+    else:
+        messages = fetch()
+        print("   (ijson not installed: streaming fetch skipped)")
+
+    query = messages[len(messages) // 2]["message"][:120]
+    pipeline = RankingPipeline.default(0.3)
+    results = {}
+    for name, engine in (("rank: cached session index", PseudoEmbeddingEngine()),
+                         ("rank: windowed blocks + heap", PseudoEmbeddingEngine(windowed_min_chars=0,
+                                                                               block_size=args.block_size))):
+        found, elapsed, peak = measure(lambda: engine.get_relevant_messages(
+            query, messages, top_n=args.top_n, session_id="session-0", pipeline=pipeline
+        ))
+        results[name] = [msg.get("_id") for msg in found]
+        print(f"{name:<34}{peak / 2**20:>10.1f}{elapsed:>10.2f}")
+
+    cached, windowed = results.values()
+    print(f"   top-{args.top_n} overlap: {len(set(cached) & set(windowed))}/{args.top_n}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Local stand-ins for the model endpoints and the Node.js server
+Lets the Flask service run end-to-end without GPU hosts or MongoDB.
+
+Serves:
+    POST /generate                  -> {"response": ...}
+    POST /generate_from_ids         -> {"generated_text": ...}
+    GET  /api/conversation          -> list of sessions for the user
+    POST /api/conversation/save     -> {"session": {...}} (whole session, as the real route)
+    POST /api/conversation/append   -> {"results": [{sessionId, title, messageIds, ...}]}
+
+Usage (from backend/):
+    python -m benchmarks.fake_servers --port 5900 --model-latency-ms 800 --response-bytes 2000
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeConfig:
+    """Tunable behaviour shared by all handler threads"""
+
+    def __init__(self, model_latency_ms=500.0, model_jitter_ms=0.0, node_latency_ms=20.0,
+                 response_bytes=1500, sessions=5, messages_per_session=40, message_bytes=300):
+        self.model_latency_ms = model_latency_ms
+        self.model_jitter_ms = model_jitter_ms
+        self.node_latency_ms = node_latency_ms
+        self.response_bytes = response_bytes
+        self.sessions = sessions
+        self.messages_per_session = messages_per_session
+        self.message_bytes = message_bytes
+        self._sessions_payload = None
+        self._stored = None
+        self._lock = threading.Lock()
+
+    def model_delay(self):
+        jitter = random.uniform(-self.model_jitter_ms, self.model_jitter_ms) if self.model_jitter_ms else 0.0
+        return max(0.0, self.model_latency_ms + jitter) / 1000.0
+
+    def sessions_payload(self):
+        """Pre-rendered GET /api/conversation body; the session ids are session-0..N-1"""
+        with self._lock:
+            if self._sessions_payload is None:
+                self._sessions_payload = json.dumps(build_sessions(
+                    self.sessions, self.messages_per_session, self.message_bytes
+                )).encode("utf-8")
+            return self._sessions_payload
+
+    def append_to_stored(self, session_id, messages):
+        """
+        Add messages to the in-memory copy of a session (seeded like GET
+        /api/conversation, or created) and return that session.
+        """
+        with self._lock:
+            if self._stored is None:
+                self._stored = {
+                    session["_id"]: session
+                    for session in build_sessions(self.sessions, self.messages_per_session, self.message_bytes)
+                }
+            session = self._stored.get(session_id)
+            if session is None:
+                now = datetime.now(timezone.utc).isoformat()
+                session_id = session_id or f"session-{time.time_ns()}"
+                session = self._stored[session_id] = {
+                    "_id": session_id, "title": "Benchmark session", "messages": [],
+                    "createdAt": now, "updatedAt": now,
+                }
+            session["messages"].extend(messages)
+            return dict(session, messages=list(session["messages"]))
+
+
+WORDS = ("indemnity cap liability clause section lessee lessor agreement breach termination "
+         "warranty notice arbitration jurisdiction damages party obligation consideration").split()
+
+
+def filler_text(n_bytes, seed=0):
+    rng = random.Random(seed)
+    words = []
+    size = 0
+    while size < n_bytes:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:n_bytes]
+
+
+def _new_turn_messages(turn, timestamp):
+    messages = [] if turn.get("isEdit") else [
+        {"_id": f"msg-{time.time_ns()}-u", "sender": "user",
+         "message": turn.get("userMessage", ""), "timestamp": timestamp,
+         **({"fileMetadata": turn["fileMetadata"]} if turn.get("fileMetadata") else {})}
+    ]
+    messages.append({"_id": f"msg-{time.time_ns()}-b", "sender": "bot",
+                     "message": turn.get("botMessage", ""), "timestamp": timestamp})
+    return messages
+
+
+def build_sessions(n_sessions, messages_per_session, message_bytes):
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    sessions = []
+    for s in range(n_sessions):
+        messages = []
+        for m in range(messages_per_session):
+            messages.append({
+                "_id": f"msg-{s}-{m}",
+                "sender": "user" if m % 2 == 0 else "bot",
+                "message": filler_text(message_bytes, seed=s * 100003 + m),
+                "timestamp": (start + timedelta(minutes=s * 1000 + m)).isoformat(),
+            })
+        sessions.append({
+            "_id": f"session-{s}",
+            "title": f"Benchmark session {s}",
+            "messages": messages,
+            "createdAt": start.isoformat(),
+            "updatedAt": start.isoformat(),
+        })
+    return sessions
+
+
+def make_handler(config):
+    class FakeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except ConnectionResetError:
+                pass  # Streaming clients close the connection without reading to the end
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            return json.loads(body) if body else {}
+
+        def _send(self, status, payload):
+            body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # A streaming client stops reading once it has the session it wanted
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/api/conversation":
+                time.sleep(config.node_latency_ms / 1000.0)
+                return self._send(200, config.sessions_payload())
+            return self._send(404, {"error": "Not found"})
+
+        def do_POST(self):
+            data = self._read_json()
+            path = self.path.rstrip("/")
+            if path == "/generate":
+                time.sleep(config.model_delay())
+                return self._send(200, {"response": filler_text(config.response_bytes)})
+            if path == "/generate_from_ids":
+                time.sleep(config.model_delay())
+                # Real endpoint echoes the prompt before the generated text
+                return self._send(200, {"generated_text": filler_text(config.response_bytes)})
+            if path == "/api/conversation/save":
+                time.sleep(config.node_latency_ms / 1000.0)
+                now = datetime.now(timezone.utc).isoformat()
+                session = config.append_to_stored(data.get("sessionId"), _new_turn_messages(data, now))
+                return self._send(200, {"session": session})
+            if path == "/api/conversation/append":
+                time.sleep(config.node_latency_ms / 1000.0)
+                now = datetime.now(timezone.utc).isoformat()
+                results = []
+                for turn in data.get("appends", []):
+                    messages = _new_turn_messages(turn, now)
+                    session = config.append_to_stored(turn.get("sessionId"), messages)
+                    results.append({
+                        "sessionId": session["_id"], "title": session["title"],
+                        "created": not turn.get("sessionId"),
+                        "messageIds": [msg["_id"] for msg in messages], "timestamp": now,
+                    })
+                return self._send(200, {"results": results})
+            return self._send(404, {"error": "Not found"})
+
+    return FakeHandler
+
+
+def start_fake_server(config, host="127.0.0.1", port=0):
+    """
+    Start the fake model + Node server on a daemon thread.
+
+    Args:
+        config: FakeConfig
+        host: Bind address
+        port: Bind port (0 picks a free port)
+
+    Returns:
+        (ThreadingHTTPServer, base_url)
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--model-latency-ms", type=float, default=500.0)
+    parser.add_argument("--model-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--node-latency-ms", type=float, default=20.0)
+    parser.add_argument("--response-bytes", type=int, default=1500)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--messages-per-session", type=int, default=40)
+    parser.add_argument("--message-bytes", type=int, default=300)
+
+
+def config_from_args(args):
+    return FakeConfig(
+        model_latency_ms=args.model_latency_ms,
+        model_jitter_ms=args.model_jitter_ms,
+        node_latency_ms=args.node_latency_ms,
+        response_bytes=args.response_bytes,
+        sessions=args.sessions,
+        messages_per_session=args.messages_per_session,
+        message_bytes=args.message_bytes,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_fake_server(config_from_args(args), args.host, args.port)
+    print(f"🧪 Fake model/Node server listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
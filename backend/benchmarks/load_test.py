@@ -0,0 +1,303 @@
+"""
+Load test for the Flask chat service against local model/Node stand-ins
+Reports p50/p95/p99 latency, throughput and server RSS per scenario.
+
+By default the script starts the fake model + Node server in-process and the
+Flask app as a subprocess pointed at it, so no GPU host or MongoDB is needed.
+Pass --target to hit an already-running service instead (RSS is then only
+reported if --server-pid is given).
+
+Usage (from backend/):
+    python -m benchmarks.load_test --scenario all --concurrency 16 --requests 200
+    python -m benchmarks.load_test --scenario chat --duration 30 --model-latency-ms 1500 --json out.json
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import jwt
+import requests
+
+from benchmarks.fake_servers import (
+    add_config_arguments, config_from_args, filler_text, start_fake_server
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("chat", "upload", "with-file")
+
+
+# ---------------- Process memory ----------------
+def read_rss_bytes(pid):
+    """Resident set size of a process, via psutil when installed, else /proc"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    """Samples a process's RSS on a background thread and keeps the peak"""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = read_rss_bytes(self.pid)
+            if rss:
+                self.last = rss
+                self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------------- Flask app under test ----------------
+def start_app(port, fake_url, jwt_secret, extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "FLASK_PORT": str(port),
+        "NODE_SERVER_URL": fake_url,
+        "JWT_SECRET": jwt_secret,
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "MODEL_ENDPOINTS": json.dumps({
+            "LAWGPT-4": f"{fake_url}/generate",
+            "LAWGPT-3.5": f"{fake_url}/generate_from_ids",
+            "LEGAL-PRO": f"{fake_url}/generate",
+            "CONTRACT-AI": f"{fake_url}/generate",
+            "LITASSIST": f"{fake_url}/generate",
+        }),
+    })
+    env.update(extra_env or {})
+    # Run without the debug reloader so the PID we sample is the serving process
+    process = subprocess.Popen(
+        [sys.executable, "-c",
+         f"from app import app; app.run(host='127.0.0.1', port={port}, debug=False, threaded=True)"],
+        cwd=BACKEND_DIR, env=env
+    )
+    return process
+
+
+def wait_until_healthy(base_url, timeout=300.0, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Flask app exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Flask app at {base_url} did not become healthy in {timeout}s")
+
+
+# ---------------- Scenarios ----------------
+def make_request_fn(scenario, base_url, token, args):
+    headers = {"Authorization": f"Bearer {token}"}
+    message = filler_text(args.message_chars, seed=7)
+    document = filler_text(args.document_bytes, seed=11)
+    session_id = "session-0" if args.use_context else None
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    if scenario == "chat":
+        def call():
+            return session().post(f"{base_url}/api/chat", headers=headers, timeout=args.timeout, json={
+                "message": message, "sessionId": session_id, "model": args.model,
+                "useContext": args.use_context,
+            })
+    elif scenario == "upload":
+        payload = document.encode("utf-8")
+
+        def call():
+            return session().post(f"{base_url}/api/chat/upload", headers=headers, timeout=args.timeout, data={
+                "message": message, "sessionId": session_id or "", "model": args.model,
+                "useContext": str(args.use_context).lower(),
+            }, files={"file": ("contract.txt", payload, "text/plain")})
+    elif scenario == "with-file":
+        def call():
+            return session().post(f"{base_url}/api/chat/with-file", headers=headers, timeout=args.timeout, json={
+                "message": message, "sessionId": session_id, "model": args.model,
+                "useContext": args.use_context,
+                "fileMetadata": {
+                    "fileName": "contract.txt", "fileType": "txt",
+                    "fileSize": len(document), "extractedText": document,
+                },
+            })
+    else:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    return call
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def run_scenario(scenario, base_url, token, args, server_pid=None):
+    call = make_request_fn(scenario, base_url, token, args)
+    latencies = []
+    errors = 0
+    response_bytes = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    remaining = [args.requests]
+
+    def next_ticket():
+        with lock:
+            if deadline is not None:
+                return time.monotonic() < deadline
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        nonlocal errors, response_bytes
+        while next_ticket():
+            start = time.perf_counter()
+            try:
+                response = call()
+                ok = response.ok
+                size = len(response.content)
+            except requests.RequestException:
+                ok, size = False, 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                response_bytes += size
+                if not ok:
+                    errors += 1
+
+    sampler = RssSampler(server_pid) if server_pid else None
+    started = time.perf_counter()
+    with sampler or nullcontext():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.concurrency):
+                pool.submit(worker)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_seconds": wall,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_response_bytes": response_bytes / len(latencies) if latencies else 0,
+        "peak_rss_mb": sampler.peak / 1024 / 1024 if sampler else None,
+        "end_rss_mb": sampler.last / 1024 / 1024 if sampler else None,
+    }
+
+
+def print_report(results):
+    header = f"{'scenario':<12}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'resp KB':>9}{'peak RSS MB':>13}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{r['scenario']:<12}{r['requests']:>7}{r['errors']:>6}{r['rps']:>9.2f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['mean_response_bytes'] / 1024:>9.1f}{rss:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per scenario")
+    parser.add_argument("--model", default="LAWGPT-4")
+    parser.add_argument("--use-context", action="store_true", help="Send sessionId so semantic context is built")
+    parser.add_argument("--message-chars", type=int, default=200)
+    parser.add_argument("--document-bytes", type=int, default=50_000)
+    parser.add_argument("--timeout", type=float, default=330.0)
+    parser.add_argument("--target", help="Base URL of a running service; skips starting the app and fakes")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --target")
+    parser.add_argument("--app-port", type=int, default=5901)
+    parser.add_argument("--fake-port", type=int, default=0)
+    parser.add_argument("--jwt-secret", default=os.getenv("JWT_SECRET", "your_jwt_secret_key"))
+    parser.add_argument("--user-id", default="000000000000000000000001")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    token = jwt.encode({"id": args.user_id, "exp": int(time.time()) + 24 * 3600}, args.jwt_secret, algorithm="HS256")
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    fake_server = app_process = None
+    server_pid = args.server_pid
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            fake_server, fake_url = start_fake_server(config_from_args(args), port=args.fake_port)
+            app_process = start_app(args.app_port, fake_url, args.jwt_secret)
+            server_pid = app_process.pid
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            print(f"🧪 Fakes at {fake_url}, app at {base_url} (pid {server_pid})")
+        wait_until_healthy(base_url, process=app_process)
+
+        results = []
+        for scenario in scenarios:
+            warmup = make_request_fn(scenario, base_url, token, args)
+            for _ in range(args.warmup):
+                warmup()
+            results.append(run_scenario(scenario, base_url, token, args, server_pid))
+
+        print_report(results)
+        if args.json_path:
+            with open(args.json_path, "w") as out:
+                json.dump({"args": vars(args), "results": results}, out, indent=2)
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        if fake_server is not None:
+            fake_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Circuit Breaker Module for LawGPT
+Per-endpoint breaker that trips on consecutive failures or latency SLO breaches
+and probes recovery through a half-open state.
+"""
+
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures, or after
+    `slo_breach_threshold` consecutive successful calls slower than
+    `latency_slo`. Open rejects calls for `open_seconds` (doubling on each
+    consecutive trip, capped at `max_open_seconds`), then half-open admits up
+    to `half_open_probes` concurrent calls: a success closes the breaker, a
+    failure re-opens it. Only probes count while half-open: `on_dispatch`
+    hands each probe a token to pass back with its outcome, and late results
+    of calls dispatched before the trip are ignored.
+
+    Not thread-safe on its own; callers hold their own lock.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 300.0,
+        latency_slo: float = 60.0,
+        slo_breach_threshold: int = 5,
+        half_open_probes: int = 1
+    ):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.latency_slo = latency_slo
+        self.slo_breach_threshold = slo_breach_threshold
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_slo_breaches = 0
+        self.trips = 0
+        self.opened_until = 0.0
+        self.probes_in_flight = 0
+        self.half_open_epoch = 0
+        self.last_trip_reason = None
+
+    def _refresh(self, now: float):
+        if self.state == OPEN and now >= self.opened_until:
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+            self.half_open_epoch += 1
+
+    def _is_current_probe(self, probe: Optional[int]) -> bool:
+        """Whether a half-open outcome comes from a probe of this half-open period"""
+        if probe != self.half_open_epoch:
+            return False
+        self.probes_in_flight = max(0, self.probes_in_flight - 1)
+        return True
+
+    def can_attempt(self, now: float) -> bool:
+        """Whether a call may be dispatched now (does not reserve a probe)"""
+        self._refresh(now)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight < self.half_open_probes
+        return False
+
+    def is_open(self, now: float) -> bool:
+        self._refresh(now)
+        return self.state == OPEN
+
+    def on_dispatch(self, now: float) -> Optional[int]:
+        """
+        Record that a call was dispatched; reserves a probe slot when half-open.
+
+        Returns:
+            Probe token to pass to record_success/record_failure, or None
+            when the call is not a probe
+        """
+        self._refresh(now)
+        if self.state == HALF_OPEN:
+            self.probes_in_flight += 1
+            return self.half_open_epoch
+        return None
+
+    def record_success(self, latency: float, now: float, probe: Optional[int] = None):
+        self._refresh(now)
+        if self.state == OPEN:
+            # Late result from a call dispatched before the trip
+            return
+        if self.state == HALF_OPEN:
+            if not self._is_current_probe(probe):
+                return
+            if latency <= self.latency_slo:
+                self._close()
+            else:
+                self._trip(now, "latency_slo")
+            return
+
+        self.consecutive_failures = 0
+        if latency > self.latency_slo:
+            self.consecutive_slo_breaches += 1
+            if self.consecutive_slo_breaches >= self.slo_breach_threshold:
+                self._trip(now, "latency_slo")
+        else:
+            self.consecutive_slo_breaches = 0
+
+    def record_failure(self, now: float, probe: Optional[int] = None):
+        self._refresh(now)
+        if self.state == HALF_OPEN:
+            if self._is_current_probe(probe):
+                self._trip(now, "probe_failed")
+            return
+        if self.state == OPEN:
+            # Late result from a call dispatched before the trip
+            return
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self._trip(now, "failures")
+
+    def _trip(self, now: float, reason: str):
+        self.trips += 1
+        duration = min(self.open_seconds * (2 ** (self.trips - 1)), self.max_open_seconds)
+        self.state = OPEN
+        self.opened_until = now + duration
+        self.consecutive_failures = 0
+        self.consecutive_slo_breaches = 0
+        self.probes_in_flight = 0
+        self.last_trip_reason = reason
+
+    def _close(self):
+        self.state = CLOSED
+        self.trips = 0
+        self.consecutive_failures = 0
+        self.consecutive_slo_breaches = 0
+        self.probes_in_flight = 0
+
+    def snapshot(self, now: float) -> Dict:
+        self._refresh(now)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "consecutive_slo_breaches": self.consecutive_slo_breaches,
+            "open_for_seconds": round(max(0.0, self.opened_until - now), 1) if self.state == OPEN else 0.0,
+            "trips": self.trips,
+            "last_trip_reason": self.last_trip_reason,
+        }
@@ -1,3 +1,4 @@
+import mongoose from "mongoose";
 import ChatSession from "../models/ChatSession.js";
 import User from "../models/User.js";
 
@@ -120,6 +121,209 @@ export const saveConversation = async (req, res) => {
   }
 };
 
+const isSessionId = (sessionId) =>
+  sessionId && sessionId !== "null" && sessionId !== "undefined";
+
+// New messages of one turn, with ids assigned up front so they can be returned
+// without reading the session back
+const buildTurnMessages = ({ userMessage, botMessage, fileMetadata, isEdit, turnId }, timestamp) => {
+  const messages = [];
+  const turn = turnId ? { turnId: String(turnId) } : {};
+  if (!isEdit) {
+    const userMsgObj = {
+      _id: new mongoose.Types.ObjectId(),
+      sender: "user",
+      message: userMessage.trim(),
+      timestamp,
+      ...turn,
+    };
+    if (fileMetadata) {
+      userMsgObj.fileMetadata = {
+        fileName: fileMetadata.fileName,
+        fileType: fileMetadata.fileType,
+        fileSize: fileMetadata.fileSize,
+        extractedText: fileMetadata.extractedText || null
+      };
+    }
+    messages.push(userMsgObj);
+  }
+  messages.push({
+    _id: new mongoose.Types.ObjectId(),
+    sender: "bot",
+    message: botMessage,
+    timestamp,
+    ...turn,
+  });
+  return messages;
+};
+
+// Turns of a request that an earlier attempt already saved: turnId -> result
+const findSavedTurns = async (requester, turnIds) => {
+  const saved = new Map();
+  if (!turnIds.length) {
+    return saved;
+  }
+  const sessions = await ChatSession.find({ userId: requester, "messages.turnId": { $in: turnIds } })
+    .select("_id title messages._id messages.turnId messages.timestamp")
+    .lean();
+  const wanted = new Set(turnIds);
+  for (const session of sessions) {
+    for (const msg of session.messages) {
+      if (!msg.turnId || !wanted.has(msg.turnId)) {
+        continue;
+      }
+      if (!saved.has(msg.turnId)) {
+        saved.set(msg.turnId, {
+          sessionId: String(session._id),
+          title: session.title,
+          created: false,
+          messageIds: [],
+          timestamp: msg.timestamp,
+        });
+      }
+      saved.get(msg.turnId).messageIds.push(String(msg._id));
+    }
+  }
+  return saved;
+};
+
+// Append-only save from Flask: pushes each turn's messages without loading or
+// re-saving the session, and returns only the new message ids. Takes a list of
+// turns so Flask can coalesce saves into one request. Every turn gets its own
+// result (saved, or an error and status), and a turn whose turnId is already
+// stored returns the saved ids again, so Flask can safely retry a request.
+export const appendConversation = async (req, res) => {
+  try {
+    const { appends } = req.body;
+    const requester = String(req.user.id);
+
+    if (!Array.isArray(appends) || appends.length === 0) {
+      return res.status(400).json({ error: "Missing required fields" });
+    }
+
+    console.log(`💾 appendConversation: ${appends.length} turn(s) for user ${requester}`);
+
+    // One ownership check for every existing session in the request
+    const sessionIds = [...new Set(
+      appends
+        .map((turn) => turn.sessionId)
+        .filter((id) => isSessionId(id) && mongoose.isValidObjectId(id))
+        .map(String)
+    )];
+    const owned = sessionIds.length
+      ? await ChatSession.find({ _id: { $in: sessionIds }, userId: requester }).select("_id title").lean()
+      : [];
+    const titles = new Map(owned.map((session) => [String(session._id), session.title]));
+    const alreadySaved = await findSavedTurns(
+      requester,
+      appends.map((turn) => turn.turnId).filter(Boolean).map(String)
+    );
+
+    const results = [];
+    // One update per session: its turns' messages in one $push, so they land in
+    // submission order and succeed or fail together
+    const pushes = new Map();
+    for (const turn of appends) {
+      const { userId, sessionId, userMessage, botMessage, isEdit, turnId } = turn;
+
+      if (!userId || !botMessage || (!isEdit && !userMessage)) {
+        results.push({ error: "Missing required fields", status: 400 });
+        continue;
+      }
+      if (String(userId) !== requester) {
+        results.push({ error: "Cannot save to another user's session", status: 403 });
+        continue;
+      }
+
+      if (turnId && alreadySaved.has(String(turnId))) {
+        results.push({ ...alreadySaved.get(String(turnId)), duplicate: true });
+        continue;
+      }
+
+      const timestamp = new Date();
+      const messages = buildTurnMessages(turn, timestamp);
+      const messageIds = messages.map((msg) => String(msg._id));
+
+      if (isSessionId(sessionId)) {
+        if (!titles.has(String(sessionId))) {
+          results.push({ error: "Session not found", status: 404 });
+          continue;
+        }
+        const push = pushes.get(String(sessionId)) || { messages: [], resultIndexes: [] };
+        push.messages.push(...messages);
+        push.resultIndexes.push(results.length);
+        pushes.set(String(sessionId), push);
+        results.push({
+          sessionId: String(sessionId),
+          title: titles.get(String(sessionId)),
+          created: false,
+          messageIds,
+          timestamp,
+        });
+      } else {
+        const title = (userMessage || "").substring(0, 30) + ((userMessage || "").length > 30 ? "..." : "");
+        let session;
+        try {
+          session = await ChatSession.create({ userId: requester, title, messages });
+        } catch (createError) {
+          console.error("❌ appendConversation create Error:", createError);
+          results.push({ error: createError.message, status: 500 });
+          continue;
+        }
+
+        try {
+          await User.findByIdAndUpdate(requester, { $inc: { totalChats: 1 } });
+          console.log(`📊 User ${requester} totalChats incremented`);
+        } catch (countError) {
+          console.error(`❌ Error incrementing totalChats:`, countError);
+        }
+
+        titles.set(String(session._id), session.title);
+        results.push({
+          sessionId: String(session._id),
+          title: session.title,
+          created: true,
+          messageIds,
+          timestamp,
+        });
+      }
+    }
+
+    // Sessions are independent, so one failed update does not stop the others
+    if (pushes.size) {
+      const sessionPushes = [...pushes.entries()];
+      try {
+        await ChatSession.bulkWrite(
+          sessionPushes.map(([sessionId, push]) => ({
+            updateOne: {
+              filter: { _id: sessionId, userId: requester },
+              update: { $push: { messages: { $each: push.messages } } },
+            },
+          })),
+          { ordered: false }
+        );
+      } catch (writeError) {
+        if (!writeError.writeErrors) {
+          throw writeError;
+        }
+        for (const failed of [].concat(writeError.writeErrors)) {
+          const message = failed.errmsg || failed.err?.errmsg || writeError.message;
+          for (const index of sessionPushes[failed.index][1].resultIndexes) {
+            results[index] = { error: message, status: 500 };
+          }
+        }
+      }
+    }
+
+    console.log(`✅ Appended ${results.filter((r) => !r.error).length}/${appends.length} turn(s)`);
+
+    res.status(200).json({ results });
+  } catch (error) {
+    console.error("❌ appendConversation Error:", error);
+    res.status(500).json({ error: error.message });
+  }
+};
+
 // Get all sessions for user
 export const getUserSessions = async (req, res) => {
   try {
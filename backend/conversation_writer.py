@@ -0,0 +1,167 @@
+"""
+Conversation Writer Module for LawGPT
+Append-only saves of chat turns to the Node.js server. Saves are coalesced
+per user: turns submitted while one of the user's writes is in flight go out
+together in the next request, and each turn gets back only its new message
+ids instead of the whole session.
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from metrics import registry, timed, get_logger
+
+logger = get_logger("lawgpt.conversation_writer")
+
+APPEND_BATCH_SIZE = registry.histogram(
+    "lawgpt_node_append_batch_size",
+    "Turns written per append request to the Node.js server",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+APPENDS = registry.counter(
+    "lawgpt_node_appends_total",
+    "Turns submitted for append by outcome (saved, rejected, failed, retried)",
+    ["outcome"]
+)
+
+
+class SaveError(Exception):
+    """A turn the Node.js server did not save"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ConversationWriter:
+    """
+    Per-user group commit onto POST /api/conversation/append.
+
+    At most one request per user is in flight, so a user's turns are written
+    in submission order; different users' writes run in parallel on a small
+    pool. A turn is a dict with userId, sessionId, userMessage, botMessage,
+    model, and optionally fileMetadata and isEdit. Its result is the Node
+    server's per-turn entry: {sessionId, title, created, messageIds, timestamp}.
+
+    Each turn is given a turnId, which the Node server stores with its
+    messages. A request that failed as a whole (no response, or a 5xx) is
+    retried up to `retries` times: turns an earlier attempt already saved
+    come back with their stored ids instead of being saved twice.
+
+    Args:
+        node_server_url: Base URL of the Node.js server
+        headers: (user_id, token) -> request headers authenticating as the user
+        max_batch: Most turns per request
+        linger: Seconds to wait for more turns before the first write of a burst
+        timeout: Request timeout in seconds
+        workers: Users written concurrently
+        retries: Extra attempts for a request that failed as a whole
+        retry_delay: Seconds before a retry (doubles per attempt)
+    """
+
+    def __init__(self, node_server_url: str, headers: Callable[[str, Optional[str]], Dict[str, str]],
+                 max_batch: int = 32, linger: float = 0.0, timeout: float = 10.0, workers: int = 8,
+                 retries: int = 1, retry_delay: float = 0.2):
+        self.url = f"{node_server_url}/api/conversation/append"
+        self.headers = headers
+        self.max_batch = max_batch
+        self.linger = linger
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._pending: Dict[str, deque] = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="node-writer")
+
+    def submit(self, user_id: str, token: Optional[str], turn: Dict) -> Future:
+        """Queue a turn for writing; the future resolves to its saved entry or raises SaveError"""
+        future = Future()
+        user_id = str(user_id)
+        turn = dict(turn, turnId=turn.get("turnId") or uuid.uuid4().hex)
+        with self._lock:
+            self._pending.setdefault(user_id, deque()).append((turn, token, future))
+            if user_id in self._active:
+                return future
+            self._active.add(user_id)
+        self._executor.submit(self._drain, user_id)
+        return future
+
+    def save(self, user_id: str, token: Optional[str], turns: List[Dict]) -> List[Dict]:
+        """
+        Write turns and wait for them.
+
+        Raises:
+            SaveError: If any turn was not saved
+        """
+        futures = [self.submit(user_id, token, turn) for turn in turns]
+        timeout = (self.retries + 1) * self.timeout * (1 + len(turns) // self.max_batch) + 5
+        return [future.result(timeout=timeout) for future in futures]
+
+    def _drain(self, user_id: str):
+        if self.linger:
+            time.sleep(self.linger)
+        while True:
+            with self._lock:
+                queue = self._pending.get(user_id)
+                if not queue:
+                    self._pending.pop(user_id, None)
+                    self._active.discard(user_id)
+                    return
+                batch = [queue.popleft() for _ in range(min(self.max_batch, len(queue)))]
+            self._write(user_id, batch)
+
+    def _post(self, user_id: str, batch: List[tuple]) -> List[Dict]:
+        """One append request; returns its per-turn results"""
+        with timed("node_save"):
+            response = requests.post(
+                self.url,
+                json={"appends": [turn for turn, _, _ in batch]},
+                headers=self.headers(user_id, batch[-1][1]),
+                timeout=self.timeout
+            )
+        if not response.ok:
+            raise SaveError(f"Node.js server error: {response.status_code}", response.status_code)
+        results = response.json().get("results", [])
+        if len(results) != len(batch):
+            raise SaveError(f"Node.js server returned {len(results)} results for {len(batch)} turns")
+        return results
+
+    def _write(self, user_id: str, batch: List[tuple]):
+        APPEND_BATCH_SIZE.observe(len(batch))
+        attempt = 0
+        while True:
+            try:
+                results = self._post(user_id, batch)
+                break
+            except Exception as e:
+                error = e if isinstance(e, SaveError) else SaveError(f"Failed to connect to Node.js server: {e}")
+                # Turn ids make a resend safe; a 4xx would only fail the same way again
+                if attempt < self.retries and (not isinstance(e, SaveError) or e.status_code >= 500):
+                    logger.warning("⚠️ Append of %d turns for user %s failed, retrying: %s", len(batch), user_id, error)
+                    APPENDS.inc(len(batch), outcome="retried")
+                    time.sleep(self.retry_delay * (2 ** attempt))
+                    attempt += 1
+                    continue
+                logger.error("❌ Append of %d turns for user %s failed: %s", len(batch), user_id, error)
+                APPENDS.inc(len(batch), outcome="failed")
+                for _, _, future in batch:
+                    future.set_exception(error)
+                return
+
+        for (_, _, future), result in zip(batch, results):
+            if result.get("error"):
+                APPENDS.inc(outcome="rejected")
+                future.set_exception(SaveError(result["error"], result.get("status", 400)))
+            else:
+                APPENDS.inc(outcome="saved")
+                future.set_result(result)
+
+    def stop(self):
+        self._executor.shutdown(wait=True)
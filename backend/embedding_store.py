@@ -0,0 +1,121 @@
+"""
+Embedding Store Module for LawGPT
+Persistent cache of text embeddings in SQLite, keyed by a hash of the
+embedding model name and the text, so vectors computed by the background
+worker are reused on the request path and across restarts.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from metrics import registry, get_logger
+
+logger = get_logger("lawgpt.embedding_store")
+
+EMBEDDING_CACHE = registry.counter(
+    "lawgpt_embedding_cache_total",
+    "Embedding lookups served from the store (hit) or computed (miss)",
+    ["result"]
+)
+
+
+class EmbeddingStore:
+    """
+    Args:
+        path: SQLite file
+        model_name: Embedding model; part of the key so a model change never
+            returns stale vectors
+        dim: Embedding dimension
+    """
+
+    # SQLite's default limit on host parameters per statement is 999
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path: str, model_name: str, dim: int):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Cached vectors, as {position in texts: vector}"""
+        keys = [self.key(text) for text in texts]
+        positions: Dict[bytes, List[int]] = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+        found: Dict[int, np.ndarray] = {}
+        unique = list(positions)
+        with self._lock:
+            for start in range(0, len(unique), self.LOOKUP_BATCH):
+                batch = unique[start:start + self.LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    for i in positions[key]:
+                        found[i] = vector
+        return found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        now = time.time()
+        rows = [
+            (self.key(text), np.ascontiguousarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def encode_cached(self, texts: List[str], encode) -> np.ndarray:
+        """
+        Embeddings for texts, computing (and storing) only the ones not cached.
+
+        Args:
+            texts: Texts to embed
+            encode: Function returning float32 embeddings for a list of texts
+
+        Returns:
+            (len(texts), dim) float32 array
+        """
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+        found = self.get_many(texts)
+        for i, vector in found.items():
+            result[i] = vector
+        missing = [i for i in range(len(texts)) if i not in found]
+        EMBEDDING_CACHE.inc(len(found), result="hit")
+        if missing:
+            EMBEDDING_CACHE.inc(len(missing), result="miss")
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = np.asarray(encode(missing_texts), dtype=np.float32).reshape(len(missing_texts), self.dim)
+            rows = {text: row for row, text in enumerate(missing_texts)}
+            result[missing] = vectors[[rows[texts[i]] for i in missing]]
+            self.put_many(missing_texts, vectors)
+        return result
+
+    def prune(self, max_age_days: float) -> int:
+        """Delete vectors older than max_age_days; returns rows removed"""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - max_age_days * 86400,)
+            ).rowcount
+        if removed:
+            logger.info("🧹 Pruned %d cached embeddings", removed)
+        return removed
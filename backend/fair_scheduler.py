@@ -0,0 +1,402 @@
+"""
+Fair Scheduler Module for LawGPT
+Weighted fair queueing of model calls across users, with token-bucket rate
+limits per user and per model and a priority lane for short interactive prompts.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import registry, get_logger
+from model_router import ModelRouterError
+
+logger = get_logger("lawgpt.fair_scheduler")
+
+SCHEDULER_QUEUE_DEPTH = registry.gauge(
+    "lawgpt_scheduler_queue_depth",
+    "Model calls waiting for a fair-share slot",
+    ["model", "lane"]
+)
+SCHEDULER_WAIT = registry.histogram(
+    "lawgpt_scheduler_wait_seconds",
+    "Time model calls waited for a fair-share slot",
+    ["model", "lane"]
+)
+SCHEDULER_REJECTIONS = registry.counter(
+    "lawgpt_scheduler_rejections_total",
+    "Model calls rejected by the scheduler",
+    ["model", "reason"]
+)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Prompt characters that count as one unit of work in the fair-share accounting
+COST_UNIT_CHARS = 4000
+
+
+class RateLimited(ModelRouterError):
+    """The user's or the model's token bucket is empty, or the user has too many queued calls"""
+    status_code = 429
+
+
+class SchedulerTimeout(ModelRouterError):
+    """No fair-share slot became free within max_wait"""
+    status_code = 429
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; not thread-safe"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def refund(self, now: float):
+        """Give back a token taken for a call that never ran"""
+        self._refill(now)
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class Ticket:
+    """One model call's place in the scheduler"""
+
+    __slots__ = ("user", "model", "lane", "start_tag", "finish_tag", "seq", "position",
+                 "enqueued_at", "dispatched_at", "event", "cancelled")
+
+    def __init__(self, user: str, model: str, lane: str, seq: int, now: float):
+        self.user = user
+        self.model = model
+        self.lane = lane
+        self.seq = seq
+        self.enqueued_at = now
+        self.dispatched_at = None
+        self.start_tag = 0.0
+        self.finish_tag = 0.0
+        self.position = 0
+        self.event = threading.Event()
+        self.cancelled = False
+
+    def feedback(self) -> Dict:
+        """Queue position at arrival and time waited, for the response"""
+        waited = (self.dispatched_at or time.monotonic()) - self.enqueued_at
+        return {"lane": self.lane, "position": self.position, "waitMs": round(waited * 1000, 1)}
+
+
+class _ModelQueue:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        self.virtual_time = 0.0
+        self.lanes: Dict[str, List[Tuple[float, int, Ticket]]] = {INTERACTIVE: [], BATCH: []}
+        self.waiting: Dict[str, int] = {INTERACTIVE: 0, BATCH: 0}
+        self.user_finish: Dict[str, float] = {}
+        self.interactive_streak = 0
+
+
+class FairScheduler:
+    """
+    Gates model calls per capacity group: models served by the same
+    replicas share their combined concurrency, so a group admits up to
+    `capacity` calls at once across its models; the rest wait in two lanes:
+
+    - interactive: prompts up to `short_prompt_chars` from chat requests
+    - batch: everything else (file uploads, long prompts)
+
+    Within a lane, calls are ordered by self-clocked weighted fair queueing:
+    a call's finish tag is max(virtual time, the user's previous finish tag)
+    + cost / weight, where cost grows with prompt length. A user who submits
+    fifty uploads therefore gets their fair share of slots, not fifty in a
+    row. The interactive lane is served first, but after `interactive_share`
+    consecutive interactive dispatches a waiting batch call goes next, so
+    batch work is never starved.
+
+    Before queueing, a call takes a token from its user's bucket and from
+    the model's bucket (if configured); an empty bucket, or more than
+    `max_queued_per_user` waiting calls, rejects with RateLimited (429 with
+    Retry-After).
+
+    Args:
+        capacities: Concurrent calls per capacity group
+        resolve: Maps a requested model name to the model it is served as
+        capacity_key: Maps a resolved model name to its capacity group
+        user_rate: Requests per second per user (0 disables the limit)
+        user_burst: User bucket size
+        model_limits: model -> (requests per second, burst)
+        user_weights: user id -> fair-share weight (default 1.0)
+        short_prompt_chars: Longest prompt eligible for the interactive lane
+        max_queued_per_user: Waiting calls allowed per user and model
+        max_wait: Seconds a call may wait for a slot
+        interactive_share: Interactive dispatches in a row before a waiting batch call goes
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(
+        self,
+        capacities: Dict[str, int],
+        resolve: Callable[[str], str] = lambda model: model,
+        capacity_key: Callable[[str], str] = lambda model: model,
+        user_rate: float = 0.5,
+        user_burst: float = 10,
+        model_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        user_weights: Optional[Dict[str, float]] = None,
+        short_prompt_chars: int = 1000,
+        max_queued_per_user: int = 8,
+        max_wait: float = 60.0,
+        interactive_share: int = 3
+    ):
+        self.resolve = resolve
+        self.capacity_key = capacity_key
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.user_weights = user_weights or {}
+        self.short_prompt_chars = short_prompt_chars
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = max_wait
+        self.interactive_share = interactive_share
+
+        self._lock = threading.Lock()
+        self._queues = {key: _ModelQueue(max(1, capacity)) for key, capacity in capacities.items()}
+        self._user_buckets: Dict[str, TokenBucket] = {}
+        self._user_queued: Dict[Tuple[str, str], int] = {}
+        now = time.monotonic()
+        self._model_buckets = {
+            model: TokenBucket(rate, burst, now) for model, (rate, burst) in (model_limits or {}).items()
+        }
+        self._seq = itertools.count()
+        self._admitted = 0
+
+    def _queue(self, model: str) -> _ModelQueue:
+        key = self.capacity_key(model)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _ModelQueue(1)
+        return queue
+
+    def _reject(self, model: str, reason: str, message: str, retry_after: float):
+        SCHEDULER_REJECTIONS.inc(model=model, reason=reason)
+        raise RateLimited(message, retry_after)
+
+    def _admit(self, user: str, model: str, now: float, wait_for_rate: bool = False) -> float:
+        """
+        Take rate-limit tokens; caller holds the lock. With wait_for_rate, an
+        empty bucket returns the seconds to wait instead of rejecting.
+        """
+        if self._user_queued.get((user, model), 0) >= self.max_queued_per_user:
+            self._reject(model, "user_queue_full", "Too many queued requests", 5.0)
+
+        user_bucket = None
+        user_wait = 0.0
+        if self.user_rate > 0:
+            user_bucket = self._user_buckets.get(user)
+            if user_bucket is None:
+                user_bucket = self._user_buckets[user] = TokenBucket(self.user_rate, self.user_burst, now)
+            user_wait = user_bucket.wait_time(now)
+        model_bucket = self._model_buckets.get(model)
+        model_wait = model_bucket.wait_time(now) if model_bucket else 0.0
+
+        if wait_for_rate and (user_wait > 0 or model_wait > 0):
+            return max(user_wait, model_wait)
+        if user_wait > 0:
+            self._reject(model, "user_rate", "Rate limit exceeded", user_wait)
+        if model_wait > 0:
+            self._reject(model, "model_rate", f"{model} rate limit exceeded", model_wait)
+        if user_bucket:
+            user_bucket.take(now)
+        if model_bucket:
+            model_bucket.take(now)
+
+        self._admitted += 1
+        if self._admitted % self.PRUNE_EVERY == 0:
+            # Full, idle buckets carry no state worth keeping
+            for key in [key for key, bucket in self._user_buckets.items() if bucket.idle(now)]:
+                del self._user_buckets[key]
+        return 0.0
+
+    def _refund(self, queue: _ModelQueue, ticket: Ticket, now: float):
+        """
+        Undo a cancelled ticket's charges; caller holds the lock. Its finish
+        tag is rolled back only while it is still the user's latest, since a
+        later ticket's tags were stacked on top of it.
+        """
+        if queue.user_finish.get(ticket.user) == ticket.finish_tag:
+            queue.user_finish[ticket.user] = ticket.start_tag
+        for bucket in (self._user_buckets.get(ticket.user), self._model_buckets.get(ticket.model)):
+            if bucket is not None:
+                bucket.refund(now)
+
+    def _position(self, queue: _ModelQueue, ticket: Ticket) -> int:
+        """Calls ahead of this one at arrival (1-based; 0 = dispatched immediately)"""
+        ahead = sum(1 for tag, _, t in queue.lanes[ticket.lane] if not t.cancelled and tag < ticket.finish_tag)
+        if ticket.lane == BATCH:
+            ahead += queue.waiting[INTERACTIVE]
+        return ahead + 1
+
+    def _next(self, queue: _ModelQueue) -> Optional[Ticket]:
+        interactive, batch = queue.lanes[INTERACTIVE], queue.lanes[BATCH]
+        for lane in (interactive, batch):
+            while lane and lane[0][2].cancelled:
+                heapq.heappop(lane)
+        if interactive and (not batch or queue.interactive_streak < self.interactive_share):
+            queue.interactive_streak += 1
+            return heapq.heappop(interactive)[2]
+        if batch:
+            queue.interactive_streak = 0
+            return heapq.heappop(batch)[2]
+        return None
+
+    def _dispatch(self, queue: _ModelQueue, now: float):
+        """Hand free slots to the next waiting calls; caller holds the lock"""
+        while queue.active < queue.capacity:
+            ticket = self._next(queue)
+            if ticket is None:
+                return
+            self._dequeued(queue, ticket)
+            self._start(queue, ticket, now)
+            ticket.event.set()
+
+    def _start(self, queue: _ModelQueue, ticket: Ticket, now: float):
+        queue.active += 1
+        queue.virtual_time = max(queue.virtual_time, ticket.start_tag)
+        ticket.dispatched_at = now
+
+    def _dequeued(self, queue: _ModelQueue, ticket: Ticket):
+        queue.waiting[ticket.lane] -= 1
+        key = (ticket.user, ticket.model)
+        self._user_queued[key] -= 1
+        if not self._user_queued[key]:
+            del self._user_queued[key]
+        SCHEDULER_QUEUE_DEPTH.dec(model=ticket.model, lane=ticket.lane)
+
+    @contextmanager
+    def slot(self, user_id: Optional[str], model: str, prompt_chars: int, interactive: bool = True,
+             wait_for_rate: bool = False):
+        """
+        Wait for this user's fair turn at a model, then hold a slot for the call.
+
+        Args:
+            user_id: Authenticated user id (request.user["id"])
+            model: Requested model name
+            prompt_chars: Prompt length, used for lane choice and fair-share cost
+            interactive: Whether the request comes from an interactive chat turn
+            wait_for_rate: Wait (up to max_wait) for rate-limit tokens instead of
+                rejecting; for batch items that should be paced, not failed
+
+        Yields:
+            Ticket; ticket.feedback() gives queue position and wait for the response
+
+        Raises:
+            RateLimited: Token bucket empty or too many queued calls for the user
+            SchedulerTimeout: No slot within max_wait
+        """
+        user = str(user_id or "anonymous")
+        model = self.resolve(model)
+        lane = INTERACTIVE if interactive and prompt_chars <= self.short_prompt_chars else BATCH
+        cost = 1.0 + prompt_chars / COST_UNIT_CHARS
+        weight = self.user_weights.get(user, 1.0)
+
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                rate_wait = self._admit(user, model, now, wait_for_rate)
+            if not rate_wait:
+                break
+            if now + rate_wait > deadline:
+                SCHEDULER_REJECTIONS.inc(model=model, reason="rate_wait_timeout")
+                raise RateLimited("Rate limit exceeded", rate_wait)
+            time.sleep(rate_wait)
+
+        with self._lock:
+            now = time.monotonic()
+            queue = self._queue(model)
+            ticket = Ticket(user, model, lane, next(self._seq), now)
+            ticket.start_tag = max(queue.virtual_time, queue.user_finish.get(user, 0.0))
+            ticket.finish_tag = ticket.start_tag + cost / weight
+            queue.user_finish[user] = ticket.finish_tag
+            if queue.active < queue.capacity and not queue.waiting[INTERACTIVE] and not queue.waiting[BATCH]:
+                self._start(queue, ticket, now)
+            else:
+                ticket.position = self._position(queue, ticket)
+                heapq.heappush(queue.lanes[lane], (ticket.finish_tag, ticket.seq, ticket))
+                queue.waiting[lane] += 1
+                self._user_queued[(user, model)] = self._user_queued.get((user, model), 0) + 1
+                SCHEDULER_QUEUE_DEPTH.inc(model=model, lane=lane)
+
+        if ticket.dispatched_at is None and not ticket.event.wait(max(0.0, deadline - time.monotonic())):
+            with self._lock:
+                if ticket.dispatched_at is None:
+                    ticket.cancelled = True
+                    self._dequeued(queue, ticket)
+                    self._refund(queue, ticket, time.monotonic())
+                    SCHEDULER_REJECTIONS.inc(model=model, reason="timeout")
+                    raise SchedulerTimeout(f"Timed out waiting for a {model} slot", self.max_wait / 2)
+
+        SCHEDULER_WAIT.observe(ticket.dispatched_at - ticket.enqueued_at, model=model, lane=lane)
+        try:
+            yield ticket
+        finally:
+            with self._lock:
+                queue.active -= 1
+                if not queue.active and not queue.waiting[INTERACTIVE] and not queue.waiting[BATCH]:
+                    # Idle: forget finish tags so they do not grow without bound
+                    queue.user_finish.clear()
+                    queue.virtual_time = 0.0
+                self._dispatch(queue, time.monotonic())
+
+    def queue_status(self, user_id: Optional[str]) -> List[Dict]:
+        """The user's currently waiting calls with their live queue positions"""
+        user = str(user_id or "anonymous")
+        status = []
+        with self._lock:
+            for queue in self._queues.values():
+                for lane in (INTERACTIVE, BATCH):
+                    ordered = sorted(entry for entry in queue.lanes[lane] if not entry[2].cancelled)
+                    offset = queue.waiting[INTERACTIVE] if lane == BATCH else 0
+                    for rank, (_, _, ticket) in enumerate(ordered, 1):
+                        if ticket.user == user:
+                            status.append({
+                                "model": ticket.model,
+                                "lane": lane,
+                                "position": offset + rank,
+                                "waitMs": round((time.monotonic() - ticket.enqueued_at) * 1000, 1),
+                            })
+        return status
+
+    def snapshot(self) -> Dict:
+        """Slots and queue depth per capacity group, for the /health endpoint"""
+        with self._lock:
+            return {
+                key: {
+                    "capacity": queue.capacity,
+                    "active": queue.active,
+                    "waiting": dict(queue.waiting),
+                }
+                for key, queue in self._queues.items()
+            }
@@ -0,0 +1,260 @@
+"""
+Job Queue Module for LawGPT
+In-process background job queue persisted in a local SQLite file: idempotent
+(keyed, coalescing) jobs, bounded backlog, crash recovery and lag metrics.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from metrics import registry, get_logger
+
+logger = get_logger("lawgpt.job_queue")
+
+QUEUE_DEPTH = registry.gauge(
+    "lawgpt_job_queue_depth",
+    "Background jobs pending or running",
+    ["queue"]
+)
+QUEUE_LAG = registry.histogram(
+    "lawgpt_job_queue_lag_seconds",
+    "Time from (latest) enqueue to start of processing",
+    ["queue", "kind"]
+)
+JOB_DURATION = registry.histogram(
+    "lawgpt_job_duration_seconds",
+    "Background job processing time",
+    ["queue", "kind"]
+)
+JOBS = registry.counter(
+    "lawgpt_jobs_total",
+    "Background jobs by outcome (enqueued, coalesced, rejected, succeeded, retried, failed)",
+    ["queue", "kind", "outcome"]
+)
+OLDEST_PENDING = registry.gauge(
+    "lawgpt_job_queue_oldest_pending_seconds",
+    "Age of the oldest pending job when a worker last claimed one",
+    ["queue"]
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    version INTEGER NOT NULL DEFAULT 1,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    run_after REAL NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, run_after, id);
+"""
+
+
+class QueueFull(Exception):
+    """Raised by enqueue when the backlog is at max_pending"""
+
+
+class PersistentJobQueue:
+    """
+    Jobs are rows in SQLite (WAL mode), so a crash or restart loses nothing:
+    rows left 'running' by a dead process are reset to 'pending' on start.
+
+    Each job has an idempotency key. Enqueueing a key that is already queued
+    replaces its payload and bumps its version instead of adding a row, so
+    bursts of updates to one session coalesce into one job. A worker only
+    deletes a finished job if its version is unchanged; otherwise the newer
+    payload runs again. Handlers must therefore be idempotent.
+
+    Backpressure: enqueue of a new key raises QueueFull once `max_pending`
+    jobs are queued; callers drop the work (it is an optimization) rather
+    than block a request.
+
+    Args:
+        path: SQLite file
+        handlers: kind -> function(payload dict)
+        name: Queue name used in metrics and thread names
+        workers: Worker threads
+        max_pending: Backlog limit
+        max_attempts: Attempts before a job is parked as 'failed'
+        retry_delay: Base seconds before a retry (doubles per attempt)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        handlers: Dict[str, Callable[[Dict], None]],
+        name: str = "precompute",
+        workers: int = 1,
+        max_pending: int = 1000,
+        max_attempts: int = 3,
+        retry_delay: float = 5.0
+    ):
+        self.path = path
+        self.handlers = handlers
+        self.name = name
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+
+        # Failed jobs are kept a week for inspection
+        self._conn.execute("DELETE FROM jobs WHERE status = 'failed' AND enqueued_at < ?", (time.time() - 7 * 86400,))
+        recovered = self._conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'").rowcount
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status != 'failed'").fetchone()[0]
+        QUEUE_DEPTH.set(self._depth, queue=name)
+        if self._depth:
+            logger.info("♻️ Job queue %s resumed %d jobs (%d interrupted)", name, self._depth, recovered)
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def enqueue(self, kind: str, key: str, payload: Dict) -> bool:
+        """
+        Queue a job, or refresh the payload of the queued job with the same key.
+
+        Returns:
+            True for a new job, False if it coalesced into a queued one
+
+        Raises:
+            QueueFull: The backlog is at max_pending
+        """
+        now = time.time()
+        data = json.dumps(payload)
+        with self._lock:
+            existing = self._conn.execute("SELECT status FROM jobs WHERE key = ?", (key,)).fetchone()
+            if existing and existing[0] != "failed":
+                self._conn.execute(
+                    "UPDATE jobs SET payload = ?, kind = ?, version = version + 1, enqueued_at = ? WHERE key = ?",
+                    (data, kind, now, key)
+                )
+                JOBS.inc(queue=self.name, kind=kind, outcome="coalesced")
+                self._wakeup.notify()
+                return False
+            if self._depth >= self.max_pending:
+                JOBS.inc(queue=self.name, kind=kind, outcome="rejected")
+                raise QueueFull(f"{self.name} queue has {self._depth} pending jobs")
+            if existing:
+                # A parked failed job gets a fresh start with the new payload
+                self._conn.execute("DELETE FROM jobs WHERE key = ?", (key,))
+            self._conn.execute(
+                "INSERT INTO jobs (key, kind, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (key, kind, data, now)
+            )
+            self._depth += 1
+            QUEUE_DEPTH.set(self._depth, queue=self.name)
+            JOBS.inc(queue=self.name, kind=kind, outcome="enqueued")
+            self._wakeup.notify()
+            return True
+
+    def _claim(self) -> Optional[tuple]:
+        """Mark the oldest runnable job running; caller holds the lock"""
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT id, kind, payload, version, attempts, enqueued_at FROM jobs "
+            "WHERE status = 'pending' AND run_after <= ? ORDER BY id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (row[0],))
+        oldest = self._conn.execute(
+            "SELECT MIN(enqueued_at) FROM jobs WHERE status = 'pending'"
+        ).fetchone()[0]
+        OLDEST_PENDING.set(now - oldest if oldest else 0.0, queue=self.name)
+        return row
+
+    def _finish(self, job_id: int, version: int, kind: str, attempts: int, error: Optional[str]):
+        with self._lock:
+            if error is None:
+                deleted = self._conn.execute(
+                    "DELETE FROM jobs WHERE id = ? AND version = ?", (job_id, version)
+                ).rowcount
+                if not deleted:
+                    # Re-enqueued while running: run again with the newer payload
+                    self._conn.execute("UPDATE jobs SET status = 'pending' WHERE id = ?", (job_id,))
+                    self._wakeup.notify()
+                else:
+                    self._depth -= 1
+            elif attempts + 1 >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', attempts = ?, error = ? WHERE id = ?",
+                    (attempts + 1, error, job_id)
+                )
+                self._depth -= 1
+                JOBS.inc(queue=self.name, kind=kind, outcome="failed")
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'pending', attempts = ?, error = ?, run_after = ? WHERE id = ?",
+                    (attempts + 1, error, time.time() + self.retry_delay * (2 ** attempts), job_id)
+                )
+                JOBS.inc(queue=self.name, kind=kind, outcome="retried")
+            QUEUE_DEPTH.set(self._depth, queue=self.name)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                job = None
+                while not self._stopping:
+                    job = self._claim()
+                    if job:
+                        break
+                    self._wakeup.wait(timeout=self.retry_delay)
+                if self._stopping:
+                    return
+            job_id, kind, payload, version, attempts, enqueued_at = job
+            QUEUE_LAG.observe(max(0.0, time.time() - enqueued_at), queue=self.name, kind=kind)
+            start = time.perf_counter()
+            error = None
+            try:
+                handler = self.handlers.get(kind)
+                if handler is None:
+                    raise ValueError(f"no handler for job kind {kind!r}")
+                handler(json.loads(payload))
+                JOBS.inc(queue=self.name, kind=kind, outcome="succeeded")
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning("⚠️ Job %s (%s) failed on attempt %d: %s", job_id, kind, attempts + 1, error)
+            JOB_DURATION.observe(time.perf_counter() - start, queue=self.name, kind=kind)
+            self._finish(job_id, version, kind, attempts, error)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM jobs WHERE status = 'pending'"
+            ).fetchone()[0]
+        return {
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_pending_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "max_pending": self.max_pending,
+        }
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
@@ -0,0 +1,163 @@
+"""
+Lexical Index Module for LawGPT
+Incremental BM25 inverted index with a tokenizer that keeps legal tokens
+(section numbers, subsections, citations, party names) intact.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter
+from itertools import islice
+from typing import Dict, List, Tuple
+
+# Section numbers with subsections ("12(b)(iii)", "2-207", "1983.5"), the section
+# sign, and words with internal apostrophes/periods ("o'neil", "u.s.c")
+_TOKEN_RE = re.compile(
+    r"§+"
+    r"|\d+(?:[.\-:]\d+)*(?:\([a-z0-9]{1,4}\))*"
+    r"|[a-z]+(?:[.'’][a-z]+)*\.?"
+    r"|[a-z0-9]+"
+)
+_SUBSECTION_RE = re.compile(r"\(([a-z0-9]{1,4})\)")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with which who what when where how i you we they he she "
+    "me my our your their them do does did not no can could should would please".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase and split text into index terms.
+
+    Compound legal tokens are kept whole and also expanded into their parts,
+    so "section 12(b)" matches queries for "12(b)" and for "12".
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        token = token.rstrip(".") if token.count(".") == 1 else token
+        if not token or token in STOPWORDS:
+            continue
+        terms.append(token)
+        if "(" in token:
+            base = token[:token.index("(")]
+            terms.append(base)
+            terms.extend(f"{base}({sub})" for sub in _SUBSECTION_RE.findall(token)[:1])
+        elif "." in token and token[0].isalpha():
+            # "u.s.c." also indexed as "usc"
+            terms.append(token.replace(".", ""))
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an append-only document collection.
+
+    Postings map each term to {doc_id: term frequency}; IDF and length
+    normalization are computed at query time from running totals, so adding
+    a document touches only its own terms and a query touches only the
+    postings of its terms.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_postings_scanned: int = 4096):
+        self.k1 = k1
+        self.b = b
+        self.max_postings_scanned = max_postings_scanned
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, text: str) -> int:
+        """Index a document; returns its doc id (0, 1, 2, ...)"""
+        doc_id = len(self.doc_lengths)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+        return doc_id
+
+    def _query_terms(self, query: str) -> List[Tuple[Dict[int, int], float]]:
+        """(postings, idf) of each distinct query term present, rarest first"""
+        n_docs = len(self.doc_lengths)
+        terms = []
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings:
+                df = len(postings)
+                terms.append((postings, math.log(1 + (n_docs - df + 0.5) / (df + 0.5))))
+        terms.sort(key=lambda item: len(item[0]))
+        return terms
+
+    def _term_score(self, tf: int, doc_id: int, idf: float, avg_length: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score for every document containing at least one query term"""
+        if not self.doc_lengths:
+            return {}
+        avg_length = self.total_length / len(self.doc_lengths) or 1.0
+        scores: Dict[int, float] = {}
+        for postings, idf in self._query_terms(query):
+            for doc_id, tf in postings.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + self._term_score(tf, doc_id, idf, avg_length)
+        return scores
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Top-k (doc_id, score) pairs by descending BM25 score.
+
+        Terms are scored rarest first (MaxScore). Once the k-th best score so
+        far exceeds the most the remaining terms could add to an unseen
+        document (each term contributes < idf * (k1 + 1)), the remaining,
+        longer posting lists are only probed for the existing candidates.
+        Otherwise at most `max_postings_scanned` of a term's postings are
+        scanned, newest first, which bounds query cost for very common terms;
+        below that length the result is the same as exhaustive scoring.
+        """
+        if not self.doc_lengths:
+            return []
+        avg_length = self.total_length / len(self.doc_lengths) or 1.0
+        terms = self._query_terms(query)
+        bounds = [idf * (self.k1 + 1) for _, idf in terms]
+        remaining = sum(bounds)
+        scores: Dict[int, float] = {}
+        for (postings, idf), bound in zip(terms, bounds):
+            threshold = heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+            if len(scores) >= k and threshold >= remaining:
+                for doc_id in scores:
+                    tf = postings.get(doc_id)
+                    if tf:
+                        scores[doc_id] += self._term_score(tf, doc_id, idf, avg_length)
+            else:
+                scanned = postings.items()
+                if len(postings) > self.max_postings_scanned:
+                    scanned = islice(reversed(scanned), self.max_postings_scanned)
+                for doc_id, tf in scanned:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + self._term_score(tf, doc_id, idf, avg_length)
+            remaining -= bound
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> Dict[int, float]:
+    """
+    Fuse several ranked lists of ids: score(d) = sum over lists of 1 / (k + rank).
+
+    Args:
+        rankings: Ranked id lists, best first
+        k: Damping constant (60 is the value from the original RRF paper)
+
+    Returns:
+        Dict of id -> fused score
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -0,0 +1,362 @@
+"""
+Metrics & Logging Module for LawGPT
+Prometheus-style counters, gauges and histograms, per-request traces, and
+leveled, sampled logging
+"""
+
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Latency buckets (seconds) covering sub-ms tokenization up to 300s model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], key: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. in-flight requests"""
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Holds all metrics and renders them in Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_LATENCY = registry.histogram(
+    "lawgpt_stage_duration_seconds",
+    "Latency of each request-processing stage",
+    ["stage"]
+)
+STAGE_ERRORS = registry.counter(
+    "lawgpt_stage_errors_total",
+    "Stages that raised an exception",
+    ["stage"]
+)
+HTTP_REQUESTS = registry.counter(
+    "lawgpt_http_requests_total",
+    "HTTP requests by endpoint and status code",
+    ["endpoint", "method", "status"]
+)
+HTTP_LATENCY = registry.histogram(
+    "lawgpt_http_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["endpoint", "method"]
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "lawgpt_http_requests_in_flight",
+    "HTTP requests currently being processed",
+    ["endpoint"]
+)
+MODEL_REQUESTS = registry.counter(
+    "lawgpt_model_requests_total",
+    "Model generation calls by model and outcome",
+    ["model", "outcome"]
+)
+MODEL_IN_FLIGHT = registry.gauge(
+    "lawgpt_model_requests_in_flight",
+    "Model generation calls currently awaiting a response",
+    ["model"]
+)
+
+
+# ---------------- Tracing ----------------
+_active_trace: ContextVar[Optional["Trace"]] = ContextVar("lawgpt_trace", default=None)
+_span_path: ContextVar[str] = ContextVar("lawgpt_span_path", default="")
+
+
+class Trace:
+    """
+    Spans of one request, each named by its path from the outermost span
+    ("handle_message;build_semantic_context;embedding"). Only requests picked
+    for profiling carry a trace; everywhere else span recording is a single
+    ContextVar lookup.
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.spans: List[Dict] = []
+
+    @contextmanager
+    def span(self, name: str):
+        parent = _span_path.get()
+        token = _span_path.set(f"{parent};{name}" if parent else name)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            path = _span_path.get()
+            _span_path.reset(token)
+            span = {
+                "name": name,
+                "path": path,
+                "startMs": round((start - self.start) * 1000, 3),
+                "durationMs": round((end - start) * 1000, 3),
+            }
+            if error:
+                span["error"] = error
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        return {"traceId": self.trace_id, "spans": sorted(self.spans, key=lambda span: span["startMs"])}
+
+
+def current_trace() -> Optional[Trace]:
+    return _active_trace.get()
+
+
+def start_trace(trace_id: str) -> Trace:
+    """Make a new trace the active one for the current request"""
+    trace = Trace(trace_id)
+    _active_trace.set(trace)
+    _span_path.set("")
+    return trace
+
+
+def end_trace():
+    _active_trace.set(None)
+    _span_path.set("")
+
+
+def traced(name: str):
+    """Record calls of the decorated function as spans of the active trace, if any"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            trace = _active_trace.get()
+            if trace is None:
+                return f(*args, **kwargs)
+            with trace.span(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time a request-processing stage into lawgpt_stage_duration_seconds, and
+    as a span of the active trace.
+
+    Args:
+        stage: Stage name, e.g. 'extraction', 'model_call', 'node_save'
+    """
+    trace = _active_trace.get()
+    if not METRICS_ENABLED and trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        if trace is None:
+            yield
+        else:
+            with trace.span(stage):
+                yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+# ---------------- Logging ----------------
+class SamplingFilter(logging.Filter):
+    """Pass a fraction of records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+def get_logger(name: str, level: Optional[str] = None, sample_rate: Optional[float] = None) -> logging.Logger:
+    """
+    Get a leveled, sampled logger for the chat service.
+
+    Messages should use %-style arguments (logger.info("x=%s", x)) so that
+    formatting is skipped entirely when the level is disabled.
+
+    Args:
+        name: Logger name
+        level: Log level name, defaults to LOG_LEVEL
+        sample_rate: Fraction of DEBUG/INFO records to keep, defaults to LOG_SAMPLE_RATE
+
+    Returns:
+        Configured logging.Logger
+    """
+    logger = logging.getLogger(name)
+    if getattr(logger, "_lawgpt_configured", False):
+        return logger
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate < 1.0:
+        handler.addFilter(SamplingFilter(rate))
+    logger.addHandler(handler)
+    logger.setLevel(level or LOG_LEVEL)
+    logger.propagate = False
+    logger._lawgpt_configured = True
+    return logger
@@ -1,6 +1,24 @@
 import jwt from "jsonwebtoken";
 import User from "../models/User.js";
 
+// Short-lived assertion signed by the Flask server with INTERNAL_SERVICE_SECRET.
+// It stands in for the user's token on service-to-service calls, so the token
+// is not verified twice and the user is not re-loaded from MongoDB.
+const SERVICE_ASSERTION_HEADER = "X-Service-Assertion";
+
+const verifyServiceAssertion = (assertion) => {
+  const secret = process.env.INTERNAL_SERVICE_SECRET;
+  if (!secret) {
+    return null;
+  }
+  const claims = jwt.verify(assertion, secret, {
+    algorithms: ["HS256"],
+    issuer: "lawgpt-flask",
+    audience: "lawgpt-node",
+  });
+  return claims.sub ? { id: String(claims.sub), _id: String(claims.sub), service: true } : null;
+};
+
 const authMiddleware = async (req, res, next) => {
   try {
     const authHeader = req.header("Authorization");
@@ -35,4 +53,24 @@ const authMiddleware = async (req, res, next) => {
   }
 };
 
+// For the routes Flask calls: a service assertion if one is sent, else the
+// user's token as usual. Every other route takes only the user's token.
+export const serviceAuthMiddleware = (req, res, next) => {
+  const assertion = req.header(SERVICE_ASSERTION_HEADER);
+  if (!assertion) {
+    return authMiddleware(req, res, next);
+  }
+  try {
+    const serviceUser = verifyServiceAssertion(assertion);
+    if (!serviceUser) {
+      return res.status(401).json({ message: "Service assertion not accepted" });
+    }
+    req.user = serviceUser;
+    next();
+  } catch (error) {
+    console.error("Service auth error:", error);
+    res.status(401).json({ message: "Service assertion not accepted" });
+  }
+};
+
 export default authMiddleware;
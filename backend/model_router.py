@@ -0,0 +1,410 @@
+"""
+Model Router Module for LawGPT
+Routes generation requests across model replicas with least-outstanding-requests
+balancing, per-replica concurrency limits, bounded wait queues, per-replica
+circuit breakers and optional hedged requests.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from circuit_breaker import CircuitBreaker, OPEN
+from metrics import registry, get_logger
+
+logger = get_logger("lawgpt.model_router")
+
+ROUTER_QUEUE_DEPTH = registry.gauge(
+    "lawgpt_model_router_queue_depth",
+    "Requests waiting for a free replica slot",
+    ["model"]
+)
+ROUTER_REJECTIONS = registry.counter(
+    "lawgpt_model_router_rejections_total",
+    "Requests rejected by the router without calling a replica",
+    ["model", "reason"]
+)
+REPLICA_OUTSTANDING = registry.gauge(
+    "lawgpt_model_replica_outstanding",
+    "Requests currently outstanding per replica",
+    ["replica"]
+)
+BREAKER_TRIPS = registry.counter(
+    "lawgpt_model_breaker_trips_total",
+    "Times a replica's circuit breaker opened",
+    ["replica", "reason"]
+)
+BREAKER_OPEN = registry.gauge(
+    "lawgpt_model_breaker_open",
+    "1 while a replica's circuit breaker is open",
+    ["replica"]
+)
+HEDGED_REQUESTS = registry.counter(
+    "lawgpt_model_hedged_requests_total",
+    "Hedge requests sent to a second replica, by which call won",
+    ["model", "winner"]
+)
+
+# Successful-call latencies kept per replica for the hedge delay (p95)
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+
+
+class ModelRouterError(Exception):
+    """Raised when a request cannot be routed; carries an HTTP status and retry hint"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+class RouterSaturated(ModelRouterError):
+    """Every replica is at its concurrency limit and the wait queue is full"""
+    status_code = 429
+
+
+class NoHealthyReplica(ModelRouterError):
+    """Every replica for the model has an open circuit breaker"""
+    status_code = 503
+
+
+class Replica:
+    """A single model server; shared by every model name that routes to the same URL"""
+
+    def __init__(self, url: str, max_concurrency: int, breaker: CircuitBreaker):
+        self.url = url
+        self.name = urlsplit(url).netloc or url
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def available(self, now: float) -> bool:
+        return self.outstanding < self.max_concurrency and self.breaker.can_attempt(now)
+
+    def healthy(self, now: float) -> bool:
+        return not self.breaker.is_open(now)
+
+    def p95_latency(self) -> Optional[float]:
+        if len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def snapshot(self, now: float) -> Dict:
+        p95 = self.p95_latency()
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "healthy": self.healthy(now),
+            "breaker": self.breaker.snapshot(now),
+            "ewma_latency_seconds": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "p95_latency_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class Lease:
+    """Handle on a checked-out replica slot (and its breaker probe token, if it is a probe)"""
+
+    def __init__(self, replica: Replica, probe: Optional[int] = None):
+        self.replica = replica
+        self.url = replica.url
+        self.probe = probe
+        self.failed = False
+
+    def mark_failed(self):
+        self.failed = True
+
+
+class ModelRouter:
+    """
+    Balances model requests across replicas.
+
+    Each model maps to one or more replica URLs. Replicas are shared between
+    models with the same URL so their concurrency limit reflects the real
+    server. A request takes the available replica with the fewest outstanding
+    requests; if all are at their limit it waits in a bounded per-model queue,
+    and is rejected (RouterSaturated -> 429) once the queue is full or the
+    wait exceeds queue_timeout. Replicas whose circuit breaker is open are
+    skipped; if every replica is open the request fails fast with
+    NoHealthyReplica (503).
+    """
+
+    def __init__(
+        self,
+        endpoints: Dict[str, Union[str, List[str]]],
+        default_model: str,
+        max_concurrency: int = 4,
+        max_queue: int = 16,
+        queue_timeout: float = 30.0,
+        failure_threshold: int = 3,
+        open_seconds: float = 30.0,
+        latency_slo: float = 60.0,
+        slo_breach_threshold: int = 5,
+        failure_exceptions: Tuple[type, ...] = ()
+    ):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.failure_exceptions = failure_exceptions
+        self._cond = threading.Condition()
+        self._replicas: Dict[str, Replica] = {}
+        self._pools: Dict[str, List[Replica]] = {}
+        self._waiting: Dict[str, int] = {}
+
+        for model, urls in endpoints.items():
+            if isinstance(urls, str):
+                urls = [urls]
+            pool = []
+            for url in urls:
+                if url not in self._replicas:
+                    breaker = CircuitBreaker(
+                        failure_threshold=failure_threshold,
+                        open_seconds=open_seconds,
+                        latency_slo=latency_slo,
+                        slo_breach_threshold=slo_breach_threshold
+                    )
+                    self._replicas[url] = Replica(url, max_concurrency, breaker)
+                pool.append(self._replicas[url])
+            self._pools[model.upper()] = pool
+            self._waiting[model.upper()] = 0
+        self.default_model = default_model.upper()
+
+        # Models that share a replica share its concurrency: group overlapping pools
+        groups: List[Tuple[List[str], set]] = []
+        for model, pool in self._pools.items():
+            models, urls = [model], {r.url for r in pool}
+            for group in [group for group in groups if group[1] & urls]:
+                groups.remove(group)
+                models = group[0] + models
+                urls |= group[1]
+            groups.append((models, urls))
+        self._groups: Dict[str, str] = {}
+        self._group_capacity: Dict[str, int] = {}
+        for models, urls in groups:
+            key = "+".join(models)
+            self._group_capacity[key] = sum(self._replicas[url].max_concurrency for url in urls)
+            for model in models:
+                self._groups[model] = key
+
+        # Leases are checked out before submitting, so this never queues
+        capacity = sum(r.max_concurrency for r in self._replicas.values())
+        self._executor = ThreadPoolExecutor(max_workers=max(capacity, 1), thread_name_prefix="model-hedge")
+
+    def resolve(self, model: str) -> str:
+        model = (model or self.default_model).upper()
+        return model if model in self._pools else self.default_model
+
+    def models(self) -> List[str]:
+        return list(self._pools)
+
+    def capacity(self, model: str) -> int:
+        """Combined concurrency limit of a model's replicas"""
+        return sum(r.max_concurrency for r in self._pools[self.resolve(model)])
+
+    def capacity_group(self, model: str) -> str:
+        """Key shared by all models whose replicas overlap with this model's"""
+        return self._groups[self.resolve(model)]
+
+    def capacity_groups(self) -> Dict[str, int]:
+        """Combined concurrency limit of each group of models sharing replicas"""
+        return dict(self._group_capacity)
+
+    def _pick(self, pool: List[Replica], now: float, exclude: Optional[Replica] = None) -> Optional[Replica]:
+        candidates = [r for r in pool if r is not exclude and r.available(now)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda r: (r.outstanding / r.max_concurrency, r.outstanding))
+
+    def _retry_after(self, model: str) -> float:
+        """Rough wait estimate: typical latency scaled by queue depth over capacity"""
+        pool = self._pools[model]
+        latencies = [r.ewma_latency for r in pool if r.ewma_latency is not None]
+        typical = sum(latencies) / len(latencies) if latencies else 5.0
+        capacity = sum(r.max_concurrency for r in pool) or 1
+        return typical * (1 + self._waiting[model] / capacity)
+
+    def _no_healthy_replica(self, model: str, now: float) -> NoHealthyReplica:
+        ROUTER_REJECTIONS.inc(model=model, reason="breaker_open")
+        soonest = min(r.breaker.opened_until for r in self._pools[model]) - now
+        return NoHealthyReplica(f"No healthy replica for {model}", soonest)
+
+    def _dispatch(self, replica: Replica, now: float) -> Lease:
+        replica.outstanding += 1
+        probe = replica.breaker.on_dispatch(now)
+        REPLICA_OUTSTANDING.inc(replica=replica.name)
+        return Lease(replica, probe)
+
+    def _checkout(self, model: str) -> Lease:
+        pool = self._pools[model]
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            now = time.monotonic()
+            replica = self._pick(pool, now)
+            if replica is None:
+                if not any(r.healthy(now) for r in pool):
+                    raise self._no_healthy_replica(model, now)
+                if self._waiting[model] >= self.max_queue:
+                    ROUTER_REJECTIONS.inc(model=model, reason="queue_full")
+                    raise RouterSaturated(f"{model} is at capacity", self._retry_after(model))
+
+                self._waiting[model] += 1
+                ROUTER_QUEUE_DEPTH.inc(model=model)
+                try:
+                    while replica is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            ROUTER_REJECTIONS.inc(model=model, reason="queue_timeout")
+                            raise RouterSaturated(f"Timed out waiting for {model}", self._retry_after(model))
+                        # Wake at least when the nearest open breaker goes half-open
+                        now = time.monotonic()
+                        reopening = [r.breaker.opened_until - now for r in pool
+                                     if r.breaker.state == OPEN and r.breaker.opened_until > now]
+                        self._cond.wait(min([remaining] + reopening))
+                        now = time.monotonic()
+                        replica = self._pick(pool, now)
+                        if replica is None and not any(r.healthy(now) for r in pool):
+                            raise self._no_healthy_replica(model, now)
+                finally:
+                    self._waiting[model] -= 1
+                    ROUTER_QUEUE_DEPTH.dec(model=model)
+
+            return self._dispatch(replica, now)
+
+    def _try_checkout(self, model: str, exclude: Replica) -> Optional[Lease]:
+        """Non-blocking checkout of a different replica, used for hedges"""
+        with self._cond:
+            now = time.monotonic()
+            replica = self._pick(self._pools[model], now, exclude=exclude)
+            return self._dispatch(replica, now) if replica else None
+
+    def _release(self, lease: Lease, latency: float):
+        replica = lease.replica
+        ok = not lease.failed
+        with self._cond:
+            now = time.monotonic()
+            replica.outstanding -= 1
+            was_open = replica.breaker.state == OPEN
+            if ok:
+                replica.breaker.record_success(latency, now, lease.probe)
+                replica.latencies.append(latency)
+                replica.ewma_latency = latency if replica.ewma_latency is None else \
+                    0.8 * replica.ewma_latency + 0.2 * latency
+            else:
+                replica.breaker.record_failure(now, lease.probe)
+            if replica.breaker.state == OPEN and not was_open:
+                BREAKER_TRIPS.inc(replica=replica.name, reason=replica.breaker.last_trip_reason)
+                logger.warning("⚠️ Circuit open for %s (%s) for %.1fs", replica.name,
+                               replica.breaker.last_trip_reason, replica.breaker.opened_until - now)
+            BREAKER_OPEN.set(1 if replica.breaker.state == OPEN else 0, replica=replica.name)
+            self._cond.notify_all()
+        REPLICA_OUTSTANDING.dec(replica=replica.name)
+
+    @contextmanager
+    def _leased(self, lease: Lease):
+        start = time.monotonic()
+        try:
+            yield lease
+        except self.failure_exceptions:
+            lease.mark_failed()
+            raise
+        finally:
+            self._release(lease, time.monotonic() - start)
+
+    @contextmanager
+    def acquire(self, model: str):
+        """
+        Check out a replica slot for a model.
+
+        Args:
+            model: Model name (case-insensitive); unknown names use the default model
+
+        Yields:
+            Lease with the replica URL; call lease.mark_failed() for
+            responses that should count against the replica's health
+
+        Raises:
+            RouterSaturated: No slot became free within queue_timeout or the queue is full
+            NoHealthyReplica: Every replica for the model has an open breaker
+        """
+        with self._leased(self._checkout(self.resolve(model))) as lease:
+            yield lease
+
+    def _run_leased(self, lease: Lease, send: Callable[[Lease], object]):
+        with self._leased(lease):
+            return send(lease), lease.failed
+
+    def execute(self, model: str, send: Callable[[Lease], object], hedge: bool = False):
+        """
+        Run `send(lease)` against a replica, optionally hedging to a second one.
+
+        With hedge=True and at least two replicas, a second copy of the
+        request goes to another available replica if the first has not
+        answered within that replica's p95 latency. The first usable response
+        wins; the other call runs to completion in the background and still
+        reports its outcome to its breaker.
+
+        Args:
+            model: Model name (case-insensitive)
+            send: Callable taking a Lease and returning the response; it may
+                call lease.mark_failed() for unusable responses
+            hedge: Whether hedging is allowed for this request
+
+        Returns:
+            Whatever `send` returned for the winning call
+        """
+        model = self.resolve(model)
+        if not hedge or len(self._pools[model]) < 2:
+            with self.acquire(model) as lease:
+                return send(lease)
+
+        primary = self._checkout(model)
+        futures = {self._executor.submit(self._run_leased, primary, send): "primary"}
+        hedge_delay = primary.replica.p95_latency()
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                secondary = self._try_checkout(model, exclude=primary.replica)
+                if secondary is not None:
+                    futures[self._executor.submit(self._run_leased, secondary, send)] = "hedge"
+
+        pending = set(futures)
+        last_error = None
+        fallback = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, failed = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if failed and pending:
+                    # Unusable response (e.g. 5xx); give the other call a chance
+                    fallback = result
+                    continue
+                if len(futures) > 1:
+                    HEDGED_REQUESTS.inc(model=model, winner=futures[future])
+                return result
+        if fallback is not None:
+            return fallback
+        raise last_error
+
+    def snapshot(self) -> Dict:
+        """Replica and breaker state per model, for the /health endpoint"""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                model: {
+                    "waiting": self._waiting[model],
+                    "replicas": [r.snapshot(now) for r in pool],
+                }
+                for model, pool in self._pools.items()
+            }
@@ -22,7 +22,10 @@ const messageSchema = new mongoose.Schema({
     // NEW: Store extracted text for edit scenarios
     // This allows re-using file data when editing messages
     extractedText: { type: String }
-  }
+  },
+  // Set by Flask's conversation writer on both messages of a turn, so a
+  // retried append can be recognised instead of saved twice
+  turnId: { type: String }
 }, { _id: true });
 
 const chatSessionSchema = new mongoose.Schema(
@@ -61,6 +64,7 @@ chatSessionSchema.pre("save", function(next) {
 // Add indexes for better query performance
 chatSessionSchema.index({ userId: 1, updatedAt: -1 });
 chatSessionSchema.index({ conversationId: 1 });
+chatSessionSchema.index({ userId: 1, "messages.turnId": 1 }, { sparse: true });
 
 const ChatSession = mongoose.model("ChatSession", chatSessionSchema);
 export default ChatSession;
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Prefetch Cache Module for LawGPT
+Short-lived per-session cache of fetched chat history. It is filled by the
+prefetch endpoint (session opened, user typing) and by each chat turn, so
+context building on submit can skip the round-trip to the Node.js server.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from metrics import registry
+from session_index import message_chars
+
+SESSION_CACHE = registry.counter(
+    "lawgpt_session_cache_total",
+    "Session history lookups served from the prefetch cache (hit) or not (miss, expired)",
+    ["result"]
+)
+SESSION_CACHE_CHARS = registry.gauge(
+    "lawgpt_session_cache_chars",
+    "Message and document text held by the session prefetch cache"
+)
+
+
+class SessionMessageCache:
+    """
+    LRU of {(user_id, session_id): messages} with a TTL and a memory cap.
+
+    An entry expires `ttl` seconds after it was fetched. Appending a turn
+    that this service just saved keeps it current but does not extend its
+    life, so changes made elsewhere (another tab, an edit) show up within
+    `ttl`. Size is counted as
+    session_index.message_chars over the messages. Sessions larger than
+    `max_session_chars` are not cached. Callers treat the returned lists
+    as read-only.
+
+    Args:
+        ttl: Seconds an entry is trusted after it was fetched
+        max_sessions: Bound on cached sessions
+        max_chars: Bound on text held across all sessions
+        max_session_chars: Largest single session worth caching
+    """
+
+    def __init__(self, ttl: float = 300.0, max_sessions: int = 256, max_chars: int = 50_000_000,
+                 max_session_chars: Optional[int] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.max_session_chars = max_session_chars if max_session_chars is not None else max_chars // 4
+        self._entries: "OrderedDict[tuple, list]" = OrderedDict()  # key -> [messages, chars, expires_at]
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id: str, session_id: str) -> tuple:
+        return (str(user_id), str(session_id))
+
+    def _drop(self, key: tuple):
+        self._chars -= self._entries.pop(key)[1]
+
+    def _evict(self, now: float):
+        """Expired entries first, then least recently used until within the caps; caller holds the lock"""
+        for key in [key for key, entry in self._entries.items() if entry[2] <= now]:
+            self._drop(key)
+        while self._entries and (len(self._entries) > self.max_sessions or self._chars > self.max_chars):
+            self._drop(next(iter(self._entries)))
+        SESSION_CACHE_CHARS.set(self._chars)
+
+    def get(self, user_id: str, session_id: str) -> Optional[List[Dict]]:
+        """Cached messages of a session, or None"""
+        key = self._key(user_id, session_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                SESSION_CACHE.inc(result="miss")
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop(key)
+                SESSION_CACHE_CHARS.set(self._chars)
+                SESSION_CACHE.inc(result="expired")
+                return None
+            self._entries.move_to_end(key)
+            SESSION_CACHE.inc(result="hit")
+            return entry[0]
+
+    def peek(self, user_id: str, session_id: str, min_remaining: float = 0.0) -> Optional[List[Dict]]:
+        """Cached messages with at least min_remaining seconds to live, without counting a lookup"""
+        with self._lock:
+            entry = self._entries.get(self._key(user_id, session_id))
+            if entry is None or entry[2] - time.monotonic() <= min_remaining:
+                return None
+            return entry[0]
+
+    def put(self, user_id: str, session_id: str, messages: List[Dict]):
+        key = self._key(user_id, session_id)
+        chars = sum(message_chars(msg) for msg in messages)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if chars <= self.max_session_chars:
+                self._entries[key] = [list(messages), chars, now + self.ttl]
+                self._chars += chars
+            self._evict(now)
+
+    def extend(self, user_id: str, session_id: str, messages: List[Dict]) -> bool:
+        """
+        Append just-saved messages to a cached session (copy-on-write, so
+        readers holding the old list are unaffected). The entry keeps the
+        expiry it got when it was fetched.
+
+        Returns:
+            Whether the session was cached
+        """
+        key = self._key(user_id, session_id)
+        chars = sum(message_chars(msg) for msg in messages)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                return False
+            if entry[1] + chars > self.max_session_chars:
+                self._drop(key)
+                SESSION_CACHE_CHARS.set(self._chars)
+                return False
+            entry[0] = entry[0] + list(messages)
+            entry[1] += chars
+            self._chars += chars
+            self._entries.move_to_end(key)
+            self._evict(now)
+            return True
+
+    def invalidate(self, user_id: str, session_id: str):
+        with self._lock:
+            key = self._key(user_id, session_id)
+            if key in self._entries:
+                self._drop(key)
+                SESSION_CACHE_CHARS.set(self._chars)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sessions": len(self._entries), "chars": self._chars}
+
+    def __len__(self):
+        return len(self._entries)
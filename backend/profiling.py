@@ -0,0 +1,224 @@
+"""
+Profiling Module for LawGPT
+Opt-in per-request profiling: a wall-clock stack sampler for the request's
+thread plus its trace (see metrics.Trace), kept for requests that asked for
+it with a header or that turned out to be among the slowest of their
+endpoint. Stacks are written in collapsed format ("frame;frame;frame count"),
+which flamegraph.pl, speedscope and inferno read directly.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Dict, Optional
+
+from metrics import registry, get_logger, start_trace, end_trace, Trace
+
+logger = get_logger("lawgpt.profiling")
+
+PROFILES_WRITTEN = registry.counter(
+    "lawgpt_profiles_written_total",
+    "Request profiles written by trigger (header, slow)",
+    ["trigger"]
+)
+
+
+class StackSampler:
+    """
+    Samples the current stack of registered threads every `interval`
+    seconds. The sampling thread only runs while some thread is registered,
+    so an idle sampler costs nothing.
+
+    Args:
+        interval: Seconds between samples
+        max_depth: Innermost frames kept per stack
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 96):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stacks: Dict[int, Counter] = {}
+        self._labels: Dict[object, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int):
+        with self._lock:
+            self._stacks[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id: int) -> Counter:
+        """Stop sampling a thread; returns its {collapsed stack: samples}"""
+        with self._lock:
+            return self._stacks.pop(thread_id, Counter())
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _collapse(self, frame) -> str:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stacks:
+                    self._thread = None
+                    return
+                thread_ids = list(self._stacks)
+            frames = sys._current_frames()
+            stacks = [(thread_id, self._collapse(frames[thread_id])) for thread_id in thread_ids if thread_id in frames]
+            del frames
+            with self._lock:
+                for thread_id, stack in stacks:
+                    counter = self._stacks.get(thread_id)
+                    if counter is not None:
+                        counter[stack] += 1
+            time.sleep(self.interval)
+
+
+class ProfiledRequest:
+    """A request being profiled: its trace, sampled thread and trigger"""
+
+    __slots__ = ("endpoint", "method", "trigger", "trace", "thread_id", "start")
+
+    def __init__(self, endpoint: str, method: str, trigger: str, trace: Trace, thread_id: int):
+        self.endpoint = endpoint
+        self.method = method
+        self.trigger = trigger
+        self.trace = trace
+        self.thread_id = thread_id
+        self.start = time.perf_counter()
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and writes their profiles.
+
+    A request is profiled when it carries the profile header (equal to
+    `header_token` when one is set), or, with `slow_percent` > 0, when it
+    is one of the `sample_rate` fraction of requests sampled speculatively.
+    A speculative profile is kept only if the request was slower than the
+    (100 - slow_percent)th percentile of its endpoint's last `window`
+    requests. Each kept profile is <name>.collapsed plus <name>.trace.json
+    in `directory`; beyond `max_files` profiles the oldest are removed.
+
+    Args:
+        directory: Where profiles are written
+        header_token: Value the profile header must carry ("" accepts any non-empty value)
+        slow_percent: Keep profiles of the slowest N% of requests (0 disables)
+        sample_rate: Fraction of requests sampled while waiting to see if they are slow
+        interval: Seconds between stack samples
+        window: Recent requests per endpoint the slowness percentile is taken over
+        min_window: Requests an endpoint needs before any of them counts as slow
+        max_files: Profiles kept on disk
+    """
+
+    def __init__(self, directory: str, header_token: str = "", slow_percent: float = 0.0,
+                 sample_rate: float = 1.0, interval: float = 0.005, window: int = 1000,
+                 min_window: int = 50, max_files: int = 200):
+        self.directory = directory
+        self.header_token = header_token
+        self.slow_percent = slow_percent
+        self.sample_rate = sample_rate
+        self.window = window
+        self.min_window = min_window
+        self.max_files = max_files
+        self.sampler = StackSampler(interval)
+        self._durations: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, endpoint: str, method: str, header_value: Optional[str],
+              request_id: Optional[str] = None) -> Optional[ProfiledRequest]:
+        """Start profiling the current request if a trigger applies; None otherwise"""
+        if header_value and (not self.header_token or header_value == self.header_token):
+            trigger = "header"
+        elif self.slow_percent > 0 and random.random() < self.sample_rate:
+            trigger = "slow"
+        else:
+            return None
+        trace_id = "".join(c for c in (request_id or "")[:64] if c.isalnum() or c in "-_")
+        thread_id = threading.get_ident()
+        self.sampler.start(thread_id)
+        trace = start_trace(trace_id or uuid.uuid4().hex[:16])
+        return ProfiledRequest(endpoint, method, trigger, trace, thread_id)
+
+    def _is_slow(self, endpoint: str, duration: float) -> bool:
+        """Whether duration is in the slowest slow_percent of the endpoint's recent requests (then record it)"""
+        with self._lock:
+            durations = self._durations.setdefault(endpoint, deque(maxlen=self.window))
+            slow = False
+            if len(durations) >= self.min_window:
+                ranked = sorted(durations)
+                slow = duration > ranked[min(len(ranked) - 1, int(len(ranked) * (1 - self.slow_percent / 100.0)))]
+            durations.append(duration)
+        return slow
+
+    def end(self, profiled: ProfiledRequest, status: Optional[int] = None) -> Optional[str]:
+        """
+        Stop profiling and write the profile if it is to be kept.
+
+        Returns:
+            Path of the written .collapsed file, or None
+        """
+        duration = time.perf_counter() - profiled.start
+        stacks = self.sampler.stop(profiled.thread_id)
+        end_trace()
+        if profiled.trigger == "slow" and not self._is_slow(profiled.endpoint, duration):
+            return None
+        try:
+            return self._write(profiled, stacks, duration, status)
+        except OSError as e:
+            logger.warning("⚠️ Could not write profile %s: %s", profiled.trace.trace_id, e)
+            return None
+
+    def _write(self, profiled: ProfiledRequest, stacks: Counter, duration: float, status: Optional[int]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        endpoint = "".join(c if c.isalnum() else "_" for c in profiled.endpoint).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{profiled.trace.trace_id}"
+        path = os.path.join(self.directory, name + ".collapsed")
+        with open(path, "w", encoding="utf-8") as profile_file:
+            for stack, samples in stacks.most_common():
+                profile_file.write(f"{stack} {samples}\n")
+        with open(os.path.join(self.directory, name + ".trace.json"), "w", encoding="utf-8") as trace_file:
+            json.dump({
+                **profiled.trace.to_dict(),
+                "endpoint": profiled.endpoint,
+                "method": profiled.method,
+                "status": status,
+                "trigger": profiled.trigger,
+                "durationMs": round(duration * 1000, 3),
+                "samples": sum(stacks.values()),
+                "sampleIntervalMs": self.sampler.interval * 1000,
+            }, trace_file, indent=2)
+        PROFILES_WRITTEN.inc(trigger=profiled.trigger)
+        logger.info("🔬 Profiled %s %s (%s, %.0f ms): %s",
+                    profiled.method, profiled.endpoint, profiled.trigger, duration * 1000, path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        profiles = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".collapsed")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in profiles[:max(0, len(profiles) - self.max_files)]:
+            for path in (entry.path, entry.path[:-len(".collapsed")] + ".trace.json"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,211 @@
+"""
+Ranking Module for LawGPT
+Vectorized, pluggable scoring of retrieval candidates over a precomputed
+per-row feature array, with MMR selection to drop near-duplicate messages.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# One row per indexed message / document chunk (see session_index.SessionIndex)
+FEATURE_DTYPE = np.dtype([
+    ('position', np.int32),       # ordinal of the source message in the session
+    ('timestamp', np.float64),    # unix seconds, NaN if unknown
+    ('is_user', np.bool_),
+    ('has_attachment', np.bool_),
+    ('is_document', np.bool_),
+])
+
+
+def parse_timestamp(value) -> float:
+    """
+    Convert a message timestamp (ISO string from MongoDB JSON, epoch
+    milliseconds or datetime) to unix seconds; NaN if missing or invalid.
+    """
+    if value is None:
+        return float('nan')
+    if isinstance(value, (int, float)):
+        # JavaScript Date.now() style milliseconds
+        return float(value) / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, dict) and '$date' in value:
+        return parse_timestamp(value['$date'])
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return float('nan')
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float('nan')
+
+
+class RankingContext:
+    """Inputs shared by all scorers for one query"""
+
+    def __init__(self, similarities: np.ndarray, features: np.ndarray, message_count: int,
+                 now: Optional[float] = None):
+        self.similarities = similarities
+        self.features = features
+        self.message_count = message_count
+        self.now = time.time() if now is None else now
+
+    @property
+    def position_recency(self) -> np.ndarray:
+        """Position-based recency, most recent message = 1.0"""
+        return self.features['position'] / max(self.message_count - 1, 1)
+
+
+class Scorer:
+    """A weighted, vectorized score over all rows; subclasses implement `score`"""
+
+    name = "scorer"
+
+    def __init__(self, weight: float = 1.0):
+        self.weight = weight
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SemanticScorer(Scorer):
+    """Cosine similarity between the query and each row"""
+
+    name = "semantic"
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        return ctx.similarities
+
+
+class PositionRecencyScorer(Scorer):
+    """Legacy recency: linear in message position, ignoring timestamps"""
+
+    name = "position_recency"
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        return ctx.position_recency
+
+
+class TimestampDecayScorer(Scorer):
+    """
+    Exponential decay by message age: 1.0 now, 0.5 after `half_life_hours`.
+    Rows without a timestamp fall back to position-based recency.
+    """
+
+    name = "timestamp_decay"
+
+    def __init__(self, weight: float = 1.0, half_life_hours: float = 72.0):
+        super().__init__(weight)
+        self.half_life_seconds = half_life_hours * 3600.0
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        timestamps = ctx.features['timestamp']
+        age = np.maximum(ctx.now - timestamps, 0.0)
+        decay = np.exp2(-age / self.half_life_seconds)
+        missing = np.isnan(timestamps)
+        if missing.any():
+            decay = np.where(missing, ctx.position_recency, decay)
+        return decay
+
+
+class SenderScorer(Scorer):
+    """Per-sender bonus, e.g. prefer the user's own statements of fact"""
+
+    name = "sender"
+
+    def __init__(self, weight: float = 1.0, user: float = 1.0, bot: float = 0.0):
+        super().__init__(weight)
+        self.user = user
+        self.bot = bot
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        return np.where(ctx.features['is_user'], self.user, self.bot)
+
+
+class AttachmentBoostScorer(Scorer):
+    """Boost messages that carried a file and chunks of attached documents"""
+
+    name = "attachment"
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        return ctx.features['has_attachment'].astype(np.float64)
+
+
+class RankingPipeline:
+    """
+    Relevance = sum of weight * score over scorers, each a whole-array
+    operation. Selection then greedily applies MMR (maximal marginal
+    relevance) over the best candidates and drops rows whose embedding is
+    nearly identical to one already selected.
+
+    Args:
+        scorers: Scorers to combine (zero-weight scorers are skipped)
+        mmr_lambda: Relevance vs. diversity trade-off in (0, 1]; None disables MMR
+        dedupe_threshold: Cosine similarity above which a candidate counts as a duplicate; None disables
+        candidate_pool: Minimum number of top candidates considered by selection
+    """
+
+    def __init__(self, scorers: List[Scorer], mmr_lambda: Optional[float] = None,
+                 dedupe_threshold: Optional[float] = None, candidate_pool: int = 20):
+        self.scorers = [scorer for scorer in scorers if scorer.weight]
+        self.mmr_lambda = mmr_lambda
+        self.dedupe_threshold = dedupe_threshold
+        self.candidate_pool = candidate_pool
+
+    @classmethod
+    def default(cls, recency_weight: float = 0.3, half_life_hours: float = 72.0) -> "RankingPipeline":
+        """Semantic similarity blended with timestamp-decay recency"""
+        return cls([
+            SemanticScorer(1 - recency_weight),
+            TimestampDecayScorer(recency_weight, half_life_hours=half_life_hours),
+        ])
+
+    def score(self, ctx: RankingContext) -> np.ndarray:
+        relevance = np.zeros(len(ctx.features), dtype=np.float64)
+        for scorer in self.scorers:
+            relevance += scorer.weight * scorer.score(ctx)
+        return relevance
+
+    def components(self, ctx: RankingContext, rows: np.ndarray) -> List[Dict[str, float]]:
+        """Per-scorer scores of the given rows, for debugging and logging"""
+        columns = {scorer.name: scorer.score(ctx)[rows] for scorer in self.scorers}
+        return [{name: float(values[i]) for name, values in columns.items()} for i in range(len(rows))]
+
+    def select(self, relevance: np.ndarray, embeddings: np.ndarray, top_n: int) -> np.ndarray:
+        """
+        Pick up to top_n row indices by relevance, diversified by MMR and
+        de-duplicated by embedding similarity.
+        """
+        n_pool = min(len(relevance), max(top_n * 4, self.candidate_pool))
+        if n_pool == 0:
+            return np.empty(0, dtype=np.int64)
+        pool = np.argpartition(-relevance, n_pool - 1)[:n_pool]
+        pool = pool[np.argsort(-relevance[pool], kind='stable')]
+        if self.mmr_lambda is None and self.dedupe_threshold is None:
+            return pool[:top_n]
+
+        pool_embeddings = embeddings[pool]
+        pool_relevance = relevance[pool]
+        spread = pool_relevance.max() - pool_relevance.min()
+        pool_relevance = (pool_relevance - pool_relevance.min()) / spread if spread > 0 else np.ones(n_pool)
+
+        available = np.ones(n_pool, dtype=bool)
+        max_similarity = np.zeros(n_pool)
+        selected = []
+        while len(selected) < top_n and available.any():
+            if selected and self.mmr_lambda is not None:
+                objective = self.mmr_lambda * pool_relevance - (1 - self.mmr_lambda) * max_similarity
+            else:
+                objective = pool_relevance
+            best = int(np.argmax(np.where(available, objective, -np.inf)))
+            selected.append(best)
+            available[best] = False
+            similarity = pool_embeddings @ pool_embeddings[best]
+            max_similarity = similarity if len(selected) == 1 else np.maximum(max_similarity, similarity)
+            if self.dedupe_threshold is not None:
+                available &= max_similarity < self.dedupe_threshold
+        return pool[selected]
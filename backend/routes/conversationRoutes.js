@@ -1,6 +1,7 @@
 import express from "express";
 import { 
   saveConversation, 
+  appendConversation,
   saveBotResponseOnly,  // Add this
   getUserSessions, 
   deleteSession, 
@@ -9,7 +10,7 @@ import {
   updateMessage,
   regenerateResponse
 } from "../controllers/conversationController.js";
-import authMiddleware from "../middlewares/authMiddleware.js";
+import authMiddleware, { serviceAuthMiddleware } from "../middlewares/authMiddleware.js";
 
 const router = express.Router();
 
@@ -19,11 +20,14 @@ router.post("/new", authMiddleware, createNewSession);
 // Save conversation from Flask (called by Flask server)
 router.post("/save", authMiddleware, saveConversation);
 
+// Append-only save from Flask: coalesced turns in, new message ids out
+router.post("/append", serviceAuthMiddleware, appendConversation);
+
 // Save only bot response (for edits/regenerations)
 router.post("/save-bot-only", authMiddleware, saveBotResponseOnly);
 
-// Fetch all sessions for authenticated user
-router.get("/", authMiddleware, getUserSessions);
+// Fetch all sessions for authenticated user (also read by Flask)
+router.get("/", serviceAuthMiddleware, getUserSessions);
 
 // Update session title
 router.put("/:id", authMiddleware, updateSession);
@@ -6,21 +6,58 @@ Handles semantic similarity search for chat history
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Tuple
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+from collections import deque
+import heapq
+import time
 import requests
 import os
+from metrics import timed, traced, get_logger
+from lexical_index import reciprocal_rank_fusion
+from ranking import FEATURE_DTYPE, RankingContext, RankingPipeline
+from session_index import (
+    MAX_DOCUMENT_CHARS, SessionIndex, SessionIndexCache, chunk_text, message_chars, message_rows
+)
+
+try:
+    # Incremental JSON parser: lets fetch_session_messages stream the sessions
+    # payload instead of holding every session of the user in memory
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+logger = get_logger("lawgpt.semantic_search")
 
 class SemanticSearchEngine:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    # Candidates taken from each ranking before reciprocal rank fusion
+    FUSION_CANDIDATES = 50
+    RRF_K = 60
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", session_cache_size: int = 128,
+                 index_documents: bool = True, windowed_min_chars: Optional[int] = None,
+                 block_size: int = 256):
         """
         Initialize the semantic search engine with a sentence transformer model.
         
         Args:
             model_name: Name of the sentence-transformers model to use
+            session_cache_size: Sessions whose embeddings and BM25 index stay in memory
+            index_documents: Also index chunks of documents attached to messages
+            windowed_min_chars: Sessions with more text than this (messages plus document
+                text) are ranked block by block instead of through a cached index (None: never)
+            block_size: Messages embedded and scored at a time in windowed mode
         """
-        print(f"🔧 Loading embedding model: {model_name}")
+        logger.info("🔧 Loading embedding model: %s", model_name)
         self.model = SentenceTransformer(model_name)
-        print("✅ Embedding model loaded successfully")
+        logger.info("✅ Embedding model loaded successfully")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.index_documents = index_documents
+        self.session_indexes = SessionIndexCache(self.dim, session_cache_size, index_documents)
+        self.windowed_min_chars = windowed_min_chars
+        self.block_size = block_size
+        # Optional persistent EmbeddingStore, filled by the background precompute worker
+        self.embedding_store = None
     
     def encode_messages(self, messages: List[str]) -> np.ndarray:
         """
@@ -38,6 +75,90 @@ class SemanticSearchEngine:
         embeddings = self.model.encode(messages, convert_to_tensor=False)
         return np.array(embeddings)
     
+    def encode_normalized(self, messages: List[str]) -> np.ndarray:
+        """Encode messages into unit-norm float32 embeddings (dot product = cosine)"""
+        embeddings = self.encode_messages(messages).astype(np.float32).reshape(len(messages), -1)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+    
+    def encode_for_index(self, texts: List[str]) -> np.ndarray:
+        """Unit-norm embeddings for index rows, served from the embedding store when cached"""
+        if self.embedding_store is None:
+            return self.encode_normalized(texts)
+        return self.embedding_store.encode_cached(texts, self.encode_normalized)
+    
+    @staticmethod
+    def _valid_messages(past_messages: List[Dict]) -> List[Dict]:
+        # Filter only user and bot messages (exclude system messages if any)
+        return [
+            msg for msg in past_messages 
+            if msg.get('message') and msg.get('sender') in ['user', 'bot']
+        ]
+    
+    def _windowed(self, valid_messages: List[Dict]) -> bool:
+        """Whether a session is too large to keep a cached index for (ranked block by block instead)"""
+        return (self.windowed_min_chars is not None
+                and sum(message_chars(msg) for msg in valid_messages) > self.windowed_min_chars)
+    
+    def warm_session(self, session_id: str, messages: List[Dict]) -> int:
+        """
+        Bring the cached index of a session up to date ahead of the next query.
+        
+        Returns:
+            Number of rows embedded and indexed
+        """
+        valid_messages = self._valid_messages(messages)
+        if not valid_messages or self._windowed(valid_messages):
+            return 0
+        index = self.session_indexes.get(str(session_id))
+        with index.lock:
+            return index.sync(valid_messages, self.encode_for_index)
+    
+    def append_to_session(self, session_id: str, new_messages: List[Dict]) -> int:
+        """
+        Index just-saved messages of a session given only those messages (the
+        append-only save path has no full session to hand). If the session is
+        not cached, the embeddings are only put in the embedding store, so
+        the sync on the next query finds them.
+
+        Returns:
+            Number of rows embedded and indexed
+        """
+        valid_messages = self._valid_messages(new_messages)
+        if not valid_messages:
+            return 0
+        index = self.session_indexes.peek(str(session_id))
+        if index is not None:
+            with index.lock:
+                if index.message_count:
+                    return index.append(valid_messages, self.encode_for_index)
+        if self.embedding_store is None:
+            return 0
+        texts = []
+        for msg in valid_messages:
+            texts.append(msg['message'])
+            extracted_text = (msg.get('fileMetadata') or {}).get('extractedText')
+            if self.index_documents and extracted_text:
+                texts.extend(chunk_text(extracted_text))
+        self.encode_for_index(texts)
+        return len(texts)
+
+    def precompute_document(self, text: str) -> int:
+        """
+        Embed the chunks of an uploaded document into the embedding store, so
+        indexing the message that later carries it finds the vectors cached.
+        
+        Returns:
+            Number of chunks
+        """
+        if self.embedding_store is None or not self.index_documents:
+            return 0
+        chunks = chunk_text(text)
+        if chunks:
+            self.encode_for_index(chunks)
+        return len(chunks)
+    
     def compute_similarity(self, query_embedding: np.ndarray, message_embeddings: np.ndarray) -> np.ndarray:
         """
         Compute cosine similarity between query and message embeddings.
@@ -61,7 +182,11 @@ class SemanticSearchEngine:
         current_message: str, 
         past_messages: List[Dict], 
         top_n: int = 5,
-        recency_weight: float = 0.3
+        recency_weight: float = 0.3,
+        session_id: Optional[str] = None,
+        fusion: Optional[str] = None,
+        pipeline: Optional[RankingPipeline] = None,
+        query_embedding: Optional[np.ndarray] = None
     ) -> List[Dict]:
         """
         Retrieve top N relevant messages based on semantic similarity.
@@ -70,50 +195,144 @@ class SemanticSearchEngine:
             current_message: The current user message
             past_messages: List of past message dictionaries with 'sender', 'message', 'timestamp'
             top_n: Number of relevant messages to retrieve
-            recency_weight: Weight for recency score (0-1), higher means more recent messages preferred
+            recency_weight: Weight for recency score (0-1), higher means more recent messages preferred;
+                only used when no pipeline is given
+            session_id: If given, reuse (and incrementally update) the cached index of this session
+            fusion: "rrf" to fuse the semantic ranking with BM25 by reciprocal rank fusion;
+                None ranks by the pipeline score only
+            pipeline: Scorers and MMR/dedupe selection; defaults to semantic similarity
+                blended with timestamp-decay recency by recency_weight
+            query_embedding: Unit-norm embedding of current_message if already computed
+                (e.g. one encode call for a whole batch of queries)
             
         Returns:
-            List of top N relevant messages with similarity scores
+            List of top N relevant messages (and document chunks) with similarity scores
         """
         if not past_messages or len(past_messages) == 0:
             return []
         
-        # Filter only user and bot messages (exclude system messages if any)
-        valid_messages = [
-            msg for msg in past_messages 
-            if msg.get('message') and msg.get('sender') in ['user', 'bot']
-        ]
+        valid_messages = self._valid_messages(past_messages)
         
         if not valid_messages:
             return []
         
-        # Encode current message
-        current_embedding = self.encode_messages([current_message])
+        if pipeline is None:
+            pipeline = RankingPipeline.default(recency_weight)
         
-        # Encode past messages
-        past_message_texts = [msg['message'] for msg in valid_messages]
-        past_embeddings = self.encode_messages(past_message_texts)
+        if self._windowed(valid_messages):
+            if session_id:
+                self.session_indexes.discard(str(session_id))
+            if query_embedding is None:
+                with timed("embedding"):
+                    query_embedding = self.encode_normalized([current_message])[0]
+            return self._windowed_relevant_messages(valid_messages, query_embedding, top_n, pipeline)
         
-        # Compute semantic similarity
-        similarities = self.compute_similarity(current_embedding, past_embeddings)
+        if session_id:
+            index = self.session_indexes.get(str(session_id))
+        else:
+            index = SessionIndex(self.dim, self.index_documents)
         
-        # Add recency score (normalize by position, most recent = 1.0)
-        recency_scores = np.linspace(0, 1, len(valid_messages))
+        with index.lock:
+            with timed("embedding"):
+                # Encode current message, then only messages the index has not seen
+                if query_embedding is None:
+                    query_embedding = self.encode_normalized([current_message])[0]
+                current_embedding = query_embedding
+                index.sync(valid_messages, self.encode_for_index)
+            
+            # Compute semantic similarity
+            with timed("similarity"):
+                similarities = index.embeddings @ current_embedding
+            
+            # Combined score: weighted sum of the pipeline's scorers over the feature array
+            ranking_context = RankingContext(similarities, index.features, index.message_count)
+            combined_scores = pipeline.score(ranking_context)
+            
+            lexical_scores = {}
+            final_scores = combined_scores
+            if fusion == "rrf":
+                with timed("lexical"):
+                    lexical_ranking = index.lexical.search(current_message, self.FUSION_CANDIDATES)
+                lexical_scores = dict(lexical_ranking)
+                n_candidates = min(self.FUSION_CANDIDATES, index.size)
+                semantic_ranking = np.argpartition(-combined_scores, n_candidates - 1)[:n_candidates]
+                semantic_ranking = semantic_ranking[np.argsort(-combined_scores[semantic_ranking])]
+                fused = reciprocal_rank_fusion(
+                    [semantic_ranking.tolist(), [doc_id for doc_id, _ in lexical_ranking]], k=self.RRF_K
+                )
+                final_scores = np.zeros(index.size)
+                final_scores[list(fused)] = list(fused.values())
+            
+            # Get top N indices (MMR / de-duplicated if the pipeline asks for it)
+            top_indices = pipeline.select(final_scores, index.embeddings, top_n)
+            if fusion == "rrf":
+                top_indices = [idx for idx in top_indices if final_scores[idx] > 0]
+            
+            # Build result with scores
+            relevant_messages = []
+            for idx in top_indices:
+                msg = index.items[idx].copy()
+                msg['similarity_score'] = float(similarities[idx])
+                msg['combined_score'] = float(final_scores[idx])
+                if fusion == "rrf":
+                    msg['lexical_score'] = float(lexical_scores.get(idx, 0.0))
+                relevant_messages.append(msg)
         
-        # Combined score: semantic similarity + recency
-        combined_scores = (1 - recency_weight) * similarities + recency_weight * recency_scores
+        return relevant_messages
+    
+    def _windowed_relevant_messages(self, valid_messages: List[Dict], query_embedding: np.ndarray,
+                                    top_n: int, pipeline: RankingPipeline) -> List[Dict]:
+        """
+        Rank a very long session block by block, without building or caching
+        its whole index. Each block of messages (and their document chunks) is
+        embedded and scored, and only a running top-k heap of candidates, with
+        their embeddings, survives to the MMR/dedupe selection. The heap holds
+        the same pool `pipeline.select` would take from the full ranking.
+        Lexical fusion is skipped: BM25 needs statistics over the whole session.
+        """
+        n_keep = max(top_n * 4, pipeline.candidate_pool)
+        message_count = len(valid_messages)
+        now = time.time()
+        heap = []  # (score, row, item, similarity, embedding); row breaks ties
+        row = 0
+        for start in range(0, message_count, self.block_size):
+            items, features = [], []
+            for position in range(start, min(start + self.block_size, message_count)):
+                for item, feature in message_rows(valid_messages[position], position, self.index_documents):
+                    items.append(item)
+                    features.append(feature)
+            with timed("embedding"):
+                embeddings = np.asarray(self.encode_for_index([item['message'] for item in items]),
+                                        dtype=np.float32).reshape(len(items), self.dim)
+            with timed("similarity"):
+                similarities = embeddings @ query_embedding
+                scores = pipeline.score(RankingContext(
+                    similarities, np.array(features, dtype=FEATURE_DTYPE), message_count, now
+                ))
+            block_top = np.argpartition(-scores, min(n_keep, len(scores)) - 1)[:n_keep]
+            for i in block_top:
+                entry = (float(scores[i]), -(row + int(i)), items[i], float(similarities[i]), embeddings[i].copy())
+                if len(heap) < n_keep:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+            row += len(items)
         
-        # Get top N indices
-        top_indices = np.argsort(combined_scores)[::-1][:top_n]
+        if not heap:
+            return []
+        candidates = sorted(heap, key=lambda entry: entry[:2], reverse=True)
+        relevance = np.array([entry[0] for entry in candidates])
+        selected = pipeline.select(relevance, np.stack([entry[4] for entry in candidates]), top_n)
         
-        # Build result with scores
         relevant_messages = []
-        for idx in top_indices:
-            msg = valid_messages[idx].copy()
-            msg['similarity_score'] = float(similarities[idx])
-            msg['combined_score'] = float(combined_scores[idx])
+        for idx in selected:
+            score, _, item, similarity, _ = candidates[idx]
+            msg = item.copy()
+            msg['similarity_score'] = similarity
+            msg['combined_score'] = score
             relevant_messages.append(msg)
-        
+        logger.debug("🪟 Windowed retrieval over %d messages (%d rows) in blocks of %d",
+                     message_count, row, self.block_size)
         return relevant_messages
     
     def build_context_prompt(
@@ -141,7 +360,10 @@ class SemanticSearchEngine:
         current_length = len(context_parts[0])
         
         for msg in relevant_messages:
-            sender = "User" if msg['sender'] == 'user' else "Assistant"
+            if msg.get('source') == 'document':
+                sender = f"Document ({msg.get('fileName') or 'attachment'})"
+            else:
+                sender = "User" if msg['sender'] == 'user' else "Assistant"
             message_text = f"{sender}: {msg['message']}\n"
             
             if current_length + len(message_text) > max_context_length:
@@ -155,51 +377,154 @@ class SemanticSearchEngine:
         return "\n".join(context_parts)
 
 
-def fetch_session_messages(session_id: str, user_id: str, token: str, node_server_url: str) -> List[Dict]:
+def fetch_user_sessions(token: str, node_server_url: str, timeout: float = 5,
+                        headers: Optional[Dict[str, str]] = None) -> List[Dict]:
     """
-    Fetch messages from a chat session via Node.js server.
+    Fetch all chat sessions of the token's user via Node.js server.
     
     Args:
-        session_id: The chat session ID
-        user_id: The user ID
         token: JWT authentication token
         node_server_url: URL of the Node.js server
+        timeout: Request timeout in seconds
+        headers: Auth headers to send instead of the bearer token (e.g. a service assertion)
         
     Returns:
-        List of message dictionaries
+        List of session dictionaries (with messages); empty on failure
     """
     try:
-        # Get all sessions for the user
         response = requests.get(
             f"{node_server_url}/api/conversation",
-            headers={
+            headers=headers or {
                 "Authorization": f"Bearer {token}",
                 "Content-Type": "application/json"
             },
-            timeout=5
+            timeout=timeout
         )
         
         if not response.ok:
-            print(f"⚠️ Failed to fetch sessions: {response.status_code}")
+            logger.warning("⚠️ Failed to fetch sessions: %s", response.status_code)
             return []
         
-        sessions = response.json()
+        return response.json()
         
-        # Find the specific session
-        target_session = None
-        for session in sessions:
-            if str(session.get('_id')) == str(session_id):
-                target_session = session
-                break
+    except Exception as e:
+        logger.error("❌ Error fetching sessions: %s", e)
+        return []
+
+
+def _stream_session_messages(stream, session_id: str, found: Optional[set] = None) -> Iterator[Dict]:
+    """
+    Messages of one session from a GET /api/conversation body, parsed
+    incrementally: other sessions are walked past without being built into
+    objects. Relies on `_id` preceding `messages` in each session, which is
+    how MongoDB documents serialize. The session id is added to `found` once
+    the session is seen, so callers can tell a missing session from an empty one.
+    """
+    current_id = None
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'item.messages.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'item._id':
+            current_id = str(value)
+            if found is not None and current_id == session_id:
+                found.add(current_id)
+        elif prefix == 'item' and event == 'start_map':
+            current_id = None
+        elif current_id == session_id:
+            if prefix == 'item.messages.item' and event == 'start_map':
+                builder = ObjectBuilder()
+                builder.event(event, value)
+            elif prefix == 'item.messages' and event == 'end_array':
+                return
+
+
+def _newest_within(messages: Iterable[Dict], max_chars: Optional[int]) -> Tuple[List[Dict], int]:
+    """
+    The newest messages whose text (see message_chars) fits in max_chars, and
+    the number of messages seen. Document text past what gets chunked is cut.
+    """
+    window, window_chars, total = deque(), 0, 0
+    for msg in messages:
+        total += 1
+        file_metadata = msg.get('fileMetadata')
+        if file_metadata and file_metadata.get('extractedText'):
+            file_metadata['extractedText'] = file_metadata['extractedText'][:MAX_DOCUMENT_CHARS]
+        size = message_chars(msg)
+        window.append((msg, size))
+        window_chars += size
+        if max_chars is not None:
+            while window_chars > max_chars and len(window) > 1:
+                window_chars -= window.popleft()[1]
+    return [msg for msg, _ in window], total
+
+
+@traced("fetch_session_messages")
+def fetch_session_messages(session_id: str, user_id: str, token: str, node_server_url: str,
+                           headers: Optional[Dict[str, str]] = None,
+                           max_chars: Optional[int] = None, timeout: float = 5) -> List[Dict]:
+    """
+    Fetch messages from a chat session via Node.js server.
+    
+    With ijson installed the response is parsed as it streams in, so only the
+    target session's messages are ever built, and at most max_chars of them
+    are held. Without it the whole payload is parsed first, as before.
+    
+    Args:
+        session_id: The chat session ID
+        user_id: The user ID
+        token: JWT authentication token
+        node_server_url: URL of the Node.js server
+        headers: Auth headers to send instead of the bearer token
+        max_chars: Keep only the newest messages within this much text (None: all)
+        timeout: Request timeout in seconds
         
-        if not target_session:
-            print(f"⚠️ Session {session_id} not found")
-            return []
+    Returns:
+        List of message dictionaries
+    """
+    try:
+        if ijson is None:
+            # Get all sessions for the user, then find the specific session
+            sessions = fetch_user_sessions(token, node_server_url, timeout=timeout, headers=headers)
+            target_session = next(
+                (session for session in sessions if str(session.get('_id')) == str(session_id)), None
+            )
+            del sessions
+            if not target_session:
+                logger.warning("⚠️ Session %s not found", session_id)
+                return []
+            messages, total = _newest_within(target_session.get('messages', []), max_chars)
+        else:
+            with requests.get(
+                f"{node_server_url}/api/conversation",
+                headers=headers or {
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json"
+                },
+                timeout=timeout,
+                stream=True
+            ) as response:
+                if not response.ok:
+                    logger.warning("⚠️ Failed to fetch sessions: %s", response.status_code)
+                    return []
+                response.raw.decode_content = True
+                found = set()
+                messages, total = _newest_within(
+                    _stream_session_messages(response.raw, str(session_id), found), max_chars
+                )
+            if not found:
+                logger.warning("⚠️ Session %s not found", session_id)
+                return []
         
-        messages = target_session.get('messages', [])
-        print(f"📚 Retrieved {len(messages)} messages from session {session_id}")
+        if len(messages) < total:
+            logger.info("🪟 Session %s: kept newest %d of %d messages (%d char cap)",
+                        session_id, len(messages), total, max_chars)
+        logger.debug("📚 Retrieved %d messages from session %s", len(messages), session_id)
         return messages
         
     except Exception as e:
-        print(f"❌ Error fetching session messages: {e}")
-        return []
\ No newline at end of file
+        logger.error("❌ Error fetching session messages: %s", e)
+        return []
@@ -13,7 +13,8 @@ const app = express();
 
 // Middleware
 app.use(cors());
-app.use(express.json());
+// Batch saves carry the extracted text of every document in the batch
+app.use(express.json({ limit: process.env.JSON_BODY_LIMIT || "25mb" }));
 
 // Connect to MongoDB
 connectDB();
@@ -0,0 +1,205 @@
+"""
+Session Index Module for LawGPT
+Per-session cache of message and document-chunk embeddings plus a BM25 index,
+updated incrementally as a conversation grows.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from lexical_index import BM25Index
+from ranking import FEATURE_DTYPE, parse_timestamp
+
+# Attached documents are split into chunks small enough to fit the context prompt
+DOC_CHUNK_CHARS = 800
+DOC_CHUNK_OVERLAP = 100
+MAX_CHUNKS_PER_DOCUMENT = 64
+# chunk_text never reads past this many characters of a document
+MAX_DOCUMENT_CHARS = (MAX_CHUNKS_PER_DOCUMENT + 1) * DOC_CHUNK_CHARS
+
+
+def message_key(message: Dict, position: int) -> str:
+    """Stable identity of a message: its MongoDB _id, else its position"""
+    return str(message.get('_id') or position)
+
+
+def chunk_text(text: str, size: int = DOC_CHUNK_CHARS, overlap: int = DOC_CHUNK_OVERLAP,
+               max_chunks: int = MAX_CHUNKS_PER_DOCUMENT) -> List[str]:
+    """Split text into overlapping chunks, breaking on whitespace where possible"""
+    chunks = []
+    start, length = 0, len(text)
+    while start < length and len(chunks) < max_chunks:
+        end = min(length, start + size)
+        if end < length:
+            space = text.rfind(" ", start + size // 2, end)
+            if space > 0:
+                end = space
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        next_start = text.find(" ", end - overlap, end)
+        start = next_start + 1 if next_start > start else end
+    return chunks
+
+
+def message_chars(msg: Dict) -> int:
+    """Text a message contributes to an index: its own plus the part of its document that gets chunked"""
+    extracted_text = (msg.get('fileMetadata') or {}).get('extractedText') or ''
+    return len(msg.get('message') or '') + min(len(extracted_text), MAX_DOCUMENT_CHARS)
+
+
+def message_rows(msg: Dict, position: int, index_documents: bool = True) -> List[Tuple[Dict, tuple]]:
+    """
+    Index rows of one message: the message itself, then the chunks of its
+    attached document, each with its FEATURE_DTYPE record.
+    """
+    file_metadata = msg.get('fileMetadata') or {}
+    timestamp = parse_timestamp(msg.get('timestamp'))
+    is_user = msg.get('sender') == 'user'
+    rows = [(msg, (position, timestamp, is_user, bool(file_metadata), False))]
+
+    extracted_text = file_metadata.get('extractedText')
+    if index_documents and extracted_text:
+        for chunk in chunk_text(extracted_text):
+            rows.append(({
+                'sender': msg.get('sender'),
+                'message': chunk,
+                'timestamp': msg.get('timestamp'),
+                'source': 'document',
+                'fileName': file_metadata.get('fileName'),
+                'messageId': message_key(msg, position),
+            }, (position, timestamp, is_user, True, True)))
+    return rows
+
+
+class SessionIndex:
+    """
+    Rows are the session's user/bot messages in order, each followed by the
+    chunks of its attached document (if any). Per row we keep a unit-norm
+    embedding, the BM25 document, and a FEATURE_DTYPE record (position,
+    timestamp, sender, attachment flags) so ranking runs on whole arrays.
+
+    `sync` embeds and indexes only messages not seen before; if an earlier
+    message was edited or removed the index is rebuilt. Callers hold `lock`
+    across sync and scoring.
+    """
+
+    def __init__(self, dim: int, index_documents: bool = True):
+        self.dim = dim
+        self.index_documents = index_documents
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.message_keys: List[str] = []
+        self.message_texts: List[str] = []
+        self.items: List[Dict] = []
+        self.features = np.empty(0, dtype=FEATURE_DTYPE)
+        self.embeddings = np.empty((0, self.dim), dtype=np.float32)
+        self.lexical = BM25Index()
+
+    @property
+    def size(self) -> int:
+        return len(self.items)
+
+    @property
+    def message_count(self) -> int:
+        return len(self.message_keys)
+
+    def _is_prefix_of(self, messages: List[Dict]) -> bool:
+        if len(messages) < self.message_count:
+            return False
+        for i, (key, text) in enumerate(zip(self.message_keys, self.message_texts)):
+            if message_key(messages[i], i) != key or messages[i]['message'] != text:
+                return False
+        return True
+
+    def sync(self, messages: List[Dict], encode: Callable[[List[str]], np.ndarray]) -> int:
+        """
+        Bring the index up to date with the session's messages.
+
+        Args:
+            messages: Valid (user/bot, non-empty) messages in conversation order
+            encode: Function returning unit-norm float32 embeddings for a list of texts
+
+        Returns:
+            Number of rows added
+        """
+        if not self._is_prefix_of(messages):
+            self.reset()
+        return self._add(messages[self.message_count:], encode)
+
+    def append(self, messages: List[Dict], encode: Callable[[List[str]], np.ndarray]) -> int:
+        """
+        Add just-saved messages after everything indexed so far, without the
+        session's full message list. Messages already indexed are skipped. If
+        the session changed in other ways meanwhile, the next `sync` sees the
+        mismatch and rebuilds.
+
+        Returns:
+            Number of rows added
+        """
+        known = set(self.message_keys)
+        return self._add([msg for msg in messages if message_key(msg, -1) not in known], encode)
+
+    def _add(self, messages: List[Dict], encode: Callable[[List[str]], np.ndarray]) -> int:
+        new_items, new_features = [], []
+        for position, msg in enumerate(messages, start=self.message_count):
+            self.message_keys.append(message_key(msg, position))
+            self.message_texts.append(msg['message'])
+            for item, feature in message_rows(msg, position, self.index_documents):
+                new_items.append(item)
+                new_features.append(feature)
+
+        if not new_items:
+            return 0
+
+        texts = [item['message'] for item in new_items]
+        embeddings = np.asarray(encode(texts), dtype=np.float32).reshape(len(texts), self.dim)
+        self.embeddings = np.concatenate([self.embeddings, embeddings])
+        self.features = np.concatenate([self.features, np.array(new_features, dtype=FEATURE_DTYPE)])
+        for text in texts:
+            self.lexical.add(text)
+        self.items.extend(new_items)
+        return len(new_items)
+
+
+class SessionIndexCache:
+    """LRU of SessionIndex objects keyed by session id"""
+
+    def __init__(self, dim: int, max_sessions: int = 128, index_documents: bool = True):
+        self.dim = dim
+        self.max_sessions = max_sessions
+        self.index_documents = index_documents
+        self._indexes: "OrderedDict[str, SessionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionIndex:
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is None:
+                index = SessionIndex(self.dim, self.index_documents)
+                self._indexes[session_id] = index
+                while len(self._indexes) > self.max_sessions:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(session_id)
+            return index
+
+    def discard(self, session_id: str):
+        """Drop a session's cached index (e.g. one grown too large to keep in memory)"""
+        with self._lock:
+            self._indexes.pop(session_id, None)
+
+    def peek(self, session_id: str) -> Optional[SessionIndex]:
+        """Cached index of a session, without creating one or touching LRU order"""
+        with self._lock:
+            return self._indexes.get(session_id)
+
+    def __len__(self):
+        return len(self._indexes)
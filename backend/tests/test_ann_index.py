@@ -0,0 +1,163 @@
+"""History index persistence: side-file reloads, recovery from partial writes, and forgetting messages"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ann_index import UserHistoryIndex
+
+DIM = 16
+
+
+def entries(session_id, start, count):
+    return [
+        {"messageId": f"m{i}", "sessionId": session_id, "sender": "user",
+         "message": f"message {i}", "timestamp": None}
+        for i in range(start, start + count)
+    ]
+
+
+def vectors(start, count):
+    return np.random.default_rng(start).standard_normal((count, DIM)).astype(np.float32)
+
+
+def open_index(directory, quantization="none"):
+    return UserHistoryIndex(str(directory), DIM, nprobe=4, quantization=quantization)
+
+
+def top_id(index, query):
+    return index.search(query, k=1)[0]["messageId"]
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_reload_replays_side_file(tmp_path, quantization):
+    index = open_index(tmp_path, quantization)
+    index.add(entries("s1", 0, 40), vectors(0, 40))
+    index.flush(force=True)
+    saved = os.path.getmtime(index.index_path)
+    # Small additions go to the side file only
+    index.add(entries("s1", 40, 5), vectors(40, 5))
+    index.flush(force=True)
+    assert os.path.getmtime(index.index_path) == saved
+
+    reloaded = open_index(tmp_path, quantization)
+    assert reloaded.index.count == 45
+    assert top_id(reloaded, vectors(40, 5)[2]) == "m42"
+    assert "m44" in reloaded.message_ids
+
+
+def test_compacts_once_side_file_grows(tmp_path):
+    index = open_index(tmp_path)
+    index.add(entries("s1", 0, 40), vectors(0, 40))
+    index.flush(force=True)
+    index.add(entries("s1", 40, 20), vectors(40, 20))
+    index.flush(force=True)
+    assert index.saved_count == 60
+    assert os.path.getsize(index.pending.path) == 8
+
+
+def test_reload_with_metadata_behind_index(tmp_path):
+    index = open_index(tmp_path)
+    index.add(entries("s1", 0, 10), vectors(0, 10))
+    index.flush(force=True)
+    with open(index.meta_path, "rb") as meta_file:
+        lines = meta_file.readlines()
+    with open(index.meta_path, "wb") as meta_file:
+        meta_file.writelines(lines[:7])
+
+    reloaded = open_index(tmp_path)
+    assert reloaded.index.count == 7
+    assert sorted(r["messageId"] for r in reloaded.search(vectors(0, 10)[9], k=10)) == [f"m{i}" for i in range(7)]
+    # The truncation was saved, so a further add lines up with its metadata
+    reloaded.add(entries("s1", 100, 1), vectors(100, 1))
+    reloaded.flush(force=True)
+    assert top_id(open_index(tmp_path), vectors(100, 1)[0]) == "m100"
+
+
+def test_reload_drops_torn_side_file_rows(tmp_path):
+    index = open_index(tmp_path)
+    index.add(entries("s1", 0, 40), vectors(0, 40))
+    index.flush(force=True)
+    index.add(entries("s1", 40, 3), vectors(40, 3))
+    # A crash after the vector was appended but before its metadata line was
+    with open(index.pending.path, "ab") as pending_file:
+        pending_file.write(vectors(50, 1).tobytes() + b"\x00\x01")
+
+    reloaded = open_index(tmp_path)
+    assert reloaded.index.count == 43
+    reloaded.add(entries("s1", 60, 1), vectors(60, 1))
+    assert top_id(open_index(tmp_path), vectors(60, 1)[0]) == "m60"
+
+
+def test_forget_session_hides_and_scrubs(tmp_path):
+    index = open_index(tmp_path)
+    index.add(entries("s1", 0, 5) + entries("s2", 5, 5), vectors(0, 10))
+    index.flush(force=True)
+    assert index.forget_session("s1") == 5
+    results = index.search(vectors(0, 10)[0], k=10)
+    assert {r["sessionId"] for r in results} == {"s2"}
+    assert len(results) == 5
+    with open(index.meta_path, encoding="utf-8") as meta_file:
+        assert '"s1"' not in meta_file.read()
+
+    index.flush(force=True)
+    reloaded = open_index(tmp_path)
+    assert {r["sessionId"] for r in reloaded.search(vectors(0, 10)[0], k=10)} == {"s2"}
+
+
+def test_forget_removed_allows_reindexing_the_edit(tmp_path):
+    index = open_index(tmp_path)
+    index.add(entries("s1", 0, 4), vectors(0, 4))
+    # m1 was edited and everything after it removed
+    remaining = [{"_id": "m0", "message": "message 0"}, {"_id": "m1", "message": "edited"}]
+    assert index.forget_removed("s1", remaining) == 3
+    assert index.message_ids == {"m0"}
+
+    edited = [dict(entries("s1", 1, 1)[0], message="edited")]
+    assert index.add(edited, vectors(70, 1)) == 1
+    results = index.search(vectors(70, 1)[0], k=10)
+    assert [r["messageId"] for r in results] == ["m1", "m0"]
+    assert results[0]["message"] == "edited"
+    with open(index.meta_path, encoding="utf-8") as meta_file:
+        assert [json.loads(line).get("messageId") for line in meta_file] == ["m0", None, None, None, "m1"]
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_compaction_drops_forgotten_rows(tmp_path, quantization):
+    index = open_index(tmp_path, quantization)
+    index.add(entries("s1", 0, 30) + entries("s2", 30, 10), vectors(0, 40))
+    index.flush(force=True)
+    assert index.forget_session("s1") == 30
+    index.flush(force=True)
+    assert index.index.count == 10
+    assert index.forgotten == set()
+
+    reloaded = open_index(tmp_path, quantization)
+    assert reloaded.index.count == 10
+    assert reloaded.forgotten == set()
+    with open(reloaded.meta_path, encoding="utf-8") as meta_file:
+        assert len(meta_file.readlines()) == 10
+    assert top_id(reloaded, vectors(0, 40)[35]) == "m35"
+    # Rows added after the renumbering line up with their metadata
+    reloaded.add(entries("s3", 100, 1), vectors(100, 1))
+    assert top_id(open_index(tmp_path, quantization), vectors(100, 1)[0]) == "m100"
+
+
+def test_interrupted_compaction_is_finished_on_load(tmp_path, monkeypatch):
+    index = open_index(tmp_path, "int8")
+    index.add(entries("s1", 0, 5) + entries("s2", 5, 5), vectors(0, 10))
+    index.flush(force=True)
+    index.forget_session("s1")
+    # A crash once every new file was written, before any was moved into place
+    monkeypatch.setattr(UserHistoryIndex, "_finish_compaction", lambda self: None)
+    index.flush(force=True)
+    monkeypatch.undo()
+    assert os.path.exists(index.compaction_path)
+
+    reloaded = open_index(tmp_path, "int8")
+    assert reloaded.index.count == 5
+    assert not os.path.exists(reloaded.compaction_path)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".compact")]
+    assert top_id(reloaded, vectors(0, 10)[7]) == "m7"
@@ -0,0 +1,98 @@
+"""Circuit breaker trip, recovery and probe accounting, directly and through the ModelRouter"""
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from model_router import ModelRouter, NoHealthyReplica
+
+
+def tripped_breaker(now=0.0):
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=10.0)
+    for _ in range(2):
+        breaker.on_dispatch(now)
+        breaker.record_failure(now)
+    return breaker
+
+
+def test_trips_after_consecutive_failures():
+    breaker = tripped_breaker()
+    assert breaker.state == OPEN
+    assert breaker.last_trip_reason == "failures"
+    assert not breaker.can_attempt(5.0)
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure(0.0)
+    breaker.record_success(0.1, 0.0)
+    breaker.record_failure(0.0)
+    assert breaker.state == CLOSED
+
+
+def test_trips_on_latency_slo_breaches():
+    breaker = CircuitBreaker(latency_slo=1.0, slo_breach_threshold=3)
+    for _ in range(3):
+        breaker.record_success(2.0, 0.0)
+    assert breaker.state == OPEN
+    assert breaker.last_trip_reason == "latency_slo"
+
+
+def test_probe_success_closes():
+    breaker = tripped_breaker()
+    probe = breaker.on_dispatch(10.0)
+    assert breaker.state == HALF_OPEN and probe is not None
+    assert not breaker.can_attempt(10.0)  # single probe slot taken
+    breaker.record_success(0.1, 10.5, probe)
+    assert breaker.state == CLOSED
+    assert breaker.trips == 0
+
+
+def test_probe_failure_reopens_with_backoff():
+    breaker = tripped_breaker()
+    probe = breaker.on_dispatch(10.0)
+    breaker.record_failure(10.5, probe)
+    assert breaker.state == OPEN
+    assert breaker.last_trip_reason == "probe_failed"
+    assert breaker.opened_until == pytest.approx(30.5)  # 10s doubled to 20s
+
+
+def test_late_success_from_before_trip_does_not_close():
+    breaker = tripped_breaker()
+    # Dispatched while closed, finishes after the breaker went half-open
+    breaker.record_success(0.1, 11.0, probe=None)
+    assert breaker.state == HALF_OPEN
+    assert breaker.can_attempt(11.0)
+
+
+def test_probe_from_earlier_half_open_period_is_ignored():
+    breaker = tripped_breaker()
+    stale = breaker.on_dispatch(10.0)
+    probe = breaker.on_dispatch(10.0) if breaker.can_attempt(10.0) else None
+    assert probe is None
+    breaker.record_failure(10.0, stale)  # re-open: 20s
+    assert breaker.state == OPEN
+    current = breaker.on_dispatch(30.0)
+    breaker.record_success(0.1, 30.1, stale)
+    assert breaker.state == HALF_OPEN
+    breaker.record_success(0.1, 30.2, current)
+    assert breaker.state == CLOSED
+
+
+def test_router_skips_open_replica_and_recovers(monkeypatch):
+    clock = {"now": 100.0}
+    monkeypatch.setattr("model_router.time.monotonic", lambda: clock["now"])
+    router = ModelRouter({"M": ["http://a", "http://b"]}, "M", failure_threshold=1, open_seconds=5.0)
+
+    def fail(lease):
+        lease.mark_failed()
+        return lease.url
+
+    assert router.execute("M", fail) in ("http://a", "http://b")
+    assert router.execute("M", fail) in ("http://a", "http://b")
+    with pytest.raises(NoHealthyReplica):
+        router.execute("M", lambda lease: lease.url)
+
+    clock["now"] += 5.0
+    assert router.execute("M", lambda lease: lease.url) in ("http://a", "http://b")
+    states = [r["breaker"]["state"] for r in router.snapshot()["M"]["replicas"]]
+    assert sorted(states) == [CLOSED, HALF_OPEN]
@@ -0,0 +1,127 @@
+"""Conversation writer: coalescing, per-turn results, failure fan-out and idempotent retries"""
+
+import threading
+
+import pytest
+import requests
+
+import conversation_writer
+from conversation_writer import ConversationWriter, SaveError
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._payload = payload or {}
+
+    def json(self):
+        return self._payload
+
+
+class FakeNode:
+    """Stands in for requests.post; `replies` are responses or exceptions, used in order"""
+
+    def __init__(self, replies=None):
+        self.replies = list(replies or [])
+        self.requests = []
+        self.gate = None
+
+    def saved(self, appends):
+        return FakeResponse(200, {"results": [
+            {"sessionId": "s1", "title": "t", "created": False, "messageIds": [turn["turnId"]], "timestamp": None}
+            for turn in appends
+        ]})
+
+    def __call__(self, url, json, headers, timeout):
+        self.requests.append(json["appends"])
+        if self.gate is not None:
+            self.gate.wait(2.0)
+        reply = self.replies.pop(0) if self.replies else self.saved(json["appends"])
+        if isinstance(reply, Exception):
+            raise reply
+        return reply(json["appends"]) if callable(reply) else reply
+
+
+@pytest.fixture
+def node(monkeypatch):
+    fake = FakeNode()
+    monkeypatch.setattr(conversation_writer.requests, "post", fake)
+    return fake
+
+
+def writer(**kwargs):
+    # Linger so turns submitted back to back go out in one request
+    kwargs.setdefault("linger", 0.05)
+    kwargs.setdefault("retry_delay", 0.0)
+    return ConversationWriter("http://node", lambda user_id, token: {}, **kwargs)
+
+
+def turn(text):
+    return {"userId": "u1", "sessionId": "s1", "userMessage": text, "botMessage": "reply"}
+
+
+def test_turns_queued_behind_a_write_are_coalesced(node):
+    node.gate = threading.Event()
+    w = writer()
+    first = w.submit("u1", "tok", turn("a"))
+    while not node.requests:
+        pass
+    rest = [w.submit("u1", "tok", turn(text)) for text in "bcd"]
+    node.gate.set()
+    assert first.result(2.0)["sessionId"] == "s1"
+    assert all(future.result(2.0) for future in rest)
+    assert [[t["userMessage"] for t in appends] for appends in node.requests] == [["a"], ["b", "c", "d"]]
+
+
+def test_connection_failure_fails_every_turn_in_the_batch(node):
+    error = requests.exceptions.ConnectionError("refused")
+    node.replies = [error, error]
+    w = writer(retries=1)
+    with pytest.raises(SaveError) as raised:
+        w.save("u1", "tok", [turn("a"), turn("b")])
+    assert "Failed to connect" in str(raised.value)
+    assert len(node.requests) == 2
+    # The user's queue keeps draining after a failed batch
+    assert w.save("u1", "tok", [turn("c")])[0]["sessionId"] == "s1"
+
+
+def test_rejected_turn_fails_alone(node):
+    node.replies = [lambda appends: FakeResponse(200, {"results": [
+        {"sessionId": "s1", "messageIds": ["m1"]},
+        {"error": "Session not found", "status": 404},
+    ]})]
+    w = writer()
+    futures = [w.submit("u1", "tok", turn(text)) for text in "ab"]
+    assert futures[0].result(2.0)["messageIds"] == ["m1"]
+    with pytest.raises(SaveError) as raised:
+        futures[1].result(2.0)
+    assert raised.value.status_code == 404
+
+
+def test_short_result_list_fails_the_whole_batch(node):
+    node.replies = [FakeResponse(200, {"results": [{"sessionId": "s1", "messageIds": []}]})]
+    w = writer(retries=0)
+    futures = [w.submit("u1", "tok", turn(text)) for text in "ab"]
+    for future in futures:
+        with pytest.raises(SaveError):
+            future.result(2.0)
+
+
+def test_retry_resends_the_same_turn_ids(node):
+    node.replies = [FakeResponse(500)]
+    w = writer(retries=1)
+    saved = w.save("u1", "tok", [turn("a"), turn("b")])
+    first, second = node.requests
+    assert [t["turnId"] for t in first] == [t["turnId"] for t in second]
+    assert len(set(t["turnId"] for t in first)) == 2
+    assert [result["messageIds"][0] for result in saved] == [t["turnId"] for t in first]
+
+
+def test_client_errors_are_not_retried(node):
+    node.replies = [FakeResponse(403)]
+    w = writer(retries=2)
+    with pytest.raises(SaveError) as raised:
+        w.save("u1", "tok", [turn("a")])
+    assert raised.value.status_code == 403
+    assert len(node.requests) == 1
@@ -0,0 +1,141 @@
+"""Fair scheduler: slot timeouts, fair ordering across users, lanes and shared capacity"""
+
+import threading
+import time
+
+import pytest
+
+from fair_scheduler import FairScheduler, RateLimited, SchedulerTimeout
+from model_router import ModelRouter
+
+
+def scheduler(capacities=None, **kwargs):
+    kwargs.setdefault("user_rate", 0)
+    return FairScheduler(capacities or {"M": 1}, **kwargs)
+
+
+class Holder:
+    """Holds a slot from another thread until released"""
+
+    def __init__(self, sched, user="holder", model="M"):
+        self.acquired = threading.Event()
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(sched, user, model), daemon=True)
+        self.thread.start()
+        assert self.acquired.wait(2.0)
+
+    def _run(self, sched, user, model):
+        with sched.slot(user, model, 10):
+            self.acquired.set()
+            self.release.wait(5.0)
+
+    def done(self):
+        self.release.set()
+        self.thread.join(2.0)
+
+
+def queue_calls(sched, calls, order):
+    """Start (user, prompt_chars, interactive) calls one by one, each queued before the next"""
+    threads = []
+    for user, prompt_chars, interactive in calls:
+        waiting = sum(q["waiting"]["interactive"] + q["waiting"]["batch"] for q in sched.snapshot().values())
+
+        def run(user=user, prompt_chars=prompt_chars, interactive=interactive):
+            with sched.slot(user, "M", prompt_chars, interactive=interactive):
+                order.append(user)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        threads.append(thread)
+        deadline = time.monotonic() + 2.0
+        while sum(q["waiting"]["interactive"] + q["waiting"]["batch"]
+                  for q in sched.snapshot().values()) == waiting:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+    return threads
+
+
+def test_times_out_waiting_for_a_slot():
+    sched = scheduler(max_wait=0.2)
+    holder = Holder(sched)
+    start = time.monotonic()
+    with pytest.raises(SchedulerTimeout):
+        with sched.slot("u1", "M", 10):
+            pass
+    assert 0.15 < time.monotonic() - start < 1.0
+    assert sched.snapshot()["M"]["waiting"] == {"interactive": 0, "batch": 0}
+    holder.done()
+    # The cancelled ticket does not take the freed slot
+    with sched.slot("u1", "M", 10):
+        assert sched.snapshot()["M"]["active"] == 1
+
+
+def test_timed_out_call_is_not_charged():
+    sched = scheduler(max_wait=0.1, user_rate=0.001, user_burst=1, model_limits={"M": (0.001, 2)})
+    holder = Holder(sched)
+    with pytest.raises(SchedulerTimeout):
+        with sched.slot("u1", "M", 10):
+            pass
+    # The fair-share tag is rolled back and the rate-limit tokens refunded
+    assert sched._queues["M"].user_finish["u1"] == 0.0
+    holder.done()
+    with sched.slot("u1", "M", 10):
+        pass
+
+
+def test_rate_wait_counts_against_max_wait():
+    sched = scheduler(max_wait=0.5, user_rate=1 / 0.3, user_burst=1)
+    holder = Holder(sched, user="u1")
+    start = time.monotonic()
+    with pytest.raises(SchedulerTimeout):
+        # ~0.3s pacing for a token, then only the remaining ~0.2s for a slot
+        with sched.slot("u1", "M", 10, wait_for_rate=True):
+            pass
+    assert time.monotonic() - start < 0.7
+    holder.done()
+
+
+def test_rate_limit_rejects_without_waiting():
+    sched = scheduler(user_rate=0.01, user_burst=1)
+    with sched.slot("u1", "M", 10):
+        pass
+    with pytest.raises(RateLimited):
+        with sched.slot("u1", "M", 10):
+            pass
+
+
+def test_heavy_user_does_not_delay_others():
+    sched = scheduler()
+    holder = Holder(sched)
+    order = []
+    threads = queue_calls(sched, [("heavy", 10, True)] * 4 + [("light", 10, True)], order)
+    holder.done()
+    for thread in threads:
+        thread.join(2.0)
+    assert order.index("light") <= 1
+
+
+def test_batch_lane_is_not_starved():
+    sched = scheduler(interactive_share=2)
+    holder = Holder(sched)
+    order = []
+    threads = queue_calls(sched, [("batch", 5000, False)] + [(f"chat{i}", 10, True) for i in range(4)], order)
+    holder.done()
+    for thread in threads:
+        thread.join(2.0)
+    assert order.index("batch") == 2
+
+
+def test_models_on_shared_replicas_share_capacity():
+    router = ModelRouter({"A": "http://gpu/generate", "B": "http://gpu/generate", "C": "http://other/generate"},
+                         default_model="A", max_concurrency=1)
+    assert router.capacity_groups() == {"A+B": 1, "C": 1}
+    sched = scheduler(router.capacity_groups(), resolve=router.resolve,
+                      capacity_key=router.capacity_group, max_wait=0.1)
+    holder = Holder(sched, model="A")
+    with pytest.raises(SchedulerTimeout):
+        with sched.slot("u1", "B", 10):
+            pass
+    with sched.slot("u1", "C", 10):
+        pass
+    holder.done()
@@ -0,0 +1,107 @@
+"""Persistent job queue: jobs survive a restart, interrupted jobs rerun, coalescing and backpressure"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from job_queue import PersistentJobQueue, QueueFull
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def recorder():
+    seen = []
+    done = threading.Event()
+
+    def handler(payload):
+        seen.append(payload)
+        done.set()
+    return seen, done, handler
+
+
+def test_pending_jobs_run_after_restart(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    queue = PersistentJobQueue(path, handlers={}, workers=0)
+    queue.enqueue("session", "session:a", {"n": 1})
+    queue.enqueue("session", "session:b", {"n": 2})
+    queue.stop()
+
+    seen, _, handler = recorder()
+    restarted = PersistentJobQueue(path, handlers={"session": handler}, workers=1)
+    wait_for(lambda: restarted.stats()["pending"] == 0 and len(seen) == 2)
+    restarted.stop()
+    assert seen == [{"n": 1}, {"n": 2}]
+
+
+def test_job_interrupted_while_running_is_retried(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    queue = PersistentJobQueue(path, handlers={}, workers=0)
+    queue.enqueue("session", "session:a", {"n": 1})
+    queue.stop()
+    # A worker claimed the job, then the process died
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE jobs SET status = 'running'")
+
+    seen, done, handler = recorder()
+    restarted = PersistentJobQueue(path, handlers={"session": handler}, workers=1)
+    assert done.wait(5.0)
+    restarted.stop()
+    assert seen == [{"n": 1}]
+
+
+def test_same_key_coalesces_to_latest_payload(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    queue = PersistentJobQueue(path, handlers={}, workers=0)
+    assert queue.enqueue("session", "session:a", {"n": 1})
+    assert not queue.enqueue("session", "session:a", {"n": 2})
+    assert queue.stats()["pending"] == 1
+    queue.stop()
+
+    seen, done, handler = recorder()
+    restarted = PersistentJobQueue(path, handlers={"session": handler}, workers=1)
+    assert done.wait(5.0)
+    restarted.stop()
+    assert seen == [{"n": 2}]
+
+
+def test_failed_job_is_parked_and_not_rerun_after_restart(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    attempts = []
+
+    def failing(payload):
+        attempts.append(payload)
+        raise RuntimeError("embedding backend down")
+
+    queue = PersistentJobQueue(path, handlers={"session": failing}, workers=1, max_attempts=2, retry_delay=0.01)
+    queue.enqueue("session", "session:a", {"n": 1})
+    wait_for(lambda: queue.stats()["failed"] == 1)
+    queue.stop()
+    assert len(attempts) == 2
+
+    restarted = PersistentJobQueue(path, handlers={"session": failing}, workers=1)
+    time.sleep(0.1)
+    restarted.stop()
+    assert len(attempts) == 2
+    assert restarted.stats()["failed"] == 1
+
+
+def test_backlog_limit_survives_restart(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    queue = PersistentJobQueue(path, handlers={}, workers=0, max_pending=2)
+    queue.enqueue("session", "session:a", {})
+    queue.enqueue("session", "session:b", {})
+    queue.stop()
+
+    restarted = PersistentJobQueue(path, handlers={}, workers=0, max_pending=2)
+    with pytest.raises(QueueFull):
+        restarted.enqueue("session", "session:c", {})
+    # Updating a queued key is still accepted
+    assert not restarted.enqueue("session", "session:a", {"n": 1})
+    restarted.stop()
@@ -0,0 +1,54 @@
+"""Session prefetch cache: expiry from fetch time, appends and the memory caps"""
+
+import pytest
+
+import prefetch_cache
+from prefetch_cache import SessionMessageCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(prefetch_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def message(i, text="x" * 10):
+    return {"_id": f"m{i}", "sender": "user", "message": text}
+
+
+def test_extend_does_not_refresh_expiry(clock):
+    cache = SessionMessageCache(ttl=10.0)
+    cache.put("u", "s", [message(0)])
+    clock[0] = 8.0
+    assert cache.extend("u", "s", [message(1)])
+    assert [m["_id"] for m in cache.get("u", "s")] == ["m0", "m1"]
+    clock[0] = 10.5
+    assert cache.get("u", "s") is None
+    assert not cache.extend("u", "s", [message(2)])
+
+
+def test_extend_is_copy_on_write(clock):
+    cache = SessionMessageCache(ttl=10.0)
+    cache.put("u", "s", [message(0)])
+    held = cache.get("u", "s")
+    cache.extend("u", "s", [message(1)])
+    assert len(held) == 1
+
+
+def test_oversized_session_is_dropped(clock):
+    cache = SessionMessageCache(ttl=10.0, max_session_chars=25)
+    cache.put("u", "s", [message(0), message(1)])
+    assert not cache.extend("u", "s", [message(2)])
+    assert cache.get("u", "s") is None
+    assert cache.stats() == {"sessions": 0, "chars": 0}
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = SessionMessageCache(ttl=10.0, max_sessions=2)
+    cache.put("u", "a", [message(0)])
+    cache.put("u", "b", [message(1)])
+    cache.get("u", "a")
+    cache.put("u", "c", [message(2)])
+    assert cache.get("u", "b") is None
+    assert cache.get("u", "a") is not None
@@ -307,6 +307,7 @@ const MessageInput = ({
   selectedModel, 
   onModelChange, 
   onFileUpload,
+  onTyping,
   activeConversationId
 }) => {
   const [message, setMessage] = useState("");
@@ -452,6 +453,7 @@ const MessageInput = ({
   const handleTextareaChange = (e) => {
     setMessage(e.target.value);
     adjustTextareaHeight();
+    onTyping?.();
   };
 
   const adjustTextareaHeight = () => {
@@ -28,6 +28,7 @@ const Chat = () => {
     handleFileUpload,
     toggleSidebar,
     getConversationLoadingState,
+    prefetchContext,
   } = useChatStore();
 
   const messagesEndRef = useRef(null);
@@ -52,6 +53,11 @@ const Chat = () => {
     previousConversationIdRef.current = activeConversationId;
   }, [conversations, activeConversationId, isActiveConversationTyping]);
 
+  // Warm the server-side context of the conversation being viewed
+  useEffect(() => {
+    prefetchContext(activeConversationId);
+  }, [activeConversationId, prefetchContext]);
+
   // Load conversations on component mount
   useEffect(() => {
     const { conversations } = useChatStore.getState();
@@ -162,6 +168,7 @@ const Chat = () => {
           selectedModel={selectedModel}
           onModelChange={setSelectedModel}
           onFileUpload={handleFileUpload}
+          onTyping={() => prefetchContext(activeConversationId)}
           activeConversationId={activeConversationId}
         />
       </div>
@@ -13,6 +13,41 @@ const fetchWithTimeout = (url, options = {}, timeout = 180000) => {
   ]);
 };
 
+// Context prefetch (session opened / user typing) at most this often per conversation;
+// the server keeps prefetched history for a few minutes
+const PREFETCH_INTERVAL_MS = 60000;
+const lastPrefetchAt = {};
+
+// Chat endpoints return only the saved turn (session id/title and new message ids),
+// not the whole session: fold it into the conversation already on screen
+const applySavedTurn = (conv, data, pendingUserMessageId, userFileMetadata = null) => ({
+  ...conv,
+  id: data.sessionId,
+  title: data.title || conv.title,
+  updatedAt: new Date(data.timestamp).getTime(),
+  messages: [
+    ...conv.messages.map((msg) =>
+      msg.id === pendingUserMessageId
+        ? {
+            ...msg,
+            id: data.messageIds.user || msg.id,
+            fileMetadata: userFileMetadata || msg.fileMetadata || null,
+          }
+        : msg
+    ),
+    {
+      id: data.messageIds.bot,
+      message: data.botReply,
+      isUser: false,
+      timestamp: new Date(data.timestamp).toLocaleTimeString([], {
+        hour: '2-digit',
+        minute: '2-digit',
+      }),
+      fileMetadata: null,
+    },
+  ],
+});
+
 const useChatStore = create(
   subscribeWithSelector((set, get) => ({
     // State
@@ -53,6 +88,26 @@ const useChatStore = create(
       return state.conversationLoadingStates[conversationId] || { isLoading: false, isTyping: false };
     },
 
+    // Ask the Flask server to fetch and index this conversation's history ahead of the
+    // next message, so sending it skips that work. Fire-and-forget, throttled.
+    prefetchContext: (conversationId) => {
+      const token = localStorage.getItem('token');
+      const now = Date.now();
+      if (!conversationId || !token || now - (lastPrefetchAt[conversationId] || 0) < PREFETCH_INTERVAL_MS) {
+        return;
+      }
+      lastPrefetchAt[conversationId] = now;
+
+      fetch('http://localhost:5001/api/chat/prefetch', {
+        method: 'POST',
+        headers: {
+          Authorization: `Bearer ${token}`,
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ sessionId: conversationId }),
+      }).catch((err) => console.debug('Context prefetch failed:', err));
+    },
+
     // NEW: Updated to accept pre-uploaded file metadata
     handleFileUpload: async (file, message, fileMetadata) => {
       const state = get();
@@ -124,26 +179,12 @@ const useChatStore = create(
           const data = await res.json();
           console.log('✅ Message with file sent successfully:', data);
           
-          const updatedSession = {
-            id: data.session._id,
-            title: data.session.title,
-            createdAt: new Date(data.session.createdAt).getTime(),
-            updatedAt: new Date(data.session.updatedAt).getTime(),
-            messages: data.session.messages.map((msg) => ({
-              id: msg._id || `${Date.now()}-${Math.random()}`,
-              message: msg.message,
-              isUser: msg.sender === 'user',
-              timestamp: new Date(msg.timestamp).toLocaleTimeString([], {
-                hour: '2-digit',
-                minute: '2-digit',
-              }),
-              fileMetadata: msg.fileMetadata || null
-            })),
-          };
-          
+          // Keep the full metadata (with extractedText) on the message for later edits
           set((state) => ({
             conversations: state.conversations.map((conv) =>
-              conv.id === state.activeConversationId ? updatedSession : conv
+              conv.id === state.activeConversationId
+                ? applySavedTurn(conv, data, optimisticUserMessage.id, fileMetadata)
+                : conv
             )
           }));
 
@@ -287,32 +328,14 @@ const useChatStore = create(
 
         const data = await res.json();
 
-        const newMessages = data.session.messages.map((msg) => ({
-          id: msg._id || `${Date.now()}-${Math.random()}`,
-          message: msg.message,
-          isUser: msg.sender === 'user',
-          timestamp: new Date(msg.timestamp).toLocaleTimeString([], {
-            hour: '2-digit',
-            minute: '2-digit',
-          }),
-          fileMetadata: msg.fileMetadata || null,
-        }));
-
         set((state) => ({
           conversations: state.conversations.map((conv) =>
-            conv.id === conversationId
-              ? {
-                  ...conv,
-                  messages: newMessages,
-                  title: data.session.title,
-                  updatedAt: new Date(data.session.updatedAt).getTime(),
-                }
-              : conv
+            conv.id === conversationId ? applySavedTurn(conv, data, userMessage.id) : conv
           )
         }));
 
-        if (data.session._id !== conversationId) {
-          set({ activeConversationId: data.session._id });
+        if (data.sessionId !== conversationId) {
+          set({ activeConversationId: data.sessionId });
         }
       } catch (err) {
         console.error('Error sending message:', err);
@@ -434,6 +457,12 @@ const useChatStore = create(
           throw new Error(`Failed to delete conversation: ${res.status} - ${errorText}`);
         }
 
+        // Drop the session from cross-session history search as well
+        fetch(`http://localhost:5001/api/search/history/sessions/${id}`, {
+          method: 'DELETE',
+          headers: { Authorization: `Bearer ${token}` },
+        }).catch((err) => console.debug('History index cleanup failed:', err));
+
         const remaining = state.conversations.filter((c) => c.id !== id);
         set({ conversations: remaining });
 
@@ -746,28 +775,12 @@ handleEditSubmit: async (messageId, editedText) => {
     const data = await chatRes.json();
     console.log('✅ Bot response received for edited message');
 
-    const updatedSession = {
-      id: data.session._id,
-      title: data.session.title,
-      createdAt: new Date(data.session.createdAt).getTime(),
-      updatedAt: new Date(data.session.updatedAt).getTime(),
-      messages: data.session.messages.map((msg) => ({
-        id: msg._id || `${Date.now()}-${Math.random()}`,
-        message: msg.message,
-        isUser: msg.sender === 'user',
-        timestamp: new Date(msg.timestamp).toLocaleTimeString([], {
-          hour: '2-digit',
-          minute: '2-digit',
-        }),
-        fileMetadata: msg.fileMetadata || null
-      })),
-    };
-
-    set({
-      conversations: state.conversations.map((conv) =>
-        conv.id === state.activeConversationId ? updatedSession : conv
+    // The edited user message is already in place; only the new bot reply is appended
+    set((current) => ({
+      conversations: current.conversations.map((conv) =>
+        conv.id === state.activeConversationId ? applySavedTurn(conv, data, null) : conv
       ),
-    });
+    }));
 
   } catch (err) {
     console.error('❌ Error in edit flow:', err);